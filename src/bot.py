@@ -3,18 +3,20 @@ Telegram机器人主控制器
 """
 
 import asyncio
-from typing import Optional
+import signal
+from typing import Awaitable, Callable, Iterable
 from loguru import logger
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, 
-    MessageHandler, filters, ContextTypes
+    MessageHandler, filters
 )
 
 from .config import Config
 from .data_manager import DataManager
 from .handlers import HandlerManager
+from .utils import event_loop
 
 
 class RuleBot:
@@ -23,28 +25,35 @@ class RuleBot:
     def __init__(self, config: Config, data_manager: DataManager):
         self.config = config
         self.data_manager = data_manager
-        self.app: Optional[Application] = None
-        self.handler_manager = None  # 延迟初始化
+        # 创建应用，处理器管理器依赖app实例，随之一并创建
+        # 并发处理不同用户的更新，并发上限和同一用户的顺序由 HandlerManager 控制
+        self.app = (
+            Application.builder()
+            .token(config.TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(True)
+            .build()
+        )
+        self.handler_manager = HandlerManager(config, data_manager, self.app)
     
     async def stop(self):
         """停止机器人"""
         logger.info("正在停止机器人...")
-        if self.handler_manager:
-            await self.handler_manager.stop()
-        if self.app:
+        await self.handler_manager.stop()
+        # 先停止轮询再停止应用，Application.stop 要求 Updater 已停止
+        if self.app.updater and self.app.updater.running:
+            await self.app.updater.stop()
+        if self.app.running:
             await self.app.stop()
-            await self.app.shutdown()
+        await self.app.shutdown()
         logger.info("机器人已停止")
 
-    def start(self):
-        """启动机器人"""
+    def start(self, background_jobs: Iterable[Callable[[], Awaitable[None]]] = ()):
+        """启动机器人
+        
+        background_jobs 为随机器人一起运行的后台协程函数（如内存监控），
+        在机器人的事件循环中作为任务运行，停止时一并取消
+        """
         try:
-            # 创建应用
-            self.app = Application.builder().token(self.config.TELEGRAM_BOT_TOKEN).build()
-            
-            # 初始化处理器管理器（需要app实例）
-            self.handler_manager = HandlerManager(self.config, self.data_manager, self.app)
-            
             # 注册处理器
             self._register_handlers()
             
@@ -52,24 +61,37 @@ class RuleBot:
             logger.info("机器人启动成功，开始轮询...")
             
             # 在新的事件循环中运行机器人
-            import asyncio
-            
             async def run_bot():
-                try:
-                    async with self.app:
+                # 收到 SIGINT/SIGTERM 时设置停止事件，按顺序停止轮询和应用
+                stop_event = asyncio.Event()
+                loop = asyncio.get_running_loop()
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    try:
+                        loop.add_signal_handler(sig, stop_event.set)
+                    except (NotImplementedError, RuntimeError):
+                        pass  # 不支持信号处理的平台（如Windows）保持默认行为
+                
+                jobs = []
+                async with self.app:
+                    try:
                         await self.handler_manager.start()  # 显式启动服务（如DNS Session）
                         await self.app.start()
                         await self.app.updater.start_polling(
                             allowed_updates=Update.ALL_TYPES,
                             drop_pending_updates=True  # 丢弃待处理的更新，避免发送旧消息
                         )
-                        # 保持运行
-                        await asyncio.Event().wait()
-                finally:
-                    await self.stop()
+                        jobs.extend(asyncio.create_task(job()) for job in background_jobs)
+                        # 保持运行，直到收到停止信号
+                        await stop_event.wait()
+                        logger.info("收到停止信号，正在关闭...")
+                    finally:
+                        for job in jobs:
+                            job.cancel()
+                        await asyncio.gather(*jobs, return_exceptions=True)
+                        await self.stop()
             
             # 使用新的事件循环运行
-            asyncio.run(run_bot())
+            event_loop.run(run_bot())
             
         except Exception as e:
             logger.error(f"机器人启动失败: {e}")
@@ -77,20 +99,27 @@ class RuleBot:
     
     def _register_handlers(self):
         """注册所有处理器"""
+        app = self.app
+        hm = self.handler_manager
+        
         # 命令处理器
-        self.app.add_handler(CommandHandler("start", self.handler_manager.start_command))
-        self.app.add_handler(CommandHandler("help", self.handler_manager.help_command))
-        self.app.add_handler(CommandHandler("query", self.handler_manager.query_command))
-        self.app.add_handler(CommandHandler("add", self.handler_manager.add_command))
-        self.app.add_handler(CommandHandler("delete", self.handler_manager.delete_command))
+        commands = (
+            ("start", hm.start_command),
+            ("help", hm.help_command),
+            ("query", hm.query_command),
+            ("add", hm.add_command),
+            ("delete", hm.delete_command),
+        )
+        for name, callback in commands:
+            app.add_handler(CommandHandler(name, callback))
         
         # 回调查询处理器
-        self.app.add_handler(CallbackQueryHandler(self.handler_manager.handle_callback))
+        app.add_handler(CallbackQueryHandler(hm.handle_callback))
         
         # 消息处理器（用于处理用户输入）
-        self.app.add_handler(MessageHandler(
+        app.add_handler(MessageHandler(
             filters.TEXT & ~filters.COMMAND, 
-            self.handler_manager.handle_message
+            hm.handle_message
         ))
         
         logger.info("所有处理器注册完成") 
\ No newline at end of file
@@ -3,7 +3,7 @@
 """
 
 import os
-from typing import Optional
+from typing import Optional, Tuple
 
 
 class Config:
@@ -40,20 +40,20 @@ class Config:
         self.GEOIP_URL = "https://raw.githubusercontent.com/Loyalsoldier/geoip/release/Country-without-asn.mmdb"
         self.GEOSITE_URL = "https://raw.githubusercontent.com/Loyalsoldier/v2ray-rules-dat/refs/heads/release/direct-list.txt"
         
-        # DoH服务器配置
+        # DoH服务器配置，使用 (名称, URL) 元组，查询时按固定顺序并发
         # 用于A记录查询（使用国内服务器获得准确的中国IP）
-        self.DOH_SERVERS = {
-            "alibaba": "https://dns.alidns.com/dns-query",
-            "tencent": "https://doh.pub/dns-query",
-            "cloudflare": "https://1.1.1.1/dns-query"
-        }
+        self.DOH_SERVERS: Tuple[Tuple[str, str], ...] = (
+            ("alibaba", "https://dns.alidns.com/dns-query"),
+            ("tencent", "https://doh.pub/dns-query"),
+            ("cloudflare", "https://1.1.1.1/dns-query"),
+        )
         
         # 用于NS记录查询（使用国际服务器避免审查）
-        self.NS_DOH_SERVERS = {
-            "cloudflare": "https://1.1.1.1/dns-query",
-            "google": "https://8.8.8.8/dns-query",
-            "quad9": "https://9.9.9.9/dns-query"
-        }
+        self.NS_DOH_SERVERS: Tuple[Tuple[str, str], ...] = (
+            ("cloudflare", "https://1.1.1.1/dns-query"),
+            ("google", "https://8.8.8.8/dns-query"),
+            ("quad9", "https://9.9.9.9/dns-query"),
+        )
         
         # 数据更新间隔（秒）
         self.DATA_UPDATE_INTERVAL = 6 * 60 * 60  # 6小时
@@ -4,17 +4,47 @@
 """
 
 import asyncio
-import aiohttp
-import schedule
-import threading
+import hashlib
+import json
+import mmap
+import os
+import sys
+import tempfile
 import time
-from datetime import datetime, timedelta
+import aiohttp
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Set, List
+from typing import Optional, Iterable, Dict, Any, Set, Tuple
 from loguru import logger
 
 from .config import Config
-from .utils.domain_utils import extract_domain, extract_second_level_domain
+
+# 下载分块大小（1MB），减少大文件下载时的分块次数和写入调用
+NETWORK_CHUNK = 1024 * 1024
+
+# 下载数据累积到该大小后再交给线程池写盘，避免阻塞事件循环
+DISK_FLUSH_SIZE = 4 * NETWORK_CHUNK
+
+# GeoSite查询结果缓存条目上限
+GEOSITE_LOOKUP_CACHE_SIZE = 4096
+
+
+@dataclass(frozen=True, slots=True)
+class _Paths:
+    """数据文件路径"""
+    root: Path
+    geoip: Path
+    geosite: Path
+    
+    @classmethod
+    def under(cls, root: Path) -> "_Paths":
+        """在数据根目录下组合各数据文件路径"""
+        return cls(
+            root=root,
+            geoip=root / "geoip" / "Country-without-asn.mmdb",
+            geosite=root / "geosite" / "direct-list.txt",
+        )
 
 
 class DataManager:
@@ -22,18 +52,19 @@ class DataManager:
     
     def __init__(self, config: Config):
         self.config = config
-        self.geosite_domains: Set[str] = set()
-        self.geosite_index: dict = {}  # 简单的内存索引
+        # GeoSite后缀树：按标签从右到左逐级嵌套的字典，值为True表示该后缀本身是GeoSite条目
+        self._suffix_trie: Dict[str, Any] = {}
+        self.geosite_count = 0
+        # 已加载GeoSite文件内容的摘要，用于跳过内容未变化的重新加载
+        self._geosite_digest: Optional[str] = None
+        # 查询结果LRU缓存，重复查询的热门域名直接命中
+        self._lookup_cache: "OrderedDict[str, bool]" = OrderedDict()
         # 使用临时目录，不需要持久化
-        import tempfile
-        self.data_dir = Path(tempfile.gettempdir()) / "rule-bot"
-        self.geoip_file = self.data_dir / "geoip" / "Country-without-asn.mmdb"
-        self.geosite_file = self.data_dir / "geosite" / "direct-list.txt"
-        
-        # 确保目录存在
-        self.data_dir.mkdir(exist_ok=True)
-        (self.data_dir / "geoip").mkdir(exist_ok=True)
-        (self.data_dir / "geosite").mkdir(exist_ok=True)
+        self.paths = _Paths.under(Path(tempfile.gettempdir()) / "rule-bot")
+        # 共享的下载Session，GeoIP和GeoSite下载复用同一连接池
+        self._session: Optional[aiohttp.ClientSession] = None
+        # 定时更新任务（运行在机器人的事件循环中）
+        self._update_task: Optional[asyncio.Task] = None
     
     async def initialize(self):
         """初始化数据管理器"""
@@ -41,29 +72,62 @@ class DataManager:
             # 初始下载数据
             await self._download_initial_data()
             
-            # 启动定时更新任务
-            self._start_scheduled_updates()
-            
             logger.info("数据管理器初始化完成")
             
         except Exception as e:
             logger.error(f"数据管理器初始化失败: {e}")
             raise
     
+    async def start(self):
+        """启动定时更新任务（需在长期运行的事件循环中调用）"""
+        if not self._update_task or self._update_task.done():
+            self._update_task = asyncio.create_task(self._update_loop())
+            logger.info("定时更新任务已启动")
+    
+    async def close(self):
+        """关闭数据管理器，停止定时更新并释放下载Session"""
+        if self._update_task and not self._update_task.done():
+            self._update_task.cancel()
+            try:
+                await self._update_task
+            except asyncio.CancelledError:
+                pass
+        self._update_task = None
+        
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享的下载Session（不存在或已关闭时重新创建）"""
+        if not self._session or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=4,
+                ttl_dns_cache=3600,
+                keepalive_timeout=75
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+    
     async def _download_initial_data(self):
         """初始下载数据"""
         try:
-            # 检查是否需要下载
-            need_geoip = not self.geoip_file.exists() or self._is_file_outdated(self.geoip_file)
-            need_geosite = not self.geosite_file.exists() or self._is_file_outdated(self.geosite_file)
+            # 创建目录并检查是否需要下载（均为阻塞的文件系统调用，合并到一次线程调用中）
+            need_geoip, need_geosite = await asyncio.to_thread(self._prepare_data_files)
             
+            # 并发下载，共用同一个Session
+            session = await self._get_session()
+            tasks = []
             if need_geoip:
                 logger.info("下载GeoIP数据...")
-                await self._download_geoip()
+                tasks.append(self._download_geoip(session))
             
             if need_geosite:
                 logger.info("下载GeoSite数据...")
-                await self._download_geosite()
+                tasks.append(self._download_geosite(session))
+            
+            if tasks:
+                await asyncio.gather(*tasks)
             
             # 加载GeoSite数据到内存
             await self._load_geosite_data()
@@ -72,157 +136,252 @@ class DataManager:
             logger.error(f"初始数据下载失败: {e}")
             raise
     
-    async def _download_geoip(self):
-        """下载GeoIP数据"""
+    async def _download_file(self, session: aiohttp.ClientSession, url: str, target: Path) -> bool:
+        """下载文件到临时文件，写完后原子替换目标文件，避免中断时留下残缺文件
+        
+        携带上次响应的 ETag/Last-Modified 发起条件请求，上游未变化时（304）
+        只刷新本地文件的修改时间，返回False；下载了新内容时返回True
+        """
+        tmp_file = target.with_suffix(target.suffix + '.part')
+        meta_file = target.with_suffix(target.suffix + '.meta.json')
+        try:
+            headers = await asyncio.to_thread(self._read_validators, target, meta_file)
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    # 上游未变化，刷新修改时间，使过期检查重新计时
+                    await asyncio.to_thread(os.utime, target)
+                    return False
+                if response.status != 200:
+                    raise Exception(f"下载失败，状态码: {response.status}")
+                validators = {
+                    key: response.headers[key]
+                    for key in ('ETag', 'Last-Modified')
+                    if key in response.headers
+                }
+                # 文件写入均在线程池中执行，磁盘延迟不会阻塞事件循环和网络接收
+                f = await asyncio.to_thread(open, tmp_file, 'wb')
+                try:
+                    buffer = bytearray()
+                    async for chunk in response.content.iter_chunked(NETWORK_CHUNK):
+                        buffer += chunk
+                        if len(buffer) >= DISK_FLUSH_SIZE:
+                            await asyncio.to_thread(f.write, buffer)
+                            buffer = bytearray()
+                    if buffer:
+                        await asyncio.to_thread(f.write, buffer)
+                    await asyncio.to_thread(self._fsync_file, f)
+                finally:
+                    await asyncio.to_thread(f.close)
+            # 同一文件系统内 rename 是原子操作，读取方只会看到旧文件或完整的新文件
+            await asyncio.to_thread(os.replace, tmp_file, target)
+            await asyncio.to_thread(self._write_validators, meta_file, validators)
+            return True
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+    
+    @staticmethod
+    def _read_validators(target: Path, meta_file: Path) -> Dict[str, str]:
+        """读取上次下载保存的缓存校验信息，转换为条件请求头"""
+        if not target.exists():
+            return {}
+        try:
+            meta = json.loads(meta_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+        headers = {}
+        if meta.get('ETag'):
+            headers['If-None-Match'] = meta['ETag']
+        if meta.get('Last-Modified'):
+            headers['If-Modified-Since'] = meta['Last-Modified']
+        return headers
+    
+    @staticmethod
+    def _write_validators(meta_file: Path, validators: Dict[str, str]):
+        """保存响应的 ETag/Last-Modified，供下次条件请求使用"""
+        if validators:
+            meta_file.write_text(json.dumps(validators), encoding='utf-8')
+        else:
+            meta_file.unlink(missing_ok=True)
+    
+    @staticmethod
+    def _fsync_file(f):
+        """将文件内容刷到磁盘"""
+        f.flush()
+        os.fsync(f.fileno())
+    
+    async def _download_geoip(self, session: aiohttp.ClientSession) -> bool:
+        """下载GeoIP数据，返回是否获取到新内容"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.config.GEOIP_URL) as response:
-                    if response.status == 200:
-                        with open(self.geoip_file, 'wb') as f:
-                            async for chunk in response.content.iter_chunked(8192):
-                                f.write(chunk)
-                        logger.info("GeoIP数据下载完成")
-                    else:
-                        raise Exception(f"下载失败，状态码: {response.status}")
+            updated = await self._download_file(session, self.config.GEOIP_URL, self.paths.geoip)
+            logger.info("GeoIP数据下载完成" if updated else "GeoIP数据未变化，跳过下载")
+            return updated
         except Exception as e:
             logger.error(f"GeoIP数据下载失败: {e}")
             raise
     
-    async def _download_geosite(self):
-        """下载GeoSite数据"""
+    async def _download_geosite(self, session: aiohttp.ClientSession) -> bool:
+        """下载GeoSite数据，返回是否获取到新内容"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.config.GEOSITE_URL) as response:
-                    if response.status == 200:
-                        with open(self.geosite_file, 'wb') as f:
-                            async for chunk in response.content.iter_chunked(8192):
-                                f.write(chunk)
-                        logger.info("GeoSite数据下载完成")
-                    else:
-                        raise Exception(f"下载失败，状态码: {response.status}")
+            updated = await self._download_file(session, self.config.GEOSITE_URL, self.paths.geosite)
+            logger.info("GeoSite数据下载完成" if updated else "GeoSite数据未变化，跳过下载")
+            return updated
         except Exception as e:
             logger.error(f"GeoSite数据下载失败: {e}")
             raise
     
     async def _load_geosite_data(self):
-        """加载GeoSite数据到内存并建立Redis索引"""
+        """加载GeoSite数据到内存"""
         try:
-            if not self.geosite_file.exists():
+            if not self.paths.geosite.exists():
                 logger.warning("GeoSite文件不存在，跳过加载")
                 return
             
             logger.info("加载GeoSite数据到内存...")
-            domains = set()
-            
-            with open(self.geosite_file, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        # 提取域名
-                        if line.startswith('full:'):
-                            domain = line[5:]
-                        elif line.startswith('domain:'):
-                            domain = line[7:]
-                        else:
-                            domain = line
-                        
-                        if domain:
-                            domains.add(domain.lower())
-                    
-                    # 每10000行输出一次进度
-                    if line_num % 10000 == 0:
-                        logger.info(f"已处理 {line_num} 行GeoSite数据")
-            
-            self.geosite_domains = domains
-            
-            # 建立内存索引以便快速查询
-            self._build_geosite_index()
-            
-            logger.info(f"GeoSite数据加载完成，共 {len(domains)} 个域名")
+            # 解析和建树都是纯CPU工作，放到线程中执行，避免阻塞事件循环
+            loaded = await asyncio.to_thread(self._build_geosite_index_sync)
+            if loaded is None:
+                logger.info("GeoSite数据内容未变化，跳过重新加载")
+                return
+            digest, trie, count = loaded
+            
+            # 在事件循环线程中一次性替换，查询方只会看到旧索引或完整的新索引
+            self._suffix_trie = trie
+            self.geosite_count = count
+            self._geosite_digest = digest
+            self._lookup_cache.clear()
+            
+            logger.info(f"GeoSite数据加载完成，共 {count} 个域名")
             
         except Exception as e:
             logger.error(f"GeoSite数据加载失败: {e}")
             raise
     
-    def _build_geosite_index(self):
-        """建立GeoSite内存索引"""
-        try:
-            logger.info("建立GeoSite内存索引...")
-            
-            # 清空旧索引
-            self.geosite_index.clear()
-            
-            # 只为完整域名建立索引，不包括父域名
-            for domain in self.geosite_domains:
-                self.geosite_index[domain] = True
-            
-            logger.info(f"GeoSite内存索引建立完成，索引条目: {len(self.geosite_index)}")
-            
-        except Exception as e:
-            logger.error(f"建立GeoSite索引失败: {e}")
+    def _build_geosite_index_sync(self) -> Optional[Tuple[str, Dict[str, Any], int]]:
+        """解析GeoSite文件并建立后缀树，返回(内容摘要, 后缀树, 域名数)；内容未变化时返回None"""
+        parsed = self._parse_geosite_file()
+        if parsed is None:
+            return None
+        digest, domains = parsed
+        # 建立后缀树，已被父域名覆盖的子域名不再单独存储
+        return digest, self._build_suffix_trie(domains), len(domains)
+    
+    def _parse_geosite_file(self) -> Optional[Tuple[str, Set[str]]]:
+        """解析GeoSite文件，返回(内容摘要, 域名集合)；内容与上次加载相同时返回None"""
+        with open(self.paths.geosite, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                digest = hashlib.blake2b(b'', digest_size=16).hexdigest()
+                return None if digest == self._geosite_digest else (digest, set())
+            # 内存映射读取，文件内容不整体复制到Python堆中，只分配最终保留的域名字符串
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # 上游经常返回字节完全相同的内容，摘要一致时跳过解析和重建索引
+                digest = hashlib.blake2b(mm, digest_size=16).hexdigest()
+                if digest == self._geosite_digest:
+                    return None
+                # 解码前保持bytes，只对最终保留的域名做一次解码
+                domains = {
+                    (line[5:] if line.startswith(b'full:') else
+                     line[7:] if line.startswith(b'domain:') else line).decode('utf-8').lower()
+                    for line in map(bytes.strip, iter(mm.readline, b''))
+                    if line and not line.startswith(b'#')
+                }
+        domains.discard('')  # 仅有前缀、没有域名的行
+        return digest, domains
     
-    async def is_domain_in_geosite(self, domain: str) -> bool:
+    def is_domain_in_geosite(self, domain: str) -> bool:
         """检查域名是否在GeoSite中"""
         try:
             domain = domain.lower().strip()
             
-            # 1. 直接检查完整域名
-            if domain in self.geosite_index:
-                return True
-            
-            # 2. 检查是否为GeoSite中域名的子域名
-            # 例如：查询 sub.example.com，检查 example.com 是否在GeoSite中
-            parts = domain.split('.')
-            for i in range(1, len(parts)):
-                parent_domain = '.'.join(parts[i:])
-                if parent_domain in self.geosite_index:
-                    return True
-            
-            # 注意：不做反向检查，因为GeoSite通常只包含具体域名，不需要检查子域名覆盖父域名的情况
+            cache = self._lookup_cache
+            cached = cache.get(domain)
+            if cached is not None:
+                cache.move_to_end(domain)
+                return cached
             
-            return False
+            result = self._match_geosite(domain)
+            cache[domain] = result
+            if len(cache) > GEOSITE_LOOKUP_CACHE_SIZE:
+                cache.popitem(last=False)
+            return result
             
         except Exception as e:
             logger.error(f"检查GeoSite域名失败: {e}")
             return False
     
-    def _is_file_outdated(self, file_path: Path, hours: int = 6) -> bool:
-        """检查文件是否过期"""
-        if not file_path.exists():
-            return True
+    @staticmethod
+    def _build_suffix_trie(domains: Iterable[str]) -> Dict[str, Any]:
+        """按标签从右到左建立GeoSite后缀树"""
+        trie: Dict[str, Any] = {}
+        intern = sys.intern
+        for domain in domains:
+            # 标签驻留后，大量重复的 com、cn 等标签在各层节点间共享同一个字符串对象
+            labels = [intern(label) for label in domain.split('.')]
+            node = trie
+            for label in reversed(labels[1:]):
+                child = node.get(label)
+                if child is True:
+                    break  # 已被父域名条目覆盖
+                if child is None:
+                    child = node[label] = {}
+                node = child
+            else:
+                # 父域名条目覆盖其下所有子域名，直接替换已有子树
+                node[labels[0]] = True
+        return trie
+    
+    def _match_geosite(self, domain: str) -> bool:
+        """在GeoSite后缀树中匹配域名本身或其父域名"""
+        # 例如：查询 sub.example.com，依次下探 com → example，命中 example.com 条目即返回
+        node = self._suffix_trie
+        for label in reversed(domain.split('.')):
+            node = node.get(label)
+            if node is None:
+                return False
+            if node is True:
+                return True
+        
+        # 注意：不做反向检查，因为GeoSite通常只包含具体域名，不需要检查子域名覆盖父域名的情况
         
-        file_time = datetime.fromtimestamp(file_path.stat().st_mtime)
-        return datetime.now() - file_time > timedelta(hours=hours)
+        return False
     
-    def _start_scheduled_updates(self):
-        """启动定时更新任务"""
-        def run_scheduler():
-            schedule.every(6).hours.do(self._update_data_sync)
-            
-            while True:
-                schedule.run_pending()
-                time.sleep(60)  # 每分钟检查一次
+    def _prepare_data_files(self) -> Tuple[bool, bool]:
+        """确保数据目录存在，返回GeoIP、GeoSite是否需要下载"""
+        paths = self.paths
+        for directory in (paths.geoip.parent, paths.geosite.parent):
+            directory.mkdir(parents=True, exist_ok=True)
+        return self._is_file_outdated(paths.geoip), self._is_file_outdated(paths.geosite)
+    
+    def _is_file_outdated(self, file_path: Path, hours: int = 6) -> bool:
+        """检查文件是否过期（文件不存在视为过期）"""
+        try:
+            mtime = os.stat(file_path).st_mtime
+        except FileNotFoundError:
+            return True
         
-        # 在单独线程中运行调度器
-        scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-        scheduler_thread.start()
-        logger.info("定时更新任务已启动")
+        return time.time() - mtime > hours * 3600
     
-    def _update_data_sync(self):
-        """同步版本的数据更新（用于scheduler）"""
-        asyncio.create_task(self._update_data())
+    async def _update_loop(self):
+        """定时更新循环，每个周期休眠完整的更新间隔"""
+        while True:
+            await asyncio.sleep(self.config.DATA_UPDATE_INTERVAL)
+            await self._update_data()
     
     async def _update_data(self):
         """更新数据"""
         try:
             logger.info("开始定时更新数据...")
             
-            # 下载新数据
-            await self._download_geoip()
-            await self._download_geosite()
+            # 并发下载新数据
+            session = await self._get_session()
+            _, geosite_updated = await asyncio.gather(
+                self._download_geoip(session),
+                self._download_geosite(session)
+            )
             
-            # 重新加载GeoSite数据
-            await self._load_geosite_data()
+            # 仅在GeoSite内容变化时重新加载
+            if geosite_updated:
+                await self._load_geosite_data()
             
             logger.info("定时更新完成")
             
@@ -5,8 +5,11 @@
 
 import asyncio
 import time
-from typing import Dict, Any, Optional
-from collections import defaultdict
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
 from loguru import logger
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -19,7 +22,269 @@ from ..services.geoip_service import GeoIPService
 from ..services.github_service import GitHubService
 from ..services.domain_checker import DomainChecker
 from ..services.group_service import GroupService
-from ..utils.domain_utils import normalize_domain, extract_second_level_domain, extract_second_level_domain_for_rules, is_cn_domain
+from ..utils.domain_utils import normalize_domain, parse_domain_input
+
+# Markdown特殊字符转义表（不包含点号，因为域名和文件路径中需要保留）
+_MARKDOWN_ESCAPE_TABLE = str.maketrans({char: f'\\{char}' for char in '_*[]()~`>#+-=|{}!'})
+
+# 处理中状态消息的最小更新间隔（秒），间隔内的中间状态直接跳过，以及最多记录的状态消息数
+STATUS_EDIT_INTERVAL = 0.4
+MAX_STATUS_MESSAGES = 1000
+# 添加规则在该时间内（秒）完成时不显示"正在添加"消息，直接展示结果
+ADD_STATUS_DELAY = 0.4
+
+# 带参数的回调数据前缀，更具体的前缀必须排在前面（confirm_add_proxy_ 优先于 confirm_add_）
+_CALLBACK_PREFIXES = ("confirm_add_proxy_", "add_proxy_domain_", "add_domain_", "confirm_add_")
+
+# 固定的按钮和内联键盘，构建一次后在各处复用（InlineKeyboardButton/InlineKeyboardMarkup 均为不可变对象）
+_BTN_QUERY = InlineKeyboardButton("🔍 查询域名", callback_data="query_domain")
+_BTN_REQUERY = InlineKeyboardButton("🔍 重新查询", callback_data="query_domain")
+_BTN_QUERY_OTHER = InlineKeyboardButton("🔍 查询其他域名", callback_data="query_domain")
+_BTN_ADD_DIRECT = InlineKeyboardButton("➕ 添加直连规则", callback_data="add_direct_rule")
+_BTN_ADD_PROXY = InlineKeyboardButton("➕ 添加代理规则", callback_data="add_proxy_rule")
+_BTN_ADD_OTHER_DIRECT = InlineKeyboardButton("➕ 添加其他域名", callback_data="add_direct_rule")
+_BTN_ADD_OTHER_PROXY = InlineKeyboardButton("➕ 添加其他域名", callback_data="add_proxy_rule")
+_BTN_CONTINUE_DIRECT = InlineKeyboardButton("➕ 继续添加", callback_data="add_direct_rule")
+_BTN_CONTINUE_PROXY = InlineKeyboardButton("➕ 继续添加", callback_data="add_proxy_rule")
+_BTN_DELETE = InlineKeyboardButton("➖ 删除规则", callback_data="delete_rule")
+_BTN_HELP = InlineKeyboardButton("ℹ️ 帮助信息", callback_data="help")
+_BTN_MAIN_MENU = InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")
+_BTN_CANCEL_ADD = InlineKeyboardButton("❌ 取消添加", callback_data="confirm_add_no")
+_BTN_CANCEL_ADD_PROXY = InlineKeyboardButton("❌ 取消添加", callback_data="confirm_add_proxy_no")
+
+# 主菜单
+_MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [_BTN_QUERY], [_BTN_ADD_DIRECT], [_BTN_ADD_PROXY], [_BTN_DELETE], [_BTN_HELP]
+])
+
+# 返回主菜单
+_BACK_TO_MENU_KEYBOARD = InlineKeyboardMarkup([[_BTN_MAIN_MENU]])
+
+# 选择添加的规则类型
+_ADD_MENU_KEYBOARD = InlineKeyboardMarkup([[_BTN_ADD_DIRECT], [_BTN_ADD_PROXY], [_BTN_MAIN_MENU]])
+
+# 查询结果后续操作
+_REQUERY_KEYBOARD = InlineKeyboardMarkup([[_BTN_REQUERY], [_BTN_MAIN_MENU]])
+_QUERY_KEYBOARD = InlineKeyboardMarkup([[_BTN_QUERY], [_BTN_MAIN_MENU]])
+_QUERY_OR_ADD_DIRECT_KEYBOARD = InlineKeyboardMarkup([[_BTN_QUERY_OTHER], [_BTN_ADD_OTHER_DIRECT], [_BTN_MAIN_MENU]])
+_QUERY_OR_ADD_PROXY_KEYBOARD = InlineKeyboardMarkup([[_BTN_QUERY_OTHER], [_BTN_ADD_OTHER_PROXY], [_BTN_MAIN_MENU]])
+
+# 添加被拒绝或出错后继续
+_ADD_OTHER_DIRECT_KEYBOARD = InlineKeyboardMarkup([[_BTN_ADD_OTHER_DIRECT], [_BTN_MAIN_MENU]])
+_ADD_OTHER_PROXY_KEYBOARD = InlineKeyboardMarkup([[_BTN_ADD_OTHER_PROXY], [_BTN_MAIN_MENU]])
+
+# 添加成功后继续
+_CONTINUE_ADD_DIRECT_KEYBOARD = InlineKeyboardMarkup([[_BTN_CONTINUE_DIRECT], [_BTN_MAIN_MENU]])
+_CONTINUE_ADD_PROXY_KEYBOARD = InlineKeyboardMarkup([[_BTN_CONTINUE_PROXY], [_BTN_MAIN_MENU]])
+
+# 确认添加
+_CONFIRM_ADD_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ 确认添加", callback_data="confirm_add_yes")], [_BTN_CANCEL_ADD], [_BTN_MAIN_MENU]
+])
+_FORCE_ADD_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⚠️ 强制添加", callback_data="confirm_add_yes")], [_BTN_CANCEL_ADD], [_BTN_MAIN_MENU]
+])
+_CONFIRM_ADD_PROXY_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ 确认添加", callback_data="confirm_add_proxy_yes")], [_BTN_CANCEL_ADD_PROXY], [_BTN_MAIN_MENU]
+])
+_FORCE_ADD_PROXY_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⚠️ 强制添加", callback_data="confirm_add_proxy_yes")], [_BTN_CANCEL_ADD_PROXY], [_BTN_MAIN_MENU]
+])
+
+# 跳过说明
+_SKIP_DESCRIPTION_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⏭️ 跳过说明", callback_data="skip_description")]
+])
+_SKIP_DESCRIPTION_PROXY_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⏭️ 跳过说明", callback_data="skip_description_proxy")]
+])
+
+
+@dataclass(frozen=True, slots=True)
+class _AddKind:
+    """直连/代理两种添加流程的差异部分"""
+    name: str
+    label: str
+    rule_file_attr: str  # 添加到的规则文件（Config 属性名）
+    target_method: str  # DomainChecker 上获取目标域名的方法名
+    # 按顺序检查的规则文件（Config 属性名）及已存在时的标题
+    rule_checks: Tuple[Tuple[str, str], ...]
+    checked_state: str
+    cn_reject_text: str
+    geosite_note: str
+    cn_keyboard: InlineKeyboardMarkup
+    add_other_keyboard: InlineKeyboardMarkup
+    confirm_keyboard: InlineKeyboardMarkup
+    force_keyboard: InlineKeyboardMarkup
+    continue_keyboard: InlineKeyboardMarkup
+
+
+@dataclass(slots=True)
+class _UserState:
+    """单个用户的会话状态，添加流程中附带待添加的域名及其检查结果"""
+    state: str
+    updated_at: float
+    domain: Optional[str] = None
+    check_result: Optional[Dict[str, Any]] = None
+
+
+# 没有状态记录的用户视为空闲，共享同一个只读实例
+_IDLE_STATE = _UserState("idle", 0.0)
+
+
+_ADD_KINDS = {
+    "direct": _AddKind(
+        name="direct",
+        label="直连",
+        rule_file_attr="DIRECT_RULE_FILE",
+        target_method="get_target_domain_to_add",
+        rule_checks=(("DIRECT_RULE_FILE", "域名已存在于规则中"),),
+        checked_state="domain_checked",
+        cn_reject_text=(
+            "❌ **.cn域名不可添加**\n\n"
+            "📋 **.cn域名默认直连**：所有.cn结尾的域名都已默认走直连路线，无需手动添加到规则中。\n\n"
+            "💡 如需添加其他域名，请选择下方操作："
+        ),
+        geosite_note="该域名已在GEOSITE:CN规则中，不需要重复添加。",
+        cn_keyboard=_QUERY_OR_ADD_DIRECT_KEYBOARD,
+        add_other_keyboard=_ADD_OTHER_DIRECT_KEYBOARD,
+        confirm_keyboard=_CONFIRM_ADD_KEYBOARD,
+        force_keyboard=_FORCE_ADD_KEYBOARD,
+        continue_keyboard=_CONTINUE_ADD_DIRECT_KEYBOARD,
+    ),
+    "proxy": _AddKind(
+        name="proxy",
+        label="代理",
+        rule_file_attr="PROXY_RULE_FILE",
+        target_method="get_target_domain_to_add_proxy",
+        rule_checks=(
+            ("PROXY_RULE_FILE", "域名已存在于代理规则中"),
+            ("DIRECT_RULE_FILE", "域名已存在于直连规则中"),
+        ),
+        checked_state="proxy_domain_checked",
+        cn_reject_text=(
+            "❌ **.cn域名不可添加代理规则**\n\n"
+            "📋 **.cn域名默认直连**：所有.cn结尾的域名都已默认走直连路线，不应添加到代理规则中。\n\n"
+            "💡 如需添加其他域名，请选择下方操作："
+        ),
+        geosite_note="该域名已在GEOSITE:CN规则中，属于中国域名，不应添加到代理规则。",
+        cn_keyboard=_QUERY_OR_ADD_PROXY_KEYBOARD,
+        add_other_keyboard=_ADD_OTHER_PROXY_KEYBOARD,
+        confirm_keyboard=_CONFIRM_ADD_PROXY_KEYBOARD,
+        force_keyboard=_FORCE_ADD_PROXY_KEYBOARD,
+        continue_keyboard=_CONTINUE_ADD_PROXY_KEYBOARD,
+    ),
+}
+
+
+
+@lru_cache(maxsize=256)
+def _query_result_keyboard(domain: str) -> InlineKeyboardMarkup:
+    """查询结果的操作键盘，回调数据带域名，按域名缓存（热门域名会被反复查询）"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("➕ 添加直连规则", callback_data=f"add_domain_{domain}")],
+        [InlineKeyboardButton("➕ 添加代理规则", callback_data=f"add_proxy_domain_{domain}")],
+        [_BTN_REQUERY],
+        [_BTN_MAIN_MENU]
+    ])
+
+
+
+def _format_rule_matches(matches) -> str:
+    """把匹配到的规则格式化为列表行（每行以换行结尾）"""
+    return "".join(f"   • 第{match['line']}行: {match['rule']}\n" for match in matches)
+
+
+# 消息模板，只有用户名、仓库等字段随调用变化
+_WELCOME_TEXT = """
+👋 你好，{username}！
+
+我是 **Rule-Bot**，可以帮你管理 Clash 规则。
+
+📂 **当前管理仓库**
+`{repo}`
+
+✨ **我能做什么**
+• 🔍 查询域名是否已在规则中
+• 🌍 检查域名 IP 归属地（支持 DNS 解析）
+• 🤖 智能判断域名是否适合直连
+• 📝 一键添加域名到规则文件
+• 🗑️ 删除已添加的域名规则（暂未开放）
+
+💡 **使用提示**
+直接在聊天框输入域名即可查询，或点击下方按钮操作。
+"""
+
+_MAIN_MENU_TEXT = """
+👋 欢迎使用 Rule-Bot，{username}！
+
+🤖 我是一个专门管理Clash规则的机器人，可以帮助您：
+
+📂 *目标仓库：* `{repo}`
+
+📋 *主要功能：*
+• 🔍 查询域名规则状态
+• ➕ 添加直连规则
+• ➖ 删除规则（暂不可用）
+
+🎯 *支持的操作：*
+• 检查域名是否已在规则中
+• 检查域名是否在GEOSITE:CN中
+• DNS 解析和 IP 归属地检查
+• 自动判断添加建议
+
+请选择您要执行的操作：
+"""
+
+# .cn域名查询结果说明
+_CN_QUERY_NOTE = (
+    "📋 *.cn域名说明：* 所有.cn域名默认直连，无需手动添加到规则中\n\n"
+    "💡 *.cn域名包括：*\n"
+    "   • .cn 顶级域名\n"
+    "   • .com.cn 二级域名\n"
+    "   • .net.cn 二级域名\n"
+    "   • .org.cn 二级域名\n"
+    "   • 其他所有.cn结尾的域名\n\n"
+    "✅ *状态：* 域名已默认直连，无需任何操作"
+)
+
+# 查询/添加提示的固定结尾部分
+_SUPPORTED_FORMATS = "📝 支持格式：\n• example.com\n• www.example.com\n• https://example.com\n• https://www.example.com/path\n• sub.example.com\n• ftp://example.com\n• example.com:8080"
+_QUERY_PROMPT = "请输入要查询的域名：\n\n" + _SUPPORTED_FORMATS + "\n\n💡 *注意：添加规则时统一使用二级域名*"
+_ADD_PROMPT = "请输入要添加的域名：\n\n" + _SUPPORTED_FORMATS + "\n\n💡 *注意：系统将自动提取二级域名进行添加*"
+
+_HELP_TEXT = """
+📖 *Rule-Bot 使用说明*
+
+📂 *目标仓库：* `{repo}`
+📄 *直连规则文件：* `{direct_rule_file}`
+📄 *代理规则文件：* `{proxy_rule_file}`
+
+🔍 *查询域名功能：*
+• 检查域名是否在直连规则中
+• 检查域名是否在 GEOSITE:CN 中
+• 显示域名的 IP 归属地信息
+
+➕ *添加直连/代理规则功能：*
+• 自动检查域名 IP 归属地
+• 检查 NS 服务器归属地
+• 域名检查基于 DoH 和 GeoIP 数据
+• 根据检查结果自动判断是否适合添加
+• 支持添加说明信息
+
+📝 *操作流程：*
+1. 选择功能按钮
+2. 输入域名（支持多种格式）
+3. 查看检查结果
+4. 根据提示进行操作
+
+🛠 *技术特性：*
+• 使用中国境内 EDNS 查询
+• 支持阿里云和腾讯云 DoH
+• 自动更新 GeoIP 和 GeoSite 数据
+
+⚠️ *注意：* 删除规则功能暂未开放。
+"""
 
 
 class HandlerManager:
@@ -29,9 +294,55 @@ class HandlerManager:
         self.config = config
         self.data_manager = data_manager
         
+        # 仓库名在运行期不变，提前填入模板，只保留用户名占位符
+        self._welcome_tmpl = _WELCOME_TEXT.format(username="{username}", repo=config.GITHUB_REPO)
+        self._main_menu_tmpl = _MAIN_MENU_TEXT.format(username="{username}", repo=config.GITHUB_REPO)
+        
+        # 查询/添加提示的标题部分只依赖配置，预先拼好，每次只需拼接统计信息和固定结尾
+        self._query_header = f"🔍 *域名查询*\n\n📂 *目标仓库：* `{config.GITHUB_REPO}`\n📄 *规则文件：* `{config.DIRECT_RULE_FILE}`\n\n"
+        self._add_direct_header = f"➕ *添加直连规则*\n\n📂 *目标仓库：* `{config.GITHUB_REPO}`\n📄 *规则文件：* `{config.DIRECT_RULE_FILE}`\n\n"
+        self._add_proxy_header = f"➕ *添加代理规则*\n\n📂 *目标仓库：* `{config.GITHUB_REPO}`\n📄 *规则文件：* `{config.PROXY_RULE_FILE}`\n\n"
+        
+        # 帮助信息只依赖配置，生成一次即可
+        self._help_text = _HELP_TEXT.format(
+            repo=config.GITHUB_REPO,
+            direct_rule_file=config.DIRECT_RULE_FILE,
+            proxy_rule_file=config.PROXY_RULE_FILE
+        )
+        
+        # 白名单用户ID只解析一次；配置无效时为None，不会匹配任何用户
+        self._required_user_id: Optional[int] = None
+        if config.REQUIRED_USER_ID:
+            try:
+                self._required_user_id = int(config.REQUIRED_USER_ID)
+            except ValueError:
+                logger.error(f"REQUIRED_USER_ID 不是有效的用户ID: {config.REQUIRED_USER_ID}")
+        
+        # 回调路由表，处理函数统一接收 (query, user_id, data)
+        self._callback_handlers = {
+            "main_menu": lambda query, user_id, data: self._send_main_menu(query.from_user, edit=query.edit_message_text),
+            "query_domain": lambda query, user_id, data: self._start_domain_query(query, user_id),
+            "add_direct_rule": lambda query, user_id, data: self._start_add_direct_rule(query, user_id),
+            "add_proxy_rule": lambda query, user_id, data: self._start_add_proxy_rule(query, user_id),
+            "delete_rule": lambda query, user_id, data: self._show_delete_not_supported(query),
+            "help": lambda query, user_id, data: self._show_help(query),
+            "skip_description": lambda query, user_id, data: self._handle_skip_description(query, user_id),
+            "skip_description_proxy": lambda query, user_id, data: self._handle_skip_description_proxy(query, user_id),
+        }
+        # 前缀路由，顺序与 _CALLBACK_PREFIXES 一致
+        prefix_handlers = {
+            "confirm_add_proxy_": self._handle_confirm_add_proxy_callback,
+            "add_proxy_domain_": self._handle_add_proxy_domain_callback,
+            "add_domain_": self._handle_add_domain_callback,
+            "confirm_add_": self._handle_confirm_add_callback,
+        }
+        self._callback_prefix_handlers = tuple(
+            (prefix, prefix_handlers[prefix]) for prefix in _CALLBACK_PREFIXES
+        )
+        
         # 初始化服务
-        self.dns_service = DNSService(config.DOH_SERVERS, config.NS_DOH_SERVERS)
-        self.geoip_service = GeoIPService(str(data_manager.geoip_file))
+        self.dns_service = DNSService(config.DOH_SERVERS, config.NS_DOH_SERVERS, warm_up=True)
+        self.geoip_service = GeoIPService(str(data_manager.paths.geoip))
         self.github_service = GitHubService(config)
         self.domain_checker = DomainChecker(self.dns_service, self.geoip_service)
         
@@ -45,32 +356,80 @@ class HandlerManager:
         if self.dns_service:
             await self.dns_service.start()
         
-        # 用户状态管理
-        self.user_states: Dict[int, Dict[str, Any]] = {}
+        # 启动数据定时更新
+        await self.data_manager.start()
+        
+        # 用户状态管理，按最近活动时间排序，最久未活动的用户在最前
+        self.user_states: "OrderedDict[int, _UserState]" = OrderedDict()
         
         # 用户限制管理
-        self.user_add_history: Dict[int, list] = defaultdict(list)  # 用户添加历史 {user_id: [timestamp1, timestamp2, ...]}
+        # 用户添加令牌桶 {user_id: (剩余令牌数, 上次更新时间)}，每个用户只保存两个浮点数
+        # 只在实际添加时创建条目，仅查询限制的用户不会留下空记录
+        self.user_add_buckets: "OrderedDict[int, Tuple[float, float]]" = OrderedDict()
         self.MAX_DESCRIPTION_LENGTH = 20  # 域名说明最大字符数
-        self.MAX_ADDS_PER_HOUR = 50  # 每小时最多添加域名数
+        self.MAX_ADDS_PER_HOUR = 50  # 每小时最多添加域名数（令牌桶容量）
+        self.ADD_REFILL_RATE = self.MAX_ADDS_PER_HOUR / 3600  # 每秒恢复的令牌数
+        self.MAX_TRACKED_USERS = 10000  # 状态和添加令牌桶最多保留的用户数
+        self.USER_STATE_TTL = 2 * 60 * 60  # 用户状态闲置超过2小时即清理
+        
+        # 规则文件统计缓存 {file_path: (缓存时间, 统计结果)}，避免每次渲染菜单都请求GitHub
+        self._stats_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._stats_locks: Dict[str, asyncio.Lock] = {}
+        self.STATS_CACHE_TTL = 60  # 统计缓存有效期（秒）
+        
+        # 并发处理限制：全局最多同时处理的请求数，以及每个用户的串行执行信号量
+        # 同一用户的更新按顺序处理，保证用户状态流转不会交错
+        self._work_sem = asyncio.Semaphore(32)
+        self._user_work: Dict[int, list] = {}  # {user_id: [信号量, 引用计数]}
+        
+        # 处理中状态消息的上次更新时间 {(chat_id, message_id): 时间}，用于合并过于密集的状态更新
+        self._status_edit_ts: Dict[Tuple[int, int], float] = {}
+        
+        # 定期清理过期的用户状态和添加令牌桶
+        self._sweeper_task = asyncio.create_task(self._sweep_user_data_loop())
 
     async def stop(self):
         """停止服务"""
+        sweeper_task = getattr(self, '_sweeper_task', None)
+        if sweeper_task and not sweeper_task.done():
+            sweeper_task.cancel()
+            try:
+                await sweeper_task
+            except asyncio.CancelledError:
+                pass
         if self.dns_service:
             await self.dns_service.close()
+        await self.data_manager.close()
 
     
-    def get_user_state(self, user_id: int) -> Dict[str, Any]:
-        """获取用户状态"""
-        if user_id not in self.user_states:
-            self.user_states[user_id] = {"state": "idle", "data": {}}
-        return self.user_states[user_id]
+    def get_user_state(self, user_id: int) -> _UserState:
+        """获取用户状态（返回的对象不应被修改，变更状态请使用 set_user_state）"""
+        user_state = self.user_states.get(user_id)
+        if user_state is None:
+            return _IDLE_STATE
+        user_state.updated_at = time.time()
+        self.user_states.move_to_end(user_id)
+        return user_state
     
-    def set_user_state(self, user_id: int, state: str, data: Dict[str, Any] = None):
+    def set_user_state(self, user_id: int, state: str, domain: Optional[str] = None,
+                       check_result: Optional[Dict[str, Any]] = None):
         """设置用户状态"""
-        if user_id not in self.user_states:
-            self.user_states[user_id] = {}
-        self.user_states[user_id]["state"] = state
-        self.user_states[user_id]["data"] = data or {}
+        if state == "idle" and not domain:
+            # 空闲即默认状态，无需保留条目
+            self.user_states.pop(user_id, None)
+            return
+        self.user_states[user_id] = _UserState(state, time.time(), domain, check_result)
+        self.user_states.move_to_end(user_id)
+        if len(self.user_states) > self.MAX_TRACKED_USERS:
+            self.user_states.popitem(last=False)
+    
+    def _current_add_tokens(self, user_id: int, now: float) -> float:
+        """计算用户当前可用的令牌数（按经过时间补充，不超过容量）"""
+        bucket = self.user_add_buckets.get(user_id)
+        if bucket is None:
+            return float(self.MAX_ADDS_PER_HOUR)
+        tokens, last_ts = bucket
+        return min(float(self.MAX_ADDS_PER_HOUR), tokens + (now - last_ts) * self.ADD_REFILL_RATE)
     
     def check_user_add_limit(self, user_id: int) -> tuple[bool, int]:
         """检查用户添加频率限制
@@ -78,25 +437,88 @@ class HandlerManager:
         Returns:
             tuple: (是否可以添加, 剩余次数)
         """
-        current_time = time.time()
-        one_hour_ago = current_time - 3600  # 1小时前的时间戳
+        tokens = self._current_add_tokens(user_id, time.monotonic())
+        return tokens >= 1, int(tokens)
+    
+    def record_user_add(self, user_id: int):
+        """记录用户添加操作，消耗一个令牌"""
+        now = time.monotonic()
+        tokens = max(self._current_add_tokens(user_id, now) - 1, 0.0)
+        is_new = user_id not in self.user_add_buckets
+        self.user_add_buckets[user_id] = (tokens, now)
+        if is_new:
+            if len(self.user_add_buckets) > self.MAX_TRACKED_USERS:
+                self.user_add_buckets.popitem(last=False)
+        else:
+            self.user_add_buckets.move_to_end(user_id)
+    
+    @asynccontextmanager
+    async def _work_slot(self, user_id: int):
+        """获取处理槽位：先按用户排队，再占用全局并发名额"""
+        entry = self._user_work.get(user_id)
+        if entry is None:
+            entry = self._user_work[user_id] = [asyncio.Semaphore(1), 0]
+        entry[1] += 1
+        try:
+            async with entry[0], self._work_sem:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                # 没有等待或执行中的请求，释放该用户的条目
+                del self._user_work[user_id]
+    
+    def sweep_user_data(self):
+        """清理闲置过久的用户状态，以及已经补满的添加令牌桶"""
+        now = time.time()
         
-        # 清理1小时前的记录
-        self.user_add_history[user_id] = [
-            timestamp for timestamp in self.user_add_history[user_id]
-            if timestamp > one_hour_ago
-        ]
+        # 两个字典都按最近活动排序，从最前面开始清理，遇到未过期的条目即停止
+        state_deadline = now - self.USER_STATE_TTL
+        while self.user_states:
+            user_id, user_state = next(iter(self.user_states.items()))
+            if user_state.updated_at > state_deadline:
+                break
+            del self.user_states[user_id]
         
-        # 检查当前小时内的添加次数
-        current_count = len(self.user_add_history[user_id])
-        remaining = self.MAX_ADDS_PER_HOUR - current_count
+        # 令牌桶在1小时内必然补满，补满的条目与不存在等价
+        bucket_deadline = time.monotonic() - 3600
+        while self.user_add_buckets:
+            user_id, (_, last_ts) = next(iter(self.user_add_buckets.items()))
+            if last_ts > bucket_deadline:
+                break
+            del self.user_add_buckets[user_id]
+    
+    async def _sweep_user_data_loop(self):
+        """定期清理用户数据"""
+        while True:
+            await asyncio.sleep(600)
+            try:
+                self.sweep_user_data()
+            except Exception as e:
+                logger.error(f"清理用户数据失败: {e}")
+    
+    async def _get_cached_file_stats(self, file_path: str = None) -> Dict[str, Any]:
+        """获取规则文件统计信息（带短期缓存，并发的未命中请求合并为一次GitHub查询）"""
+        file_path = file_path or self.config.DIRECT_RULE_FILE
+        cached = self._stats_cache.get(file_path)
+        if cached and time.monotonic() - cached[0] < self.STATS_CACHE_TTL:
+            return cached[1]
         
-        return current_count < self.MAX_ADDS_PER_HOUR, remaining
+        lock = self._stats_locks.setdefault(file_path, asyncio.Lock())
+        async with lock:
+            # 等锁期间其他请求可能已刷新缓存
+            cached = self._stats_cache.get(file_path)
+            if cached and time.monotonic() - cached[0] < self.STATS_CACHE_TTL:
+                return cached[1]
+            
+            stats = await self.github_service.get_file_stats(file_path=file_path)
+            if "error" not in stats:
+                self._stats_cache[file_path] = (time.monotonic(), stats)
+            return stats
     
-    def record_user_add(self, user_id: int):
-        """记录用户添加操作"""
-        current_time = time.time()
-        self.user_add_history[user_id].append(current_time)
+    def _invalidate_file_stats(self, file_path: str = None):
+        """规则文件变更后使统计缓存失效"""
+        self._stats_cache.pop(file_path or self.config.DIRECT_RULE_FILE, None)
     
     def validate_description(self, description: str) -> tuple[bool, str]:
         """验证域名说明
@@ -107,32 +529,39 @@ class HandlerManager:
         if not description:
             return True, ""
         
-        # 去除前后空格
+        # 去除前后空格（无需去除时 strip 直接返回原字符串，不会复制）
         description = description.strip()
         
-        # 检查长度
+        # 检查长度（按码点计数，超限时只在拒绝路径上截取一次）
         if len(description) > self.MAX_DESCRIPTION_LENGTH:
             return False, description[:self.MAX_DESCRIPTION_LENGTH]
         
         return True, description
     
-    async def _check_user_permission(self, update: Update) -> bool:
-        """检查用户是否有权限使用机器人"""
+    def _check_user_permission(self, user_id: int) -> bool:
+        """检查用户是否有权限使用机器人（纯内存比较，无需await）"""
         # 如果未配置白名单，则允许所有用户
         if not self.config.REQUIRED_USER_ID:
             return True
-            
-        user_id = update.effective_user.id
         
         # 检查是否匹配白名单ID
-        if str(user_id) != str(self.config.REQUIRED_USER_ID):
-            msg = "⛔ **无权访问**\n\n抱歉，您没有权限使用此机器人。\n仅限特定用户使用。"
-            if update.callback_query:
-                await update.callback_query.answer(text="无权访问", show_alert=True)
-            elif update.message:
-                await update.message.reply_text(msg, parse_mode='Markdown')
+        return user_id == self._required_user_id
+    
+    async def _deny_access(self, update: Update):
+        """回复无权访问提示"""
+        msg = "⛔ **无权访问**\n\n抱歉，您没有权限使用此机器人。\n仅限特定用户使用。"
+        if update.callback_query:
+            await update.callback_query.answer(text="无权访问", show_alert=True)
+        elif update.message:
+            await update.message.reply_text(msg, parse_mode='Markdown')
+    
+    async def _gate(self, update: Update, user_id: int, check_membership: bool = True) -> bool:
+        """统一入口检查：白名单权限 + 群组成员身份（可选）"""
+        if not self._check_user_permission(user_id):
+            await self._deny_access(update)
             return False
-            
+        if check_membership:
+            return await self.check_group_membership(update, user_id)
         return True
 
     def escape_markdown(self, text: str) -> str:
@@ -140,19 +569,13 @@ class HandlerManager:
         if not text:
             return text
         
-        # 转义特殊字符（不包含点号，因为域名和文件路径中需要保留）
-        special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '!']
-        for char in special_chars:
-            text = text.replace(char, f'\\{char}')
-        
-        return text
+        return text.translate(_MARKDOWN_ESCAPE_TABLE)
     
-    async def check_group_membership(self, update: Update) -> bool:
+    async def check_group_membership(self, update: Update, user_id: int) -> bool:
         """检查用户群组成员身份"""
         if not self.group_service or not self.group_service.is_group_check_enabled():
             return True
         
-        user_id = update.effective_user.id
         is_member = await self.group_service.check_user_in_group(user_id)
         
         if not is_member:
@@ -168,46 +591,13 @@ class HandlerManager:
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """处理 /start 命令"""
         try:
-            # 检查用户权限
-            if not await self._check_user_permission(update):
-                return
-
-            # 检查群组成员身份
-            if not await self.check_group_membership(update):
-                return
-            
             user = update.effective_user
-            username = user.first_name or user.username or "用户"
-            
-            welcome_text = f"""
-👋 你好，{username}！
-
-我是 **Rule-Bot**，可以帮你管理 Clash 规则。
-
-📂 **当前管理仓库**
-`{self.config.GITHUB_REPO}`
-
-✨ **我能做什么**
-• 🔍 查询域名是否已在规则中
-• 🌍 检查域名 IP 归属地（支持 DNS 解析）
-• 🤖 智能判断域名是否适合直连
-• 📝 一键添加域名到规则文件
-• 🗑️ 删除已添加的域名规则（暂未开放）
-
-💡 **使用提示**
-直接在聊天框输入域名即可查询，或点击下方按钮操作。
-"""
             
-            keyboard = [
-                [InlineKeyboardButton("🔍 查询域名", callback_data="query_domain")],
-                [InlineKeyboardButton("➕ 添加直连规则", callback_data="add_direct_rule")],
-                [InlineKeyboardButton("➕ 添加代理规则", callback_data="add_proxy_rule")],
-                [InlineKeyboardButton("➖ 删除规则", callback_data="delete_rule")],
-                [InlineKeyboardButton("ℹ️ 帮助信息", callback_data="help")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            # 检查用户权限和群组成员身份
+            if not await self._gate(update, user.id):
+                return
             
-            await update.message.reply_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
+            await self._send_main_menu(user, reply=update.message.reply_text, template=self._welcome_tmpl)
             
             # 重置用户状态
             self.set_user_state(user.id, "idle")
@@ -219,75 +609,41 @@ class HandlerManager:
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """处理 /help 命令"""
         # 检查用户权限
-        if not await self._check_user_permission(update):
+        if not await self._gate(update, update.effective_user.id, check_membership=False):
             return
 
-        help_text = f"""
-📖 *Rule-Bot 使用说明*
-
-📂 *目标仓库：* `{self.config.GITHUB_REPO}`
-📄 *直连规则文件：* `{self.config.DIRECT_RULE_FILE}`
-📄 *代理规则文件：* `{self.config.PROXY_RULE_FILE}`
-
-🔍 *查询域名功能：*
-• 检查域名是否在直连规则中
-• 检查域名是否在 GEOSITE:CN 中
-• 显示域名的 IP 归属地信息
-
-➕ *添加直连/代理规则功能：*
-• 自动检查域名 IP 归属地
-• 检查 NS 服务器归属地
-• 域名检查基于 DoH 和 GeoIP 数据
-• 根据检查结果自动判断是否适合添加
-• 支持添加说明信息
-
-📝 *操作流程：*
-1. 选择功能按钮
-2. 输入域名（支持多种格式）
-3. 查看检查结果
-4. 根据提示进行操作
-
-🛠 *技术特性：*
-• 使用中国境内 EDNS 查询
-• 支持阿里云和腾讯云 DoH
-• 自动更新 GeoIP 和 GeoSite 数据
-
-⚠️ *注意：* 删除规则功能暂未开放。
-"""
-        
-        keyboard = [[InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = _BACK_TO_MENU_KEYBOARD
         
-        await update.message.reply_text(help_text, reply_markup=reply_markup, parse_mode='Markdown')
+        await update.message.reply_text(self._help_text, reply_markup=reply_markup, parse_mode='Markdown')
     
     async def query_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """处理 /query 命令"""
+        user_id = update.effective_user.id
+        
         # 检查用户权限
-        if not await self._check_user_permission(update):
+        if not await self._gate(update, user_id, check_membership=False):
             return
 
-        user_id = update.effective_user.id
         self.set_user_state(user_id, "waiting_query_domain")
         
         # 获取统计信息
         try:
             # 获取GitHub直连规则数量
-            github_stats = await self.github_service.get_file_stats()
+            github_stats = await self._get_cached_file_stats()
             direct_rule_count = github_stats.get("rule_count", 0) if "error" not in github_stats else 0
             
             # 获取GeoSite域名数量
-            geosite_count = len(self.data_manager.geosite_domains)
+            geosite_count = self.data_manager.geosite_count
             
             stats_text = f"📊 *当前统计：*\n• 直连规则数量：{direct_rule_count}\n• GEOSITE:CN 域名数量：{geosite_count:,}\n\n"
         except Exception as e:
             logger.error(f"获取统计信息失败: {e}")
             stats_text = "📊 *统计信息加载中...*\n\n"
         
-        keyboard = [[InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = _BACK_TO_MENU_KEYBOARD
         
         await update.message.reply_text(
-            f"🔍 *域名查询*\n\n📂 *目标仓库：* `{self.config.GITHUB_REPO}`\n📄 *规则文件：* `{self.config.DIRECT_RULE_FILE}`\n\n{stats_text}请输入要查询的域名：\n\n📝 支持格式：\n• example.com\n• www.example.com\n• https://example.com\n• https://www.example.com/path\n• sub.example.com\n• ftp://example.com\n• example.com:8080\n\n💡 *注意：添加规则时统一使用二级域名*",
+            self._query_header + stats_text + _QUERY_PROMPT,
             reply_markup=reply_markup,
             parse_mode='Markdown'
         )
@@ -295,15 +651,10 @@ class HandlerManager:
     async def add_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """处理 /add 命令"""
         # 检查用户权限
-        if not await self._check_user_permission(update):
+        if not await self._gate(update, update.effective_user.id, check_membership=False):
             return
 
-        keyboard = [
-            [InlineKeyboardButton("➕ 添加直连规则", callback_data="add_direct_rule")],
-            [InlineKeyboardButton("➕ 添加代理规则", callback_data="add_proxy_rule")],
-            [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = _ADD_MENU_KEYBOARD
         
         await update.message.reply_text(
             "➕ **添加规则**\n\n请选择要添加的规则类型：",
@@ -313,7 +664,7 @@ class HandlerManager:
     async def delete_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """处理 /delete 命令"""
         # 检查用户权限
-        if not await self._check_user_permission(update):
+        if not await self._gate(update, update.effective_user.id, check_membership=False):
             return
 
         await update.message.reply_text(
@@ -323,44 +674,28 @@ class HandlerManager:
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """处理回调查询"""
         try:
-            # 检查用户权限
-            if not await self._check_user_permission(update):
-                return
-
-            # 检查群组成员身份
-            if not await self.check_group_membership(update):
+            query = update.callback_query
+            user_id = update.effective_user.id
+            
+            # 检查用户权限和群组成员身份
+            if not await self._gate(update, user_id):
                 return
             
-            query = update.callback_query
             await query.answer()
             
-            user_id = update.effective_user.id
             data = query.data
             
-            if data == "main_menu":
-                await self._show_main_menu(query)
-            elif data == "query_domain":
-                await self._start_domain_query(query, user_id)
-            elif data == "add_direct_rule":
-                await self._start_add_direct_rule(query, user_id)
-            elif data == "add_proxy_rule":
-                await self._start_add_proxy_rule(query, user_id)
-            elif data == "delete_rule":
-                await self._show_delete_not_supported(query)
-            elif data == "help":
-                await self._show_help(query)
-            elif data.startswith("add_domain_"):
-                await self._handle_add_domain_callback(query, user_id, data)
-            elif data.startswith("add_proxy_domain_"):
-                await self._handle_add_proxy_domain_callback(query, user_id, data)
-            elif data.startswith("confirm_add_proxy_"):
-                await self._handle_confirm_add_proxy_callback(query, user_id, data)
-            elif data.startswith("confirm_add_"):
-                await self._handle_confirm_add_callback(query, user_id, data)
-            elif data == "skip_description":
-                await self._handle_skip_description(query, user_id)
-            elif data == "skip_description_proxy":
-                await self._handle_skip_description_proxy(query, user_id)
+            # 精确匹配直接查表，其余按前缀依次匹配
+            handler = self._callback_handlers.get(data)
+            if handler is None and data.startswith(_CALLBACK_PREFIXES):
+                for prefix, prefix_handler in self._callback_prefix_handlers:
+                    if data.startswith(prefix):
+                        handler = prefix_handler
+                        break
+            
+            if handler:
+                async with self._work_slot(user_id):
+                    await handler(query, user_id, data)
             else:
                 await query.edit_message_text("未知操作")
                 
@@ -371,114 +706,48 @@ class HandlerManager:
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """处理文本消息"""
         try:
-            # 检查用户权限
-            if not await self._check_user_permission(update):
-                return
-
-            # 检查群组成员身份
-            if not await self.check_group_membership(update):
+            user = update.effective_user
+            user_id = user.id
+            
+            # 检查用户权限和群组成员身份
+            if not await self._gate(update, user_id):
                 return
             
-            user_id = update.effective_user.id
             text = update.message.text.strip()
-            user_state = self.get_user_state(user_id)
             
-            state = user_state.get("state", "idle")
-            
-            if state == "waiting_query_domain":
-                await self._handle_domain_query(update, text, user_id)
-            elif state == "waiting_add_domain":
-                await self._handle_add_domain_input(update, text, user_id)
-            elif state == "waiting_description":
-                await self._handle_description_input(update, text, user_id)
-            elif state == "waiting_add_proxy_domain":
-                await self._handle_add_proxy_domain_input(update, text, user_id)
-            elif state == "waiting_proxy_description":
-                await self._handle_proxy_description_input(update, text, user_id)
-            else:
-                # 尝试作为域名查询处理
-                normalized = normalize_domain(text)
-                if normalized:
+            async with self._work_slot(user_id):
+                # 在用户槽位内读取状态，确保看到该用户上一条更新处理后的状态
+                state = self.get_user_state(user_id).state
+                
+                if state == "waiting_query_domain":
                     await self._handle_domain_query(update, text, user_id)
+                elif state == "waiting_add_domain":
+                    await self._handle_add_domain_input(update, text, user_id)
+                elif state == "waiting_description":
+                    await self._handle_description_input(update, text, user_id)
+                elif state == "waiting_add_proxy_domain":
+                    await self._handle_add_proxy_domain_input(update, text, user_id)
+                elif state == "waiting_proxy_description":
+                    await self._handle_proxy_description_input(update, text, user_id)
                 else:
-                    # 默认处理：显示主菜单
-                    await self._show_main_menu_message(update.message)
+                    # 尝试作为域名查询处理
+                    normalized = normalize_domain(text)
+                    if normalized:
+                        await self._handle_domain_query(update, text, user_id)
+                    else:
+                        # 默认处理：显示主菜单
+                        await self._send_main_menu(user, reply=update.message.reply_text)
                 
         except Exception as e:
             logger.error(f"处理消息失败: {e}")
             await update.message.reply_text("处理失败，请重试。")
     
-    async def _show_main_menu(self, query):
-        """显示主菜单"""
-        username = query.from_user.first_name or query.from_user.username or "用户"
-        
-        welcome_text = f"""
-👋 欢迎使用 Rule-Bot，{username}！
-
-🤖 我是一个专门管理Clash规则的机器人，可以帮助您：
-
-📂 *目标仓库：* `{self.config.GITHUB_REPO}`
-
-📋 *主要功能：*
-• 🔍 查询域名规则状态
-• ➕ 添加直连规则
-• ➖ 删除规则（暂不可用）
-
-🎯 *支持的操作：*
-• 检查域名是否已在规则中
-• 检查域名是否在GEOSITE:CN中
-• DNS 解析和 IP 归属地检查
-• 自动判断添加建议
-
-请选择您要执行的操作：
-"""
-        
-        keyboard = [
-            [InlineKeyboardButton("🔍 查询域名", callback_data="query_domain")],
-            [InlineKeyboardButton("➕ 添加直连规则", callback_data="add_direct_rule")],
-            [InlineKeyboardButton("➕ 添加代理规则", callback_data="add_proxy_rule")],
-            [InlineKeyboardButton("➖ 删除规则", callback_data="delete_rule")],
-            [InlineKeyboardButton("ℹ️ 帮助信息", callback_data="help")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
-    
-    async def _show_main_menu_message(self, message):
-        """通过消息显示主菜单"""
-        username = message.from_user.first_name or message.from_user.username or "用户"
-        
-        welcome_text = f"""
-👋 欢迎使用 Rule-Bot，{username}！
-
-🤖 我是一个专门管理Clash规则的机器人，可以帮助您：
-
-📂 *目标仓库：* `{self.config.GITHUB_REPO}`
-
-📋 *主要功能：*
-• 🔍 查询域名规则状态
-• ➕ 添加直连规则
-• ➖ 删除规则（暂不可用）
-
-🎯 *支持的操作：*
-• 检查域名是否已在规则中
-• 检查域名是否在GEOSITE:CN中
-• DNS解析和IP归属地检查
-• 自动判断添加建议
-
-请选择您要执行的操作：
-"""
-        
-        keyboard = [
-            [InlineKeyboardButton("🔍 查询域名", callback_data="query_domain")],
-            [InlineKeyboardButton("➕ 添加直连规则", callback_data="add_direct_rule")],
-            [InlineKeyboardButton("➕ 添加代理规则", callback_data="add_proxy_rule")],
-            [InlineKeyboardButton("➖ 删除规则", callback_data="delete_rule")],
-            [InlineKeyboardButton("ℹ️ 帮助信息", callback_data="help")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await message.reply_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
+    async def _send_main_menu(self, user, *, edit=None, reply=None, template: str = None):
+        """发送主菜单（edit 为编辑消息的方法，reply 为回复消息的方法，二选一）"""
+        username = user.first_name or user.username or "用户"
+        text = (template or self._main_menu_tmpl).format(username=username)
+        send = edit if edit is not None else reply
+        await send(text, reply_markup=_MAIN_MENU_KEYBOARD, parse_mode='Markdown')
     
     async def _start_domain_query(self, query, user_id: int):
         """开始域名查询"""
@@ -487,22 +756,21 @@ class HandlerManager:
         # 获取统计信息
         try:
             # 获取GitHub直连规则数量
-            github_stats = await self.github_service.get_file_stats()
+            github_stats = await self._get_cached_file_stats()
             direct_rule_count = github_stats.get("rule_count", 0) if "error" not in github_stats else 0
             
             # 获取GeoSite域名数量
-            geosite_count = len(self.data_manager.geosite_domains)
+            geosite_count = self.data_manager.geosite_count
             
             stats_text = f"📊 *当前统计：*\n• 直连规则数量：{direct_rule_count}\n• GEOSITE:CN域名数量：{geosite_count:,}\n\n"
         except Exception as e:
             logger.error(f"获取统计信息失败: {e}")
             stats_text = "📊 *统计信息加载中...*\n\n"
         
-        keyboard = [[InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = _BACK_TO_MENU_KEYBOARD
         
         await query.edit_message_text(
-            f"🔍 *域名查询*\n\n📂 *目标仓库：* `{self.config.GITHUB_REPO}`\n📄 *规则文件：* `{self.config.DIRECT_RULE_FILE}`\n\n{stats_text}请输入要查询的域名：\n\n📝 支持格式：\n• example.com\n• www.example.com\n• https://example.com\n• https://www.example.com/path\n• sub.example.com\n• ftp://example.com\n• example.com:8080\n\n💡 *注意：添加规则时统一使用二级域名*",
+            self._query_header + stats_text + _QUERY_PROMPT,
             reply_markup=reply_markup,
             parse_mode='Markdown'
         )
@@ -517,11 +785,11 @@ class HandlerManager:
         # 获取统计信息
         try:
             # 获取GitHub直连规则数量
-            github_stats = await self.github_service.get_file_stats()
+            github_stats = await self._get_cached_file_stats()
             direct_rule_count = github_stats.get("rule_count", 0) if "error" not in github_stats else 0
             
             # 获取GeoSite域名数量
-            geosite_count = len(self.data_manager.geosite_domains)
+            geosite_count = self.data_manager.geosite_count
             
             stats_text = f"📊 *当前统计：*\n• 直连规则数量：{direct_rule_count}\n• GEOSITE:CN 域名数量：{geosite_count:,}\n\n"
             
@@ -535,11 +803,10 @@ class HandlerManager:
             logger.error(f"获取统计信息失败: {e}")
             stats_text = "📊 *统计信息加载中...*\n\n"
         
-        keyboard = [[InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = _BACK_TO_MENU_KEYBOARD
         
         await query.edit_message_text(
-            f"➕ *添加直连规则*\n\n📂 *目标仓库：* `{self.config.GITHUB_REPO}`\n📄 *规则文件：* `{self.config.DIRECT_RULE_FILE}`\n\n{stats_text}请输入要添加的域名：\n\n📝 支持格式：\n• example.com\n• www.example.com\n• https://example.com\n• https://www.example.com/path\n• sub.example.com\n• ftp://example.com\n• example.com:8080\n\n💡 *注意：系统将自动提取二级域名进行添加*",
+            self._add_direct_header + stats_text + _ADD_PROMPT,
             reply_markup=reply_markup,
             parse_mode='Markdown'
         )
@@ -548,9 +815,9 @@ class HandlerManager:
         self.set_user_state(user_id, "waiting_add_proxy_domain")
         can_add, remaining = self.check_user_add_limit(user_id)
         try:
-            github_stats = await self.github_service.get_file_stats(file_path=self.config.PROXY_RULE_FILE)
+            github_stats = await self._get_cached_file_stats(self.config.PROXY_RULE_FILE)
             proxy_rule_count = github_stats.get("rule_count", 0) if "error" not in github_stats else 0
-            geosite_count = len(self.data_manager.geosite_domains)
+            geosite_count = self.data_manager.geosite_count
             stats_text = f"📊 *当前统计：*\n• 代理规则数量：{proxy_rule_count}\n• GEOSITE:CN 域名数量：{geosite_count:,}\n\n"
             if can_add:
                 stats_text += f"💡 *添加限制：* 本小时内还可添加 {remaining} 个域名\n\n"
@@ -559,18 +826,16 @@ class HandlerManager:
         except Exception as e:
             logger.error(f"获取统计信息失败: {e}")
             stats_text = "📊 *统计信息加载中...*\n\n"
-        keyboard = [[InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = _BACK_TO_MENU_KEYBOARD
         await query.edit_message_text(
-            f"➕ *添加代理规则*\n\n📂 *目标仓库：* `{self.config.GITHUB_REPO}`\n📄 *规则文件：* `{self.config.PROXY_RULE_FILE}`\n\n{stats_text}请输入要添加的域名：\n\n📝 支持格式：\n• example.com\n• www.example.com\n• https://example.com\n• https://www.example.com/path\n• sub.example.com\n• ftp://example.com\n• example.com:8080\n\n💡 *注意：系统将自动提取二级域名进行添加*",
+            self._add_proxy_header + stats_text + _ADD_PROMPT,
             reply_markup=reply_markup,
             parse_mode='Markdown'
         )
     
     async def _show_delete_not_supported(self, query):
         """显示删除功能不支持"""
-        keyboard = [[InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = _BACK_TO_MENU_KEYBOARD
         
         await query.edit_message_text(
             f"➖ *删除规则*\n\n📂 *目标仓库：* `{self.config.GITHUB_REPO}`\n📄 *直连规则文件：* `{self.config.DIRECT_RULE_FILE}`\n📄 *代理规则文件：* `{self.config.PROXY_RULE_FILE}`\n\n⚠️ *删除规则功能暂不可用*\n\n该功能正在开发中，敬请期待。",
@@ -580,38 +845,9 @@ class HandlerManager:
     
     async def _show_help(self, query):
         """显示帮助信息"""
-        help_text = f"""
-📖 *Rule-Bot 使用说明*
-
-📂 *目标仓库：* `{self.config.GITHUB_REPO}`
-📄 *直连规则文件：* `{self.config.DIRECT_RULE_FILE}`
-📄 *代理规则文件：* `{self.config.PROXY_RULE_FILE}`
-
-🔍 *查询域名功能：*
-• 检查域名是否在直连规则中
-• 检查域名是否在 GEOSITE:CN 中
-• 显示域名的 IP 归属地信息
-
-➕ *添加直连/代理规则功能：*
-• 自动检查域名 IP 归属地
-• 检查 NS 服务器归属地
-• 根据检查结果自动判断是否适合添加
-• 域名检查基于 DoH 和 GeoIP 数据
-• 支持添加说明信息
-
-📝 *操作流程：*
-1. 选择功能按钮
-2. 输入域名（支持多种格式）
-3. 查看检查结果
-4. 根据提示进行操作
-
-⚠️ *注意：* 删除规则功能暂未开放。
-"""
+        reply_markup = _BACK_TO_MENU_KEYBOARD
         
-        keyboard = [[InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(help_text, reply_markup=reply_markup, parse_mode='Markdown')
+        await query.edit_message_text(self._help_text, reply_markup=reply_markup, parse_mode='Markdown')
     
     async def _handle_domain_query(self, update: Update, domain_input: str, user_id: int):
         """处理域名查询"""
@@ -619,35 +855,19 @@ class HandlerManager:
             # 发送处理中消息
             processing_msg = await update.message.reply_text("🔍 正在查询域名信息，请稍候...")
             
-            # 标准化域名（查询时使用用户输入的域名）
-            domain = normalize_domain(domain_input)
+            # 标准化域名（查询时使用用户输入的域名），同时获取二级域名用于规则检查
+            domain, is_cn, second_level_for_check = parse_domain_input(domain_input)
             if not domain:
                 await processing_msg.edit_text("❌ 无效的域名格式，请重新输入。")
                 return
             
-            # 同时获取二级域名用于规则检查
-            second_level_for_check = extract_second_level_domain_for_rules(domain_input)
-            
             # 检查是否为.cn域名，如果是则直接返回提示
-            is_cn = is_cn_domain(domain)
             if is_cn:
                 # .cn域名直接显示提示，不进行任何查询操作
-                result_text = f"🔍 *域名查询结果*\n\n📍 *查询域名：* `{domain}`\n\n"
-                result_text += "📋 *.cn域名说明：* 所有.cn域名默认直连，无需手动添加到规则中\n\n"
-                result_text += "💡 *.cn域名包括：*\n"
-                result_text += "   • .cn 顶级域名\n"
-                result_text += "   • .com.cn 二级域名\n"
-                result_text += "   • .net.cn 二级域名\n"
-                result_text += "   • .org.cn 二级域名\n"
-                result_text += "   • 其他所有.cn结尾的域名\n\n"
-                result_text += "✅ *状态：* 域名已默认直连，无需任何操作"
+                result_text = f"🔍 *域名查询结果*\n\n📍 *查询域名：* `{domain}`\n\n" + _CN_QUERY_NOTE
                 
                 # 显示操作按钮（不包含添加按钮）
-                keyboard = [
-                    [InlineKeyboardButton("🔍 重新查询", callback_data="query_domain")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = _REQUERY_KEYBOARD
                 
                 await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
                 
@@ -656,47 +876,48 @@ class HandlerManager:
                 return
             
             # 非.cn域名继续正常查询流程
-            # 查询结果文本
-            result_text = f"🔍 *域名查询结果*\n\n📍 *查询域名：* `{domain}`\n\n"
+            # 查询结果文本，各部分依次追加，最后一次拼接
+            parts = [f"🔍 *域名查询结果*\n\n📍 *查询域名：* `{domain}`\n\n"]
+            
+            # GitHub规则检查和DNS/GeoIP综合检查互不依赖，并发执行
+            github_result, check_result = await asyncio.gather(
+                self.github_service.check_domain_in_rules(domain),
+                self.domain_checker.check_domain_comprehensive(domain)
+            )
             
             # 1. 检查是否在GitHub规则中
-            github_result = await self.github_service.check_domain_in_rules(domain)
             if github_result.get("exists"):
-                result_text += "✅ *GitHub规则状态：* 已存在\n"
-                for match in github_result.get("matches", []):
-                    result_text += f"   • 第{match['line']}行: {match['rule']}\n"
+                parts.append("✅ *GitHub规则状态：* 已存在\n")
+                parts.append(_format_rule_matches(github_result.get("matches", [])))
             else:
-                result_text += "❌ *GitHub 规则状态：* 不存在\n"
+                parts.append("❌ *GitHub 规则状态：* 不存在\n")
             
             # 2. 检查是否在GeoSite中
-            in_geosite = await self.data_manager.is_domain_in_geosite(domain)
+            in_geosite = self.data_manager.is_domain_in_geosite(domain)
             if in_geosite:
-                result_text += "✅ *GEOSITE:CN 状态：* 已存在\n"
+                parts.append("✅ *GEOSITE:CN 状态：* 已存在\n")
             else:
-                result_text += "❌ *GEOSITE:CN 状态：* 不存在\n"
-            
-            # 3. 进行综合域名检查
-            await processing_msg.edit_text("🔍 正在检查域名IP和NS信息...")
-            check_result = await self.domain_checker.check_domain_comprehensive(domain)
+                parts.append("❌ *GEOSITE:CN 状态：* 不存在\n")
             
+            # 3. 综合域名检查结果
             if "error" in check_result:
-                result_text += f"\n❌ *域名检查失败：* {check_result['error']}\n"
+                parts.append(f"\n❌ *域名检查失败：* {check_result['error']}\n")
             else:
-                result_text += "\n📊 *DNS 解析信息：*\n"
+                parts.append("\n📊 *DNS 解析信息：*\n")
                 
                 # 显示IP信息
                 if check_result["domain_ips"]:
-                    result_text += f"   • 域名 IP: {', '.join(check_result['domain_ips'])}\n"
+                    parts.append(f"   • 域名 IP: {', '.join(check_result['domain_ips'])}\n")
                 if check_result["second_level_ips"]:
-                    result_text += f"   • 二级域名 IP: {', '.join(check_result['second_level_ips'])}\n"
+                    parts.append(f"   • 二级域名 IP: {', '.join(check_result['second_level_ips'])}\n")
                 
                 # 显示详细信息
-                if check_result["details"]:
-                    result_text += "\n🌍 *IP 归属地信息：*\n"
-                    for detail in check_result["details"][:8]:  # 限制显示数量
-                        result_text += f"   • {detail}\n"
-                    if len(check_result["details"]) > 8:
-                         result_text += f"   • ... (还有 {len(check_result['details']) - 8} 条记录)\n"
+                details = check_result["details"]
+                if details:
+                    parts.append("\n🌍 *IP 归属地信息：*\n")
+                    parts.extend(f"   • {detail}\n" for detail in details[:8])  # 限制显示数量
+                    if len(details) > 8:
+                        parts.append(f"   • ... (还有 {len(details) - 8} 条记录)\n")
                 
                 # 智能建议逻辑
                 china_total = check_result.get("china_total_count", 0)
@@ -724,21 +945,16 @@ class HandlerManager:
                 
                 # 根据条件显示建议和状态
                 if github_result.get("exists") or in_geosite:
-                    result_text += f"\n✅ *状态：* 域名已在规则中，无需添加\n"
+                    parts.append(f"\n✅ *状态：* 域名已在规则中，无需添加\n")
                 else:
-                    result_text += f"\n💡 *建议：* {recommendation}\n"
+                    parts.append(f"\n💡 *建议：* {recommendation}\n")
                     if explanation:
-                        result_text += f"ℹ️ *说明：* {explanation}\n"
+                        parts.append(f"ℹ️ *说明：* {explanation}\n")
             
-            # 显示操作按钮
-            keyboard = [
-                [InlineKeyboardButton("➕ 添加直连规则", callback_data=f"add_domain_{domain}")],
-                [InlineKeyboardButton("➕ 添加代理规则", callback_data=f"add_proxy_domain_{domain}")],
-                [InlineKeyboardButton("🔍 重新查询", callback_data="query_domain")],
-                [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-            ]
+            result_text = "".join(parts)
             
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            # 显示操作按钮
+            reply_markup = _query_result_keyboard(domain)
             
             await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
             
@@ -749,146 +965,162 @@ class HandlerManager:
             logger.error(f"域名查询失败: {e}")
             await update.message.reply_text("查询失败，请重试。")
     
+    async def _reply_status(self, message, text: str):
+        """回复一条处理中状态消息，并记录其发出时间"""
+        status_msg = await message.reply_text(text)
+        self._record_status_edit(status_msg, time.monotonic())
+        return status_msg
+    
+    async def _edit_status(self, msg, text: str):
+        """更新处理中状态；距上次更新不足 STATUS_EDIT_INTERVAL 时跳过，结果很快就会覆盖它"""
+        now = time.monotonic()
+        last = self._status_edit_ts.get((msg.chat_id, msg.message_id))
+        if last is not None and now - last < STATUS_EDIT_INTERVAL:
+            return
+        self._record_status_edit(msg, now)
+        await msg.edit_text(text)
+    
+    def _record_status_edit(self, msg, now: float):
+        """记录状态消息的更新时间，超出上限时丢弃最早的记录"""
+        key = (msg.chat_id, msg.message_id)
+        self._status_edit_ts.pop(key, None)
+        self._status_edit_ts[key] = now
+        if len(self._status_edit_ts) > MAX_STATUS_MESSAGES:
+            del self._status_edit_ts[next(iter(self._status_edit_ts))]
+    
+    async def _reply_and_reset(self, edit, user_id: int, text: str, reply_markup=None):
+        """编辑提示消息并将用户状态重置为空闲（添加流程中止时使用，edit 为编辑消息的方法）"""
+        if reply_markup is None:
+            await edit(text)
+        else:
+            await edit(text, reply_markup=reply_markup, parse_mode='Markdown')
+        self.set_user_state(user_id, "idle")
+    
+    def _add_limit_text(self) -> str:
+        """添加频率超限提示"""
+        return (
+            "⚠️ **添加频率限制**\n\n"
+            f"您在当前小时内已达到添加上限（{self.MAX_ADDS_PER_HOUR}个域名）。\n\n"
+            "🕐 请等待一小时后再尝试添加新域名。\n\n"
+            "💡 此限制是为了防止系统滥用，感谢您的理解。"
+        )
+    
+    @staticmethod
+    def _existing_rules_text(title: str, domain: str, github_result: Dict[str, Any]) -> str:
+        """域名已存在于规则文件时的提示"""
+        result_text = f"❌ **{title}**\n\n"
+        result_text += f"📍 **域名：** `{domain}`\n\n"
+        result_text += "📋 **找到的规则：**\n"
+        result_text += _format_rule_matches(github_result.get("matches", []))
+        return result_text
+    
+    def _check_result_text(self, domain: str, check_result: Dict[str, Any]) -> str:
+        """域名检查结果的标题和详情部分"""
+        result_text = f"📊 **域名检查结果**\n\n📍 **域名：** `{domain}`\n\n"
+        if check_result["details"]:
+            result_text += "🌍 **检查详情：**\n" + check_result["details_text"]
+        return result_text
+    
+    def _add_success_text(self, add_result: Dict[str, Any], target_domain: str, description: str,
+                          rule_kind: str, remaining: int) -> str:
+        """添加成功提示（rule_kind 为 直连 或 代理）"""
+        parts = [
+            "✅ **域名添加成功！**\n\n",
+            f"📍 **添加的域名：** `{self.escape_markdown(target_domain)}`\n",
+        ]
+        if description:
+            parts.append(f"📝 **说明：** {self.escape_markdown(description)}\n")
+        parts.append(f"📂 **文件路径：** {self.escape_markdown(add_result['file_path'])}\n")
+        if add_result.get('commit_url'):
+            parts.append(f"🔗 **查看提交：** [点击查看]({add_result['commit_url']})\n")
+            parts.append(f"📝 **Commit ID：** `{add_result.get('commit_sha', '')[:8]}`\n")
+        parts.append(f"💬 **提交信息：** `{add_result['commit_message']}`\n\n")
+        parts.append(f"🎉 域名已成功添加到{rule_kind}规则中！\n\n")
+        parts.append(f"💡 **添加限制：** 本小时内还可添加 {remaining} 个域名")
+        return "".join(parts)
+    
+    def _add_failure_text(self, add_result: Dict[str, Any], target_domain: str) -> str:
+        """添加失败提示"""
+        return (
+            "❌ **域名添加失败**\n\n"
+            f"📍 **域名：** `{self.escape_markdown(target_domain)}`\n"
+            f"❌ **错误：** {self.escape_markdown(add_result.get('error', '未知错误'))}"
+        )
+    
     async def _handle_add_domain_input(self, update: Update, domain_input: str, user_id: int):
-        """处理添加域名输入"""
+        """处理添加直连域名输入"""
+        await self._handle_add_domain_input_generic(update, domain_input, user_id, _ADD_KINDS["direct"])
+    
+    async def _handle_add_proxy_domain_input(self, update: Update, domain_input: str, user_id: int):
+        """处理添加代理域名输入"""
+        await self._handle_add_domain_input_generic(update, domain_input, user_id, _ADD_KINDS["proxy"])
+    
+    def _add_decision(self, kind: _AddKind, check_result: Dict[str, Any]) -> Tuple[str, bool]:
+        """根据检查结果给出建议文本，以及是否符合添加条件"""
+        if kind.name == "proxy":
+            acceptable = self.domain_checker.should_add_proxy(check_result)
+            return ("添加到代理规则" if acceptable else "不建议添加到代理规则"), acceptable
+        
+        # should_add_directly 与 should_reject 都不成立时（理论上不会出现）按可添加处理
+        acceptable = (self.domain_checker.should_add_directly(check_result)
+                      or not self.domain_checker.should_reject(check_result))
+        return check_result['recommendation'], acceptable
+    
+    async def _handle_add_domain_input_generic(self, update: Update, domain_input: str, user_id: int,
+                                               kind: _AddKind):
+        """处理添加域名输入，直连与代理共用同一流程"""
         try:
             # 发送处理中消息
-            processing_msg = await update.message.reply_text("🔍 正在检查域名，请稍候...")
+            processing_msg = await self._reply_status(update.message, "🔍 正在检查域名，请稍候...")
             
             # 检查用户添加频率限制
             can_add, remaining = self.check_user_add_limit(user_id)
             if not can_add:
-                keyboard = [
-                    [InlineKeyboardButton("🔍 查询域名", callback_data="query_domain")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await processing_msg.edit_text(
-                    "⚠️ **添加频率限制**\n\n"
-                    f"您在当前小时内已达到添加上限（{self.MAX_ADDS_PER_HOUR}个域名）。\n\n"
-                    "🕐 请等待一小时后再尝试添加新域名。\n\n"
-                    "💡 此限制是为了防止系统滥用，感谢您的理解。",
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown'
-                )
-                # 重置用户状态
-                self.set_user_state(user_id, "idle")
+                await self._reply_and_reset(processing_msg.edit_text, user_id, self._add_limit_text(), _QUERY_KEYBOARD)
                 return
             
+            # 一次解析出标准化域名、.cn标记和用于添加规则的二级域名
+            normalized_input, is_cn, domain = parse_domain_input(domain_input)
+            
             # 检查是否为.cn域名
-            normalized_input = normalize_domain(domain_input)
-            if normalized_input and is_cn_domain(normalized_input):
-                keyboard = [
-                    [InlineKeyboardButton("🔍 查询其他域名", callback_data="query_domain")],
-                    [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_direct_rule")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await processing_msg.edit_text(
-                    "❌ **.cn域名不可添加**\n\n"
-                    "📋 **.cn域名默认直连**：所有.cn结尾的域名都已默认走直连路线，无需手动添加到规则中。\n\n"
-                    "💡 如需添加其他域名，请选择下方操作：",
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown'
-                )
-                # 重置用户状态
-                self.set_user_state(user_id, "idle")
+            if is_cn:
+                await self._reply_and_reset(processing_msg.edit_text, user_id, kind.cn_reject_text, kind.cn_keyboard)
                 return
             
-            # 提取二级域名用于添加规则
-            domain = extract_second_level_domain_for_rules(domain_input)
+            # 二级域名用于添加规则
             if not domain:
-                if normalized_input and is_cn_domain(normalized_input):
-                    keyboard = [
-                        [InlineKeyboardButton("🔍 查询其他域名", callback_data="query_domain")],
-                        [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_direct_rule")],
-                        [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    
-                    await processing_msg.edit_text(
-                        "❌ **.cn域名不可添加**\n\n"
-                        "📋 **.cn域名默认直连**：所有.cn结尾的域名都已默认走直连路线，无需手动添加到规则中。",
-                        reply_markup=reply_markup,
-                        parse_mode='Markdown'
-                    )
-                else:
-                    await processing_msg.edit_text("❌ 无效的域名格式，请重新输入。")
-                # 重置用户状态
-                self.set_user_state(user_id, "idle")
+                await self._reply_and_reset(processing_msg.edit_text, user_id, "❌ 无效的域名格式，请重新输入。")
                 return
             
-            # 显示提取的二级域名信息
-            if domain != normalize_domain(domain_input):
-                await processing_msg.edit_text(f"🔍 已提取二级域名：`{domain}`\n\n正在检查域名状态...")
-                await asyncio.sleep(1)  # 给用户时间看到提取结果
-            
-            # 1. 防重复检查
-            await processing_msg.edit_text("🔍 正在检查域名是否已存在...")
-            
-            # 检查 GitHub 规则
-            github_result = await self.github_service.check_domain_in_rules(domain)
-            second_level = extract_second_level_domain(domain)
-            
-            if github_result.get("exists"):
-                result_text = f"❌ **域名已存在于规则中**\n\n"
-                result_text += f"📍 **域名：** `{domain}`\n\n"
-                result_text += "📋 **找到的规则：**\n"
-                for match in github_result.get("matches", []):
-                    result_text += f"   • 第{match['line']}行: {match['rule']}\n"
-                
-                keyboard = [
-                    [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_direct_rule")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
-                self.set_user_state(user_id, "idle")
-                return
+            # 1. 防重复检查（提取了二级域名时在同一条状态消息中一并提示）
+            if domain != normalized_input:
+                await self._edit_status(processing_msg, f"🔍 已提取二级域名：`{domain}`\n\n正在检查域名是否已存在...")
+            else:
+                await self._edit_status(processing_msg, "🔍 正在检查域名是否已存在...")
             
-            # 检查二级域名规则
-            if second_level and second_level != domain:
-                second_level_result = await self.github_service.check_domain_in_rules(second_level)
-                if second_level_result.get("exists"):
-                    result_text = f"❌ **二级域名已存在于规则中**\n\n"
-                    result_text += f"📍 **输入域名：** `{domain}`\n"
-                    result_text += f"📍 **二级域名：** `{second_level}`\n\n"
-                    result_text += "📋 **找到的规则：**\n"
-                    for match in second_level_result.get("matches", []):
-                        result_text += f"   • 第{match['line']}行: {match['rule']}\n"
-                    
-                    keyboard = [
-                        [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_direct_rule")],
-                        [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    
-                    await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
-                    self.set_user_state(user_id, "idle")
+            # 一次调用检查所有相关规则文件
+            # 规则索引按域名及其各级父域名匹配，已覆盖二级域名上的规则
+            github_results = await self.github_service.check_domain_in_rule_files(
+                domain, [getattr(self.config, attr) for attr, _ in kind.rule_checks]
+            )
+            for (_, title), github_result in zip(kind.rule_checks, github_results):
+                if github_result.get("exists"):
+                    result_text = self._existing_rules_text(title, domain, github_result)
+                    await self._reply_and_reset(processing_msg.edit_text, user_id, result_text, kind.add_other_keyboard)
                     return
             
             # 检查GeoSite
-            in_geosite = await self.data_manager.is_domain_in_geosite(domain)
-            if in_geosite:
-                result_text = f"❌ **域名已存在于GEOSITE:CN中**\n\n"
-                result_text += f"📍 **域名：** `{domain}`\n\n"
-                result_text += "该域名已在GEOSITE:CN规则中，不需要重复添加。"
-                
-                keyboard = [
-                    [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_direct_rule")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
-                self.set_user_state(user_id, "idle")
+            if self.data_manager.is_domain_in_geosite(domain):
+                result_text = (
+                    f"❌ **域名已存在于GEOSITE:CN中**\n\n"
+                    f"📍 **域名：** `{domain}`\n\n"
+                    f"{kind.geosite_note}"
+                )
+                await self._reply_and_reset(processing_msg.edit_text, user_id, result_text, kind.add_other_keyboard)
                 return
             
             # 2. 进行域名检查
-            await processing_msg.edit_text("🔍 正在检查域名IP和NS信息...")
+            await self._edit_status(processing_msg, "🔍 正在检查域名IP和NS信息...")
             check_result = await self.domain_checker.check_domain_comprehensive(domain)
             
             if "error" in check_result:
@@ -896,187 +1128,24 @@ class HandlerManager:
                 return
             
             # 保存检查结果到用户状态
-            self.set_user_state(user_id, "domain_checked", {
-                "domain": domain,
-                "check_result": check_result
-            })
+            self.set_user_state(user_id, kind.checked_state, domain, check_result)
             
-            # 生成检查结果文本
-            result_text = f"📊 **域名检查结果**\n\n"
-            result_text += f"📍 **域名：** `{domain}`\n\n"
-            
-            # 显示详细信息
-            if check_result["details"]:
-                result_text += "🌍 **检查详情：**\n"
-                for detail in check_result["details"]:
-                    result_text += f"   • {detail}\n"
-            
-            result_text += f"\n💡 **建议：** {check_result['recommendation']}\n"
+            # 生成检查结果文本，并根据检查结果决定下一步
+            advice, acceptable = self._add_decision(kind, check_result)
+            result_text = self._check_result_text(domain, check_result)
+            result_text += f"\n💡 **建议：** {advice}\n"
             
-            # 根据检查结果决定下一步
-            keyboard = []
-            
-            if self.domain_checker.should_add_directly(check_result):
-                # 符合条件，提供添加选项
-                keyboard.append([InlineKeyboardButton("✅ 确认添加", callback_data="confirm_add_yes")])
-                keyboard.append([InlineKeyboardButton("❌ 取消添加", callback_data="confirm_add_no")])
-            elif self.domain_checker.should_reject(check_result):
-                # 不符合条件，但允许强制添加
-                result_text += "\n⚠️ **不符合添加条件，建议仔细核对，是否添加到直连规则。**"
-                keyboard.append([InlineKeyboardButton("⚠️ 强制添加", callback_data="confirm_add_yes")])
-                keyboard.append([InlineKeyboardButton("❌ 取消添加", callback_data="confirm_add_no")])
+            if acceptable:
+                reply_markup = kind.confirm_keyboard
             else:
-                # 默认情况（理论上不会到这里）
-                keyboard.append([InlineKeyboardButton("✅ 确认添加", callback_data="confirm_add_yes")])
-                keyboard.append([InlineKeyboardButton("❌ 取消添加", callback_data="confirm_add_no")])
-            
-            keyboard.append([InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")])
+                # 不符合条件，但允许强制添加
+                result_text += f"\n⚠️ **不符合添加条件，建议仔细核对，是否添加到{kind.label}规则。**"
+                reply_markup = kind.force_keyboard
             
-            reply_markup = InlineKeyboardMarkup(keyboard)
             await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
             
         except Exception as e:
-            logger.error(f"添加域名输入处理失败: {e}")
-            await update.message.reply_text("处理失败，请重试。")
-    
-    async def _handle_add_proxy_domain_input(self, update: Update, domain_input: str, user_id: int):
-        try:
-            processing_msg = await update.message.reply_text("🔍 正在检查域名，请稍候...")
-            can_add, remaining = self.check_user_add_limit(user_id)
-            if not can_add:
-                keyboard = [
-                    [InlineKeyboardButton("🔍 查询域名", callback_data="query_domain")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await processing_msg.edit_text(
-                    "⚠️ **添加频率限制**\n\n"
-                    f"您在当前小时内已达到添加上限（{self.MAX_ADDS_PER_HOUR}个域名）。\n\n"
-                    "🕐 请等待一小时后再尝试添加新域名。\n\n"
-                    "💡 此限制是为了防止系统滥用，感谢您的理解。",
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown'
-                )
-                self.set_user_state(user_id, "idle")
-                return
-            normalized_input = normalize_domain(domain_input)
-            if normalized_input and is_cn_domain(normalized_input):
-                keyboard = [
-                    [InlineKeyboardButton("🔍 查询其他域名", callback_data="query_domain")],
-                    [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_proxy_rule")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await processing_msg.edit_text(
-                    "❌ **.cn域名不可添加代理规则**\n\n"
-                    "📋 **.cn域名默认直连**：所有.cn结尾的域名都已默认走直连路线，不应添加到代理规则中。\n\n"
-                    "💡 如需添加其他域名，请选择下方操作：",
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown'
-                )
-                self.set_user_state(user_id, "idle")
-                return
-            domain = extract_second_level_domain_for_rules(domain_input)
-            if not domain:
-                await processing_msg.edit_text("❌ 无效的域名格式，请重新输入。")
-                self.set_user_state(user_id, "idle")
-                return
-            if domain != normalize_domain(domain_input):
-                await processing_msg.edit_text(f"🔍 已提取二级域名：`{domain}`\n\n正在检查域名状态...")
-                await asyncio.sleep(1)
-            await processing_msg.edit_text("🔍 正在检查域名是否已存在...")
-            proxy_github_result = await self.github_service.check_domain_in_rules(domain, file_path=self.config.PROXY_RULE_FILE)
-            direct_github_result = await self.github_service.check_domain_in_rules(domain)
-            second_level = extract_second_level_domain(domain)
-            if proxy_github_result.get("exists"):
-                result_text = f"❌ **域名已存在于代理规则中**\n\n"
-                result_text += f"📍 **域名：** `{domain}`\n\n"
-                result_text += "📋 **找到的规则：**\n"
-                for match in proxy_github_result.get("matches", []):
-                    result_text += f"   • 第{match['line']}行: {match['rule']}\n"
-                keyboard = [
-                    [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_proxy_rule")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
-                self.set_user_state(user_id, "idle")
-                return
-            if direct_github_result.get("exists"):
-                result_text = f"❌ **域名已存在于直连规则中**\n\n"
-                result_text += f"📍 **域名：** `{domain}`\n\n"
-                result_text += "📋 **找到的规则：**\n"
-                for match in direct_github_result.get("matches", []):
-                    result_text += f"   • 第{match['line']}行: {match['rule']}\n"
-                keyboard = [
-                    [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_proxy_rule")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
-                self.set_user_state(user_id, "idle")
-                return
-            if second_level and second_level != domain:
-                proxy_second_level_result = await self.github_service.check_domain_in_rules(second_level, file_path=self.config.PROXY_RULE_FILE)
-                if proxy_second_level_result.get("exists"):
-                    result_text = f"❌ **二级域名已存在于代理规则中**\n\n"
-                    result_text += f"📍 **输入域名：** `{domain}`\n"
-                    result_text += f"📍 **二级域名：** `{second_level}`\n\n"
-                    result_text += "📋 **找到的规则：**\n"
-                    for match in proxy_second_level_result.get("matches", []):
-                        result_text += f"   • 第{match['line']}行: {match['rule']}\n"
-                    keyboard = [
-                        [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_proxy_rule")],
-                        [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
-                    self.set_user_state(user_id, "idle")
-                    return
-            in_geosite = await self.data_manager.is_domain_in_geosite(domain)
-            if in_geosite:
-                result_text = f"❌ **域名已存在于GEOSITE:CN中**\n\n"
-                result_text += f"📍 **域名：** `{domain}`\n\n"
-                result_text += "该域名已在GEOSITE:CN规则中，属于中国域名，不应添加到代理规则。"
-                keyboard = [
-                    [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_proxy_rule")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
-                self.set_user_state(user_id, "idle")
-                return
-            await processing_msg.edit_text("🔍 正在检查域名IP和NS信息...")
-            check_result = await self.domain_checker.check_domain_comprehensive(domain)
-            if "error" in check_result:
-                await processing_msg.edit_text(f"❌ 域名检查失败：{check_result['error']}")
-                return
-            self.set_user_state(user_id, "proxy_domain_checked", {
-                "domain": domain,
-                "check_result": check_result
-            })
-            result_text = f"📊 **域名检查结果**\n\n"
-            result_text += f"📍 **域名：** `{domain}`\n\n"
-            if check_result["details"]:
-                result_text += "🌍 **检查详情：**\n"
-                for detail in check_result["details"]:
-                    result_text += f"   • {detail}\n"
-            china_total = check_result.get("china_total_count", 0)
-            foreign_total = check_result.get("foreign_total_count", 0)
-            result_text += f"\n💡 **建议：** {'添加到代理规则' if self.domain_checker.should_add_proxy(check_result) else '不建议添加到代理规则'}\n"
-            keyboard = []
-            if self.domain_checker.should_add_proxy(check_result):
-                keyboard.append([InlineKeyboardButton("✅ 确认添加", callback_data="confirm_add_proxy_yes")])
-                keyboard.append([InlineKeyboardButton("❌ 取消添加", callback_data="confirm_add_proxy_no")])
-            else:
-                result_text += "\n⚠️ **不符合添加条件，建议仔细核对，是否添加到代理规则。**"
-                keyboard.append([InlineKeyboardButton("⚠️ 强制添加", callback_data="confirm_add_proxy_yes")])
-                keyboard.append([InlineKeyboardButton("❌ 取消添加", callback_data="confirm_add_proxy_no")])
-            keyboard.append([InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")])
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
-        except Exception as e:
-            logger.error(f"添加代理域名输入处理失败: {e}")
+            logger.error(f"添加{kind.label}域名输入处理失败: {e}")
             await update.message.reply_text("处理失败，请重试。")
     
     async def _handle_add_domain_callback(self, query, user_id: int, data: str):
@@ -1092,36 +1161,20 @@ class HandlerManager:
                 return
             
             # 保存检查结果
-            self.set_user_state(user_id, "domain_checked", {
-                "domain": domain,
-                "check_result": check_result
-            })
+            self.set_user_state(user_id, "domain_checked", domain, check_result)
             
             # 生成检查结果文本
-            result_text = f"📊 **域名检查结果**\n\n"
-            result_text += f"📍 **域名：** `{domain}`\n\n"
-            
-            if check_result["details"]:
-                result_text += "🌍 **检查详情：**\n"
-                for detail in check_result["details"]:
-                    result_text += f"   • {detail}\n"
+            result_text = self._check_result_text(domain, check_result)
             
             result_text += f"\n💡 **建议：** {check_result['recommendation']}\n"
             
             # 根据检查结果决定下一步
-            keyboard = []
-            
             if not self.domain_checker.should_reject(check_result):
-                keyboard.append([InlineKeyboardButton("✅ 确认添加", callback_data="confirm_add_yes")])
-                keyboard.append([InlineKeyboardButton("❌ 取消添加", callback_data="confirm_add_no")])
+                reply_markup = _CONFIRM_ADD_KEYBOARD
             else:
                 result_text += "\n⚠️ **不符合添加条件，建议仔细核对，是否添加到直连规则。**"
-                keyboard.append([InlineKeyboardButton("⚠️ 强制添加", callback_data="confirm_add_yes")])
-                keyboard.append([InlineKeyboardButton("❌ 取消添加", callback_data="confirm_add_no")])
-            
-            keyboard.append([InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")])
+                reply_markup = _FORCE_ADD_KEYBOARD
             
-            reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
             
         except Exception as e:
@@ -1135,33 +1188,16 @@ class HandlerManager:
             if "error" in check_result:
                 await query.edit_message_text(f"❌ 域名检查失败：{check_result['error']}")
                 return
-            self.set_user_state(user_id, "proxy_domain_checked", {
-                "domain": domain,
-                "check_result": check_result
-            })
-            result_text = f"📊 **域名检查结果**\n\n"
-            result_text += f"📍 **域名：** `{domain}`\n\n"
-            if check_result["details"]:
-                result_text += "🌍 **检查详情：**\n"
-                for detail in check_result["details"]:
-                    result_text += f"   • {detail}\n"
+            self.set_user_state(user_id, "proxy_domain_checked", domain, check_result)
+            result_text = self._check_result_text(domain, check_result)
             china_total = check_result.get("china_total_count", 0)
             foreign_total = check_result.get("foreign_total_count", 0)
             if self.domain_checker.should_add_proxy(check_result):
                 result_text += f"\n💡 **建议：** 添加到代理规则（海外 IP {foreign_total} > 中国 IP {china_total}）\n"
-                keyboard = [
-                    [InlineKeyboardButton("✅ 确认添加", callback_data="confirm_add_proxy_yes")],
-                    [InlineKeyboardButton("❌ 取消添加", callback_data="confirm_add_proxy_no")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
+                reply_markup = _CONFIRM_ADD_PROXY_KEYBOARD
             else:
                 result_text += f"\n⚠️ **不符合添加条件，建议仔细核对，是否添加到代理规则。**\n"
-                keyboard = [
-                    [InlineKeyboardButton("⚠️ 强制添加", callback_data="confirm_add_proxy_yes")],
-                    [InlineKeyboardButton("❌ 取消添加", callback_data="confirm_add_proxy_no")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = _FORCE_ADD_PROXY_KEYBOARD
             await query.edit_message_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
         except Exception as e:
             logger.error(f"处理添加代理域名回调失败: {e}")
@@ -1172,38 +1208,25 @@ class HandlerManager:
         try:
             if data == "confirm_add_no":
                 # 取消添加
-                keyboard = [
-                    [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_direct_rule")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
+                await self._reply_and_reset(
+                    query.edit_message_text, user_id,
                     "❌ **已取消添加**\n\n您可以重新选择要添加的域名。",
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown'
+                    _ADD_OTHER_DIRECT_KEYBOARD
                 )
-                self.set_user_state(user_id, "idle")
                 return
             
             # 确认添加
             user_state = self.get_user_state(user_id)
-            domain_data = user_state.get("data", {})
+            domain = user_state.domain
             
-            if not domain_data:
-                await query.edit_message_text("❌ 数据丢失，请重新开始。")
-                return
-            
-            domain = domain_data.get("domain")
             if not domain:
-                await query.edit_message_text("❌ 域名数据丢失，请重新开始。")
+                await query.edit_message_text("❌ 数据丢失，请重新开始。")
                 return
             
             # 询问说明
-            self.set_user_state(user_id, "waiting_description", domain_data)
+            self.set_user_state(user_id, "waiting_description", domain, user_state.check_result)
             
-            keyboard = [[InlineKeyboardButton("⏭️ 跳过说明", callback_data="skip_description")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = _SKIP_DESCRIPTION_KEYBOARD
             
             await query.edit_message_text(
                 f"📝 **请输入域名说明**\n\n"
@@ -1221,30 +1244,19 @@ class HandlerManager:
     async def _handle_confirm_add_proxy_callback(self, query, user_id: int, data: str):
         try:
             if data == "confirm_add_proxy_no":
-                keyboard = [
-                    [InlineKeyboardButton("➕ 添加其他域名", callback_data="add_proxy_rule")],
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.edit_message_text(
+                await self._reply_and_reset(
+                    query.edit_message_text, user_id,
                     "❌ **已取消添加**\n\n您可以重新选择要添加的域名。",
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown'
+                    _ADD_OTHER_PROXY_KEYBOARD
                 )
-                self.set_user_state(user_id, "idle")
                 return
             user_state = self.get_user_state(user_id)
-            domain_data = user_state.get("data", {})
-            if not domain_data:
-                await query.edit_message_text("❌ 数据丢失，请重新开始。")
-                return
-            domain = domain_data.get("domain")
+            domain = user_state.domain
             if not domain:
-                await query.edit_message_text("❌ 域名数据丢失，请重新开始。")
+                await query.edit_message_text("❌ 数据丢失，请重新开始。")
                 return
-            self.set_user_state(user_id, "waiting_proxy_description", domain_data)
-            keyboard = [[InlineKeyboardButton("⏭️ 跳过说明", callback_data="skip_description_proxy")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            self.set_user_state(user_id, "waiting_proxy_description", domain, user_state.check_result)
+            reply_markup = _SKIP_DESCRIPTION_PROXY_KEYBOARD
             await query.edit_message_text(
                 f"📝 **请输入域名说明**\n\n"
                 f"📍 **域名：** `{domain}`\n\n"
@@ -1259,10 +1271,10 @@ class HandlerManager:
     
     async def _handle_skip_description(self, query, user_id: int):
         """处理跳过说明"""
-        await self._add_domain_to_github(query, user_id, "")
+        await self._add_domain_to_github(query, user_id, "", _ADD_KINDS["direct"])
     
     async def _handle_skip_description_proxy(self, query, user_id: int):
-        await self._add_domain_to_github_proxy(query, user_id, "")
+        await self._add_domain_to_github(query, user_id, "", _ADD_KINDS["proxy"])
     
     async def _handle_description_input(self, update: Update, description: str, user_id: int):
         """处理说明输入"""
@@ -1271,10 +1283,7 @@ class HandlerManager:
             is_valid, processed_description = self.validate_description(description)
             
             if not is_valid:
-                keyboard = [
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = _BACK_TO_MENU_KEYBOARD
                 
                 await update.message.reply_text(
                     f"❌ **说明内容超出限制**\n\n"
@@ -1287,7 +1296,7 @@ class HandlerManager:
                 )
                 return
             
-            await self._add_domain_to_github_message(update.message, user_id, processed_description)
+            await self._add_domain_to_github_message(update.message, user_id, processed_description, _ADD_KINDS["direct"])
             
         except Exception as e:
             logger.error(f"处理说明输入失败: {e}")
@@ -1297,10 +1306,7 @@ class HandlerManager:
         try:
             is_valid, processed_description = self.validate_description(description)
             if not is_valid:
-                keyboard = [
-                    [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = _BACK_TO_MENU_KEYBOARD
                 await update.message.reply_text(
                     f"❌ **说明内容超出限制**\n\n"
                     f"📏 **限制：** 最多 {self.MAX_DESCRIPTION_LENGTH} 个字符\n"
@@ -1311,233 +1317,97 @@ class HandlerManager:
                     parse_mode='Markdown'
                 )
                 return
-            await self._add_domain_to_github_message_proxy(update.message, user_id, processed_description)
+            await self._add_domain_to_github_message(update.message, user_id, processed_description, _ADD_KINDS["proxy"])
         except Exception as e:
             logger.error(f"处理代理说明输入失败: {e}")
             await update.message.reply_text("处理失败，请重试。")
     
-    async def _add_domain_to_github(self, query, user_id: int, description: str):
-        """添加域名到GitHub"""
+    async def _add_domain_to_github(self, query, user_id: int, description: str, kind: _AddKind):
+        """通过回调添加域名到GitHub（在原消息上显示进度和结果）"""
+        async def show_status(text: str):
+            await query.edit_message_text(text)
+            return query.edit_message_text
+        
+        await self._submit_domain(user_id, description, query.from_user, show_status, query.edit_message_text, kind)
+    
+    async def _add_domain_to_github_message(self, message, user_id: int, description: str, kind: _AddKind):
+        """通过消息添加域名到GitHub（回复一条新消息显示进度和结果）"""
+        async def show_status(text: str):
+            processing_msg = await message.reply_text(text)
+            return processing_msg.edit_text
+        
+        await self._submit_domain(user_id, description, message.from_user, show_status, message.reply_text, kind)
+    
+    async def _submit_domain(self, user_id: int, description: str, from_user, show_status, reply_error,
+                             kind: _AddKind):
+        """把用户状态中待添加的域名提交到对应的规则文件
+        
+        show_status 显示进度并返回用于展示最终结果的编辑方法，reply_error 用于提示错误
+        """
         try:
             user_state = self.get_user_state(user_id)
-            domain_data = user_state.get("data", {})
-            
-            domain = domain_data.get("domain")
-            check_result = domain_data.get("check_result")
+            domain = user_state.domain
+            check_result = user_state.check_result
             
             if not domain or not check_result:
-                await query.edit_message_text("❌ 数据丢失，请重新开始。")
+                await reply_error("❌ 数据丢失，请重新开始。")
                 return
             
             # 获取要添加的目标域名
-            logger.debug(f"准备获取目标域名，check_result: {check_result}")
-            target_domain = self.domain_checker.get_target_domain_to_add(check_result)
+            logger.debug("准备获取目标域名，check_result: {}", check_result)
+            target_domain = getattr(self.domain_checker, kind.target_method)(check_result)
             if not target_domain:
                 target_domain = domain
                 logger.warning(f"无法获取目标域名，使用原始域名: {domain}")
             
             # 获取用户名
-            username = query.from_user.first_name or query.from_user.username or str(query.from_user.id)
-            
-            logger.debug(f"最终目标域名: {target_domain}, 用户名: {username}, 描述: {description}")
-            
-            # 显示添加中消息
-            await query.edit_message_text("⏳ 正在添加域名到GitHub规则...")
-            
-            # 添加到GitHub
-            add_result = await self.github_service.add_domain_to_rules(
-                target_domain, username, description
-            )
-            
+            username = from_user.first_name or from_user.username or str(from_user.id)
+            
+            logger.debug("最终目标域名: {}, 用户名: {}, 描述: {}", target_domain, username, description)
+            
+            # 先开始提交，在 ADD_STATUS_DELAY 内完成时直接展示结果，否则显示添加中消息，与提交同时进行
+            file_path = getattr(self.config, kind.rule_file_attr)
+            add_task = asyncio.create_task(self.github_service.add_domain_to_rules(
+                target_domain, username, description, file_path=file_path
+            ))
+            done, _ = await asyncio.wait({add_task}, timeout=ADD_STATUS_DELAY)
+            status_task = None if done else asyncio.create_task(show_status("⏳ 正在添加域名到GitHub规则..."))
+            try:
+                add_result = await add_task
+            except BaseException:
+                if status_task:
+                    status_task.cancel()
+                raise
+            
+            # 提交结果的记录先于任何 Telegram 消息发送，发送失败不影响已完成的添加
             if add_result.get("success"):
-                # 记录用户添加历史
+                self._invalidate_file_stats(file_path)
+                # 消耗用户添加令牌
                 self.record_user_add(user_id)
                 
                 # 获取剩余添加次数
                 _, remaining = self.check_user_add_limit(user_id)
                 
-                result_text = f"✅ **域名添加成功！**\n\n"
-                result_text += f"📍 **添加的域名：** `{self.escape_markdown(target_domain)}`\n"
-                if description:
-                    result_text += f"📝 **说明：** {self.escape_markdown(description)}\n"
-                result_text += f"📂 **文件路径：** {self.escape_markdown(add_result['file_path'])}\n"
-                if add_result.get('commit_url'):
-                    result_text += f"🔗 **查看提交：** [点击查看]({add_result['commit_url']})\n"
-                    result_text += f"📝 **Commit ID：** `{add_result.get('commit_sha', '')[:8]}`\n"
-                result_text += f"💬 **提交信息：** `{add_result['commit_message']}`\n\n"
-                result_text += "🎉 域名已成功添加到直连规则中！\n\n"
-                result_text += f"💡 **添加限制：** 本小时内还可添加 {remaining} 个域名"
+                result_text = self._add_success_text(add_result, target_domain, description, kind.label, remaining)
             else:
-                result_text = f"❌ **域名添加失败**\n\n"
-                result_text += f"📍 **域名：** `{self.escape_markdown(target_domain)}`\n"
-                result_text += f"❌ **错误：** {self.escape_markdown(add_result.get('error', '未知错误'))}"
-            
-            keyboard = [
-                [InlineKeyboardButton("➕ 继续添加", callback_data="add_direct_rule")],
-                [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
+                result_text = self._add_failure_text(add_result, target_domain)
             
             # 重置用户状态
             self.set_user_state(user_id, "idle")
             
-        except Exception as e:
-            logger.error(f"添加域名到GitHub失败: {e}")
-            await query.edit_message_text("添加失败，请重试。")
-    
-    async def _add_domain_to_github_proxy(self, query, user_id: int, description: str):
-        try:
-            user_state = self.get_user_state(user_id)
-            domain_data = user_state.get("data", {})
-            domain = domain_data.get("domain")
-            check_result = domain_data.get("check_result")
-            if not domain or not check_result:
-                await query.edit_message_text("❌ 数据丢失，请重新开始。")
-                return
-            target_domain = self.domain_checker.get_target_domain_to_add_proxy(check_result) or domain
-            username = query.from_user.first_name or query.from_user.username or str(query.from_user.id)
-            await query.edit_message_text("⏳ 正在添加域名到GitHub规则...")
-            add_result = await self.github_service.add_domain_to_rules(
-                target_domain, username, description, file_path=self.config.PROXY_RULE_FILE
-            )
-            if add_result.get("success"):
-                self.record_user_add(user_id)
-                _, remaining = self.check_user_add_limit(user_id)
-                result_text = f"✅ **域名添加成功！**\n\n"
-                result_text += f"📍 **添加的域名：** `{self.escape_markdown(target_domain)}`\n"
-                if description:
-                    result_text += f"📝 **说明：** {self.escape_markdown(description)}\n"
-                result_text += f"📂 **文件路径：** {self.escape_markdown(add_result['file_path'])}\n"
-                if add_result.get('commit_url'):
-                    result_text += f"🔗 **查看提交：** [点击查看]({add_result['commit_url']})\n"
-                    result_text += f"📝 **Commit ID：** `{add_result.get('commit_sha', '')[:8]}`\n"
-                result_text += f"💬 **提交信息：** `{add_result['commit_message']}`\n\n"
-                result_text += "🎉 域名已成功添加到代理规则中！\n\n"
-                result_text += f"💡 **添加限制：** 本小时内还可添加 {remaining} 个域名"
-            else:
-                result_text = f"❌ **域名添加失败**\n\n"
-                result_text += f"📍 **域名：** `{self.escape_markdown(target_domain)}`\n"
-                result_text += f"❌ **错误：** {self.escape_markdown(add_result.get('error', '未知错误'))}"
-            keyboard = [
-                [InlineKeyboardButton("➕ 继续添加", callback_data="add_proxy_rule")],
-                [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
-            self.set_user_state(user_id, "idle")
-        except Exception as e:
-            logger.error(f"添加域名到GitHub代理规则失败: {e}")
-            await query.edit_message_text("添加失败，请重试。")
-    
-    async def _add_domain_to_github_message(self, message, user_id: int, description: str):
-        """通过消息添加域名到GitHub"""
-        try:
-            user_state = self.get_user_state(user_id)
-            domain_data = user_state.get("data", {})
-            
-            domain = domain_data.get("domain")
-            check_result = domain_data.get("check_result")
-            
-            if not domain or not check_result:
-                await message.reply_text("❌ 数据丢失，请重新开始。")
-                return
+            # 最终结果须在状态消息之后展示；状态消息发送失败时直接发送结果
+            edit = reply_error
+            if status_task:
+                try:
+                    edit = await status_task
+                except Exception as e:
+                    logger.warning(f"发送添加中消息失败: {e}")
             
-            # 获取要添加的目标域名
-            target_domain = self.domain_checker.get_target_domain_to_add(check_result)
-            if not target_domain:
-                target_domain = domain
-            
-            # 显示添加中消息
-            processing_msg = await message.reply_text("⏳ 正在添加域名到GitHub规则...")
-            
-            # 添加到GitHub
-            username = message.from_user.first_name or message.from_user.username or str(message.from_user.id)
-            add_result = await self.github_service.add_domain_to_rules(
-                target_domain, username, description
-            )
-            
-            if add_result.get("success"):
-                # 记录用户添加历史
-                self.record_user_add(user_id)
-                
-                # 获取剩余添加次数
-                _, remaining = self.check_user_add_limit(user_id)
-                
-                result_text = f"✅ **域名添加成功！**\n\n"
-                result_text += f"📍 **添加的域名：** `{self.escape_markdown(target_domain)}`\n"
-                if description:
-                    result_text += f"📝 **说明：** {self.escape_markdown(description)}\n"
-                result_text += f"📂 **文件路径：** {self.escape_markdown(add_result['file_path'])}\n"
-                if add_result.get('commit_url'):
-                    result_text += f"🔗 **查看提交：** [点击查看]({add_result['commit_url']})\n"
-                    result_text += f"📝 **Commit ID：** `{add_result.get('commit_sha', '')[:8]}`\n"
-                result_text += f"💬 **提交信息：** `{add_result['commit_message']}`\n\n"
-                result_text += "🎉 域名已成功添加到直连规则中！\n\n"
-                result_text += f"💡 **添加限制：** 本小时内还可添加 {remaining} 个域名"
-            else:
-                result_text = f"❌ **域名添加失败**\n\n"
-                result_text += f"📍 **域名：** `{self.escape_markdown(target_domain)}`\n"
-                result_text += f"❌ **错误：** {self.escape_markdown(add_result.get('error', '未知错误'))}"
-            
-            keyboard = [
-                [InlineKeyboardButton("➕ 继续添加", callback_data="add_direct_rule")],
-                [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
-            
-            # 重置用户状态
-            self.set_user_state(user_id, "idle")
+            try:
+                await edit(result_text, reply_markup=kind.continue_keyboard, parse_mode='Markdown')
+            except Exception as e:
+                logger.error(f"发送添加结果失败（域名 {target_domain} 添加{'成功' if add_result.get('success') else '失败'}）: {e}")
             
         except Exception as e:
-            logger.error(f"添加域名到GitHub失败: {e}")
-            await message.reply_text("添加失败，请重试。")
-    
-    async def _add_domain_to_github_message_proxy(self, message, user_id: int, description: str):
-        try:
-            user_state = self.get_user_state(user_id)
-            domain_data = user_state.get("data", {})
-            domain = domain_data.get("domain")
-            check_result = domain_data.get("check_result")
-            if not domain or not check_result:
-                await message.reply_text("❌ 数据丢失，请重新开始。")
-                return
-            target_domain = self.domain_checker.get_target_domain_to_add_proxy(check_result) or domain
-            processing_msg = await message.reply_text("⏳ 正在添加域名到GitHub规则...")
-            username = message.from_user.first_name or message.from_user.username or str(message.from_user.id)
-            add_result = await self.github_service.add_domain_to_rules(
-                target_domain, username, description, file_path=self.config.PROXY_RULE_FILE
-            )
-            if add_result.get("success"):
-                self.record_user_add(user_id)
-                _, remaining = self.check_user_add_limit(user_id)
-                result_text = f"✅ **域名添加成功！**\n\n"
-                result_text += f"📍 **添加的域名：** `{self.escape_markdown(target_domain)}`\n"
-                if description:
-                    result_text += f"📝 **说明：** {self.escape_markdown(description)}\n"
-                result_text += f"📂 **文件路径：** {self.escape_markdown(add_result['file_path'])}\n"
-                if add_result.get('commit_url'):
-                    result_text += f"🔗 **查看提交：** [点击查看]({add_result['commit_url']})\n"
-                    result_text += f"📝 **Commit ID：** `{add_result.get('commit_sha', '')[:8]}`\n"
-                result_text += f"💬 **提交信息：** `{add_result['commit_message']}`\n\n"
-                result_text += "🎉 域名已成功添加到代理规则中！\n\n"
-                result_text += f"💡 **添加限制：** 本小时内还可添加 {remaining} 个域名"
-            else:
-                result_text = f"❌ **域名添加失败**\n\n"
-                result_text += f"📍 **域名：** `{self.escape_markdown(target_domain)}`\n"
-                result_text += f"❌ **错误：** {self.escape_markdown(add_result.get('error', '未知错误'))}"
-            keyboard = [
-                [InlineKeyboardButton("➕ 继续添加", callback_data="add_proxy_rule")],
-                [InlineKeyboardButton("🏠 返回主菜单", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await processing_msg.edit_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
-            self.set_user_state(user_id, "idle")
-        except Exception as e:
-            logger.error(f"添加域名到GitHub代理规则失败: {e}")
-            await message.reply_text("添加失败，请重试。")
-
- 
+            logger.error(f"添加域名到GitHub{kind.label}规则失败: {e}")
+            await reply_error("添加失败，请重试。")
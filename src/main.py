@@ -5,16 +5,31 @@ Telegram机器人用于管理GitHub规则文件
 """
 
 import asyncio
-import os
 import sys
 import resource
-import psutil
 import time
 from loguru import logger
 
 from .bot import RuleBot
 from .config import Config
 from .data_manager import DataManager
+from .utils import event_loop
+
+# 内存页大小，用于把 /proc/self/statm 中的页数换算为字节
+_PAGE_SIZE = resource.getpagesize()
+
+
+def get_rss_bytes() -> int:
+    """当前进程的常驻内存（字节）
+    
+    Linux 上直接读取 /proc/self/statm，无需加载 psutil；其他平台退回 psutil
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (FileNotFoundError, PermissionError):
+        import psutil
+        return psutil.Process().memory_info().rss
 
 
 def set_memory_limit():
@@ -28,8 +43,7 @@ def set_memory_limit():
         
         # 记录当前内存使用情况
         try:
-            process = psutil.Process()
-            current_memory = process.memory_info().rss
+            current_memory = get_rss_bytes()
             logger.info(f"当前内存使用: {current_memory / 1024 / 1024:.1f}MB")
         except Exception as e:
             logger.warning(f"获取当前内存使用失败: {e}")
@@ -48,9 +62,7 @@ def log_memory_usage():
         log_memory_usage._initialized = True
     
     try:
-        process = psutil.Process()
-        memory_info = process.memory_info()
-        memory_mb = memory_info.rss / 1024 / 1024
+        memory_mb = get_rss_bytes() / 1024 / 1024
         
         # 边界检查，确保内存值合理
         if memory_mb < 0 or memory_mb > 1000:  # 如果内存值异常，记录但不处理
@@ -90,6 +102,12 @@ def log_memory_usage():
     except Exception as e:
         logger.warning(f"获取内存使用情况失败: {e}")
 
+async def memory_monitor():
+    """定期检查内存使用（每10分钟一次），作为机器人事件循环中的任务运行"""
+    while True:
+        await asyncio.sleep(600)
+        log_memory_usage()
+
 def main():
     """主程序入口"""
     try:
@@ -104,19 +122,30 @@ def main():
         logger.add(
             sys.stderr,
             level=config.LOG_LEVEL,
-            format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+            format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
+            # 日志写入交给后台线程，避免在事件循环中同步写stderr
+            enqueue=True,
+            # 生产环境不需要展开异常栈中的变量值，减少异常路径上的开销
+            backtrace=False,
+            diagnose=False
         )
         # 日志只输出到stderr，不需要文件持久化
         
         logger.info("Rule-Bot 正在启动...")
+        if event_loop.UVLOOP_AVAILABLE:
+            logger.info("使用 uvloop 事件循环")
         
         # 初始化数据管理器（在新的事件循环中）
         async def init_data():
             data_manager = DataManager(config)
-            await data_manager.initialize()
+            try:
+                await data_manager.initialize()
+            finally:
+                # 该事件循环结束后Session不可再用，初始化完成即释放
+                await data_manager.close()
             return data_manager
         
-        data_manager = asyncio.run(init_data())
+        data_manager = event_loop.run(init_data())
         
         # 记录数据加载后的内存使用
         log_memory_usage()
@@ -127,22 +156,8 @@ def main():
         # 启动机器人
         logger.info("启动Telegram机器人...")
         
-        # 启动定期内存检查（每10分钟检查一次）
-        import threading
-        
-        def memory_monitor():
-            while True:
-                try:
-                    time.sleep(600)  # 10分钟
-                    log_memory_usage()
-                except Exception as e:
-                    logger.warning(f"内存监控出错: {e}")
-                    time.sleep(60)  # 出错后等待1分钟再继续
-        
-        monitor_thread = threading.Thread(target=memory_monitor, daemon=True)
-        monitor_thread.start()
-        
-        bot.start()
+        # 随机器人一起启动定期内存检查，不再单独占用一个线程
+        bot.start(background_jobs=(memory_monitor,))
         
     except KeyboardInterrupt:
         logger.info("收到停止信号，正在关闭...")
@@ -6,74 +6,252 @@ DNS服务模块
 import aiohttp
 import asyncio
 import base64
+import contextlib
+import importlib.util
+import random
 import struct
 import socket
-from typing import List, Optional, Dict, Any
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Tuple, Union
 from loguru import logger
 
+# aiohttp 的 AsyncResolver 依赖 aiodns，只需确认其已安装
+AIODNS_AVAILABLE = importlib.util.find_spec("aiodns") is not None
+if AIODNS_AVAILABLE:
+    from aiohttp.resolver import AsyncResolver
+
+# DoH服务器配置：{名称: URL} 字典，或 (名称, URL) 元组序列
+DoHServers = Union[Dict[str, str], Iterable[Tuple[str, str]]]
+
+
+def _as_server_tuple(servers: DoHServers) -> Tuple[Tuple[str, str], ...]:
+    """将DoH服务器配置统一转换为 (名称, URL) 元组"""
+    if isinstance(servers, dict):
+        return tuple(servers.items())
+    return tuple(servers)
+
+
+# 查询包缓存大小，同一域名的检查会多次查询（A记录、NS记录）
+DNS_QUERY_CACHE_SIZE = 4096
+# 查询结果缓存：A记录和NS记录的有效期（秒），以及每种记录最多缓存的域名数
+A_RECORD_CACHE_TTL = 300
+NS_RECORD_CACHE_TTL = 3600
+# 所有查询方式都失败的结果也短期缓存，避免用户反复重试时每次都等待全部服务器超时
+NEGATIVE_CACHE_TTL = 30
+DNS_RESULT_CACHE_SIZE = 2048
+# 启动时用于预热DoH连接的查询域名
+WARMUP_DOMAIN = "example.com"
+
+# DNS头部 (12字节)：ID、标准查询、1个问题，以及是否带1条附加记录（EDNS OPT）
+# DoH 的请求与响应由 HTTP 一一对应，按 RFC 8484 建议 ID 固定为 0，相同查询可被 HTTP 缓存命中
+_DNS_HEADER = struct.pack('!HHHHHH', 0, 0x0100, 1, 0, 0, 0)
+_DNS_HEADER_EDNS = struct.pack('!HHHHHH', 0, 0x0100, 1, 0, 0, 1)
+
+# 解析时逐条使用的结构预先编译：问题数与答案数（头部偏移4处）、资源记录的 Type, Class, TTL, RDLength
+_HEADER_COUNTS = struct.Struct('!HH')
+_RR_HEADER = struct.Struct('!HHIH')
+# 问题部分末尾的 Type, Class
+_QUESTION_TAIL = struct.Struct('!HH')
+
+# EDNS OPT记录，带ECS (EDNS Client Subnet, RFC 7871) 选项以模拟中国境内查询，内容固定
+_ECS_CN_SUFFIX = (
+    b'\x00'  # Name (root)
+    + struct.pack('!HHIH', 41, 4096, 0, 11)  # Type OPT, UDP payload size, Extended RCODE and flags (TTL), RDLEN
+    + struct.pack('!HHH', 8, 7, 1)  # Option code (ECS), Option length, Family (IPv4)
+    + struct.pack('!BB', 24, 0)  # Source netmask, Scope netmask
+    + struct.pack('!BBB', 219, 0, 0)  # 使用中国的IP段 (例如: 219.0.0.0/24)
+)
+
+
+@lru_cache(maxsize=DNS_QUERY_CACHE_SIZE)
+def _build_dns_query_cached(domain: str, use_edns_china: bool, record_type: int) -> Tuple[bytes, str]:
+    """构建DNS查询数据包，返回 (报文, DoH GET 参数使用的 base64url 编码)
+    
+    结果只取决于参数，按参数缓存，各服务器和每次重试都复用同一编码
+    """
+    # 构建查询部分：整体编码一次，再按标签加上长度前缀
+    query = b''.join(bytes((len(label),)) + label for label in domain.encode('ascii').split(b'.'))
+    query += b'\x00' + _QUESTION_TAIL.pack(record_type, 1)  # 结束标志，Type A/NS, Class IN
+    
+    wire = _DNS_HEADER_EDNS + query + _ECS_CN_SUFFIX if use_edns_china else _DNS_HEADER + query
+    return wire, base64.urlsafe_b64encode(wire).rstrip(b'=').decode()
+
+
+def _skip_name(data: bytes, offset: int) -> int:
+    """跳过报文中的一个域名，返回其后的偏移
+    
+    域名由若干标签组成，以0结束，或以压缩指针（2字节）结束，例如 CNAME 链中常见的 "cdn" + 指针
+    """
+    data_len = len(data)
+    while offset < data_len:
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:  # 压缩指针
+            return offset + 2
+        offset += length + 1
+    return offset
+
+
+def _iter_answers(data: bytes) -> Iterator[Tuple[int, int, int]]:
+    """遍历DNS响应的答案部分，依次产出 (记录类型, 记录数据偏移, 记录数据长度)"""
+    if len(data) < 12:
+        return
+    # 解析头部（unpack_from 直接按偏移读取，不复制切片）
+    question_count, answer_count = _HEADER_COUNTS.unpack_from(data, 4)
+    
+    # 跳过查询部分：名称 + Type和Class
+    offset = 12
+    for _ in range(question_count):
+        offset = _skip_name(data, offset) + 4
+    
+    data_len = len(data)
+    for _ in range(answer_count):
+        offset = _skip_name(data, offset)
+        if offset + _RR_HEADER.size > data_len:
+            return
+        # 读取Type, Class, TTL, RDLength
+        rr_type, _, _, rd_length = _RR_HEADER.unpack_from(data, offset)
+        offset += _RR_HEADER.size
+        if offset + rd_length > data_len:
+            return
+        yield rr_type, offset, rd_length
+        offset += rd_length
+
 
 class DNSService:
     """DNS服务"""
     
-    def __init__(self, doh_servers: Dict[str, str], ns_doh_servers: Dict[str, str] = None):
-        self.doh_servers = doh_servers
-        self.ns_doh_servers = ns_doh_servers or doh_servers
+    def __init__(self, doh_servers: DoHServers, ns_doh_servers: Optional[DoHServers] = None,
+                 max_retries: int = 2, retry_base_delay: float = 0.2, retry_jitter: float = 0.3,
+                 a_record_ttl: float = A_RECORD_CACHE_TTL, ns_record_ttl: float = NS_RECORD_CACHE_TTL,
+                 warm_up: bool = False):
+        self.doh_servers = _as_server_tuple(doh_servers)
+        self.ns_doh_servers = _as_server_tuple(ns_doh_servers) if ns_doh_servers else self.doh_servers
+        # 单个服务器的重试：第 n 次重试前等待 retry_base_delay * 2**n 加上 [0, retry_jitter) 的随机抖动，
+        # 避免大量并发查询在同一时刻集中重试
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_jitter = retry_jitter
         self.session: Optional[aiohttp.ClientSession] = None
+        # 查询结果缓存 {查询键: (过期时间, 结果)}，以及正在进行的查询 {查询键: Task}
+        self.a_record_ttl = a_record_ttl
+        self.ns_record_ttl = ns_record_ttl
+        self._a_cache: "OrderedDict[Tuple[str, bool], Tuple[float, List[str]]]" = OrderedDict()
+        self._ns_cache: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        # 启动时是否预热DoH连接（会向每个服务器发出请求，默认关闭）
+        self.warm_up = warm_up
+        self._warmup_task: Optional[asyncio.Task] = None
         
     async def start(self):
-        """启动DNS服务，初始化共享Session"""
+        """启动DNS服务，初始化共享Session，开启预热时在后台预热到各DoH服务器的连接"""
+        await self._ensure_session()
+        if self.warm_up and (self._warmup_task is None or self._warmup_task.done()):
+            self._warmup_task = asyncio.create_task(self._warm_up())
+    
+    async def _warm_up(self):
+        """向每个DoH服务器发送一次查询，建立好TCP/TLS连接放入连接池，首个真实查询无需再握手"""
+        session = await self._ensure_session()
+        _, encoded_query = self._build_dns_query(WARMUP_DOMAIN, use_edns_china=False)
+        urls = {url for _, url in self.doh_servers + self.ns_doh_servers}
+        
+        async def warm(url: str):
+            async with session.get(
+                f"{url}?dns={encoded_query}",
+                headers={'Accept': 'application/dns-message'},
+                timeout=aiohttp.ClientTimeout(total=5),
+            ) as response:
+                await response.read()
+        
+        results = await asyncio.gather(*(warm(url) for url in urls), return_exceptions=True)
+        failed = sum(isinstance(r, Exception) for r in results)
+        logger.debug("DoH连接预热完成: {}/{} 个服务器成功", len(urls) - failed, len(urls))
+    
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        """返回共享Session，未创建或已关闭时重新创建（所有查询复用同一连接池）"""
         if not self.session or self.session.closed:
             connector = aiohttp.TCPConnector(
+                # 已安装 aiodns 时用 c-ares 异步解析DoH服务器主机名，不占用线程池执行阻塞的 getaddrinfo
+                resolver=AsyncResolver() if AIODNS_AVAILABLE else None,
                 limit=100,  # 增加连接限制 
                 limit_per_host=10,
                 ttl_dns_cache=300,
                 use_dns_cache=True,
+                keepalive_timeout=75,  # 域名检查往往间隔数十秒，保持连接以免重复握手
                 ssl=False
             )
             self.session = aiohttp.ClientSession(connector=connector)
             logger.info("DNS服务已启动，Session已初始化")
+        return self.session
 
     async def close(self):
         """关闭DNS服务"""
+        if self._warmup_task and not self._warmup_task.done():
+            self._warmup_task.cancel()
+            # 等预热请求真正结束后再关闭Session
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._warmup_task
+        self._warmup_task = None
         if self.session and not self.session.closed:
             await self.session.close()
             logger.info("DNS服务已关闭，Session已释放")
     
+    @staticmethod
+    def _cache_get(cache: OrderedDict, key) -> Optional[List[str]]:
+        """读取未过期的缓存结果（返回副本，调用方可自由修改）"""
+        cached = cache.get(key)
+        if cached and time.monotonic() < cached[0]:
+            return list(cached[1])
+        return None
+    
+    @staticmethod
+    def _cache_put(cache: OrderedDict, key, result: List[str], ttl: float):
+        """缓存查询结果，空结果按较短的 NEGATIVE_CACHE_TTL 缓存，超出容量时淘汰最早的条目"""
+        cache[key] = (time.monotonic() + (ttl if result else NEGATIVE_CACHE_TTL), list(result))
+        cache.move_to_end(key)
+        if len(cache) > DNS_RESULT_CACHE_SIZE:
+            cache.popitem(last=False)
+    
+    async def _single_flight(self, key: tuple, factory) -> List[str]:
+        """同一查询同时只进行一次，并发的相同查询等待同一结果（返回副本）"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(factory())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # 某个等待方被取消时不影响其他等待方
+        return list(await asyncio.shield(task))
+    
     async def query_a_record(self, domain: str, use_edns_china: bool = True) -> List[str]:
-        """查询A记录，返回IP地址列表（并发查询所有DoH服务器）"""
+        """查询A记录，返回IP地址列表（并发查询所有DoH服务器，结果带缓存）"""
+        cached = self._cache_get(self._a_cache, (domain, use_edns_china))
+        if cached is not None:
+            return cached
+        return await self._single_flight(("A", domain, use_edns_china),
+                                         lambda: self._query_a_record(domain, use_edns_china))
+    
+    async def _query_a_record(self, domain: str, use_edns_china: bool) -> List[str]:
+        """实际查询A记录"""
         try:
             # 确保Session已启动
-            if not self.session or self.session.closed:
-                await self.start()
+            session = await self._ensure_session()
 
             # 构建DNS查询数据包
-            query_data = self._build_dns_query(domain, use_edns_china)
+            _, encoded_query = self._build_dns_query(domain, use_edns_china)
             
-            # 创建所有DoH服务器的查询任务
-            tasks = []
-            for server_name, server_url in self.doh_servers.items():
-                task = asyncio.create_task(
-                    self._perform_doh_query(server_name, server_url, query_data, self._parse_dns_response_a)
-                )
-                tasks.append(task)
-            
-            # 等待所有任务完成，并获取第一个成功的结果
-            # 注意：这里我们使用 as_completed 来获取最快的结果
-            for future in asyncio.as_completed(tasks):
-                try:
-                    ips = await future
-                    if ips:
-                        logger.debug(f"DoH查询 {domain} 成功，获得 {len(ips)} 个IP")
-                        # 取消其他未完成的任务
-                        for task in tasks:
-                            if not task.done():
-                                task.cancel()
-                        return ips
-                except Exception:
-                    # 单个任务失败不影响其他任务
-                    continue
+            # 并发查询所有DoH服务器，取最快的成功结果
+            server_name, ips = await self._query_fastest(
+                session, self.doh_servers, encoded_query, self._parse_dns_response_a
+            )
+            if ips:
+                logger.debug("DoH查询 {} 成功（{}），获得 {} 个IP", domain, server_name, len(ips))
+                self._cache_put(self._a_cache, (domain, use_edns_china), ips, self.a_record_ttl)
+                return ips
             
             logger.warning(f"所有DoH服务器查询域名 {domain} 都失败")
+            self._cache_put(self._a_cache, (domain, use_edns_china), [], self.a_record_ttl)
             return []
             
         except Exception as e:
@@ -81,51 +259,73 @@ class DNSService:
             return []
     
     async def query_ns_records(self, domain: str) -> List[str]:
-        """查询NS记录，返回权威域名服务器列表（并发查询）"""
+        """查询NS记录，返回权威域名服务器列表（并发查询，结果带缓存）"""
+        cached = self._cache_get(self._ns_cache, domain)
+        if cached is not None:
+            return cached
+        return await self._single_flight(("NS", domain), lambda: self._query_ns_records(domain))
+    
+    async def _query_ns_records(self, domain: str) -> List[str]:
+        """实际查询NS记录"""
         try:
             # 确保Session已启动
-            if not self.session or self.session.closed:
-                await self.start()
+            session = await self._ensure_session()
 
             # 构建NS查询数据包（不使用EDNS中国客户端，避免被过滤）
-            query_data = self._build_dns_query(domain, False, record_type=2)  # NS记录类型为2
-            
-            # 创建所有NS DoH服务器的查询任务
-            tasks = []
-            for server_name, server_url in self.ns_doh_servers.items():
-                task = asyncio.create_task(
-                    self._perform_doh_query(server_name, server_url, query_data, self._parse_dns_response_ns)
-                )
-                tasks.append(task)
+            _, encoded_query = self._build_dns_query(domain, False, record_type=2)  # NS记录类型为2
             
-            # 等待最快的结果
-            for future in asyncio.as_completed(tasks):
-                try:
-                    ns_servers = await future
-                    if ns_servers:
-                        logger.debug(f"DoH查询 {domain} NS记录成功")
-                        # 取消其他任务
-                        for task in tasks:
-                            if not task.done():
-                                task.cancel()
-                        return ns_servers
-                except Exception:
-                    continue
+            # 并发查询所有NS DoH服务器，取最快的成功结果
+            server_name, ns_servers = await self._query_fastest(
+                session, self.ns_doh_servers, encoded_query, self._parse_dns_response_ns
+            )
+            if ns_servers:
+                logger.debug("DoH查询 {} NS记录成功（{}）", domain, server_name)
+                self._cache_put(self._ns_cache, domain, ns_servers, self.ns_record_ttl)
+                return ns_servers
             
             # DoH查询失败时，尝试使用系统DNS作为备用
             logger.info(f"DoH查询NS记录失败，尝试使用系统DNS查询 {domain}")
             ns_servers = await self._query_ns_system_dns(domain)
             if ns_servers:
-                logger.debug(f"使用系统DNS查询 {domain} NS记录成功")
+                logger.debug("使用系统DNS查询 {} NS记录成功", domain)
+                self._cache_put(self._ns_cache, domain, ns_servers, self.ns_record_ttl)
                 return ns_servers
             
             logger.warning(f"所有NS记录查询方法都失败，域名: {domain}")
+            self._cache_put(self._ns_cache, domain, [], self.ns_record_ttl)
             return []
             
         except Exception as e:
             logger.error(f"NS记录查询失败: {e}")
             return []
     
+    async def _query_fastest(self, session: aiohttp.ClientSession, servers: Tuple[Tuple[str, str], ...],
+                             encoded_query: str, parser_func) -> Tuple[Optional[str], List[str]]:
+        """同时向所有服务器发起查询，返回最先得到的非空结果 (服务器名称, 结果)
+        
+        得到结果、全部失败或调用方被取消时，都会取消其余仍在进行的查询
+        """
+        tasks = {
+            asyncio.create_task(
+                self._perform_doh_query(session, server_name, server_url, encoded_query, parser_func)
+            ): server_name
+            for server_name, server_url in servers
+        }
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # 单个服务器失败不影响其他服务器
+                    if task.cancelled() or task.exception() is not None:
+                        continue
+                    if task.result():
+                        return tasks[task], task.result()
+            return None, []
+        finally:
+            for task in pending:
+                task.cancel()
+    
     async def _query_ns_system_dns(self, domain: str) -> List[str]:
         """使用系统DNS查询NS记录作为备用方案"""
         try:
@@ -141,7 +341,7 @@ class DNSService:
             answers = resolver.resolve(domain, dns.rdatatype.NS)
             ns_servers = [str(rdata).rstrip('.') for rdata in answers]
             
-            logger.debug(f"系统DNS查询 {domain} NS记录成功，获得 {len(ns_servers)} 个NS服务器")
+            logger.debug("系统DNS查询 {} NS记录成功，获得 {} 个NS服务器", domain, len(ns_servers))
             return ns_servers
             
         except ImportError:
@@ -151,63 +351,24 @@ class DNSService:
             logger.warning(f"系统DNS查询NS记录失败: {e}")
             return []
     
-    def _build_dns_query(self, domain: str, use_edns_china: bool = True, record_type: int = 1) -> bytes:
-        """构建DNS查询数据包"""
+    def _build_dns_query(self, domain: str, use_edns_china: bool = True, record_type: int = 1) -> Tuple[bytes, str]:
+        """构建DNS查询数据包，返回 (报文, base64url 编码)"""
         try:
-            # DNS头部 (12字节)
-            transaction_id = 0x1234
-            flags = 0x0100  # 标准查询
-            questions = 1
-            answer_rrs = 0
-            authority_rrs = 0
-            additional_rrs = 1 if use_edns_china else 0
-            
-            header = struct.pack('!HHHHHH', 
-                               transaction_id, flags, questions, 
-                               answer_rrs, authority_rrs, additional_rrs)
-            
-            # 构建查询部分
-            query = b''
-            for label in domain.split('.'):
-                query += struct.pack('!B', len(label)) + label.encode('ascii')
-            query += b'\x00'  # 结束标志
-            
-            query += struct.pack('!HH', record_type, 1)  # Type A/NS, Class IN
-            
-            # 如果使用EDNS，添加OPT记录以模拟中国境内查询
-            edns = b''
-            if use_edns_china:
-                # OPT记录格式
-                edns += b'\x00'  # Name (root)
-                edns += struct.pack('!H', 41)  # Type OPT
-                edns += struct.pack('!H', 4096)  # UDP payload size
-                edns += struct.pack('!H', 0)  # Extended RCODE and flags
-                edns += struct.pack('!H', 8)  # RDLEN (8 bytes for ECS)
-                
-                # ECS (EDNS Client Subnet) 选项
-                edns += struct.pack('!H', 8)  # Option code (ECS)
-                edns += struct.pack('!H', 4)  # Option length
-                edns += struct.pack('!H', 1)  # Family (IPv4)
-                edns += struct.pack('!BB', 24, 0)  # Source netmask, Scope netmask
-                # 使用中国的IP段 (例如: 219.0.0.0/24)
-                edns += struct.pack('!BBB', 219, 0, 0)
-            
-            return header + query + edns
-            
+            return _build_dns_query_cached(domain, use_edns_china, record_type)
         except Exception as e:
             logger.error(f"构建DNS查询包失败: {e}")
-            return b''
+            return b'', ''
     
-    async def _perform_doh_query(self, server_name: str, server_url: str, query_data: bytes, parser_func) -> List[str]:
+    async def _perform_doh_query(self, session: aiohttp.ClientSession, server_name: str, server_url: str,
+                                 encoded_query: str, parser_func) -> List[str]:
         """执行DoH查询通用方法"""
-        max_retries = 2
+        max_retries = self.max_retries
+        url = f"{server_url}?dns={encoded_query}"
         for attempt in range(max_retries):
             try:
-                encoded_query = base64.urlsafe_b64encode(query_data).decode().rstrip('=')
-                url = f"{server_url}?dns={encoded_query}"
                 
                 # 使用共享的session
-                async with self.session.get(
+                async with session.get(
                     url,
                     headers={
                         'Accept': 'application/dns-message',
@@ -231,9 +392,9 @@ class DNSService:
                 # logger.debug(f"{server_name} query failed (attempt {attempt+1}): {e}")
                 pass
             
-            # 如果不是最后一次尝试，等待一小会儿
+            # 如果不是最后一次尝试，按指数退避加随机抖动等待
             if attempt < max_retries - 1:
-                await asyncio.sleep(0.5)
+                await asyncio.sleep(self.retry_base_delay * (2 ** attempt) + random.random() * self.retry_jitter)
         
         # 所有重试失败后抛出异常，以便外层捕捉
         raise Exception(f"{server_name} query failed after retries")
@@ -241,65 +402,12 @@ class DNSService:
     def _parse_dns_response_a(self, response_data: bytes) -> List[str]:
         """解析DNS响应中的A记录"""
         try:
-            if len(response_data) < 12:
-                return []
-            
-            # 解析头部
-            header = struct.unpack('!HHHHHH', response_data[:12])
-            answer_count = header[3]
-            
-            if answer_count == 0:
-                return []
-            
-            # 跳过查询部分
-            offset = 12
-            
-            # 跳过查询名称
-            while offset < len(response_data) and response_data[offset] != 0:
-                length = response_data[offset]
-                if length > 63:  # 压缩指针
-                    offset += 2
-                    break
-                offset += length + 1
-            
-            if offset < len(response_data) and response_data[offset] == 0:
-                offset += 1
-            
-            offset += 4  # 跳过Type和Class
-            
-            # 解析答案
-            ips = []
-            for _ in range(answer_count):
-                if offset >= len(response_data):
-                    break
-                
-                # 跳过名称
-                if response_data[offset] & 0xC0:  # 压缩指针
-                    offset += 2
-                else:
-                    while offset < len(response_data) and response_data[offset] != 0:
-                        offset += response_data[offset] + 1
-                    offset += 1
-                
-                if offset + 10 > len(response_data):
-                    break
-                
-                # 读取Type, Class, TTL, RDLength
-                rr_data = struct.unpack('!HHIH', response_data[offset:offset+10])
-                rr_type = rr_data[0]
-                rd_length = rr_data[3]
-                offset += 10
-                
-                # 如果是A记录 (Type 1) 且长度为4
-                if rr_type == 1 and rd_length == 4 and offset + 4 <= len(response_data):
-                    ip_bytes = response_data[offset:offset+4]
-                    ip = '.'.join(str(b) for b in ip_bytes)
-                    ips.append(ip)
-                
-                offset += rd_length
-            
-            return ips
-            
+            response_view = memoryview(response_data)
+            return [
+                socket.inet_ntoa(response_view[offset:offset + 4])
+                for rr_type, offset, rd_length in _iter_answers(response_data)
+                if rr_type == 1 and rd_length == 4  # A记录 (Type 1) 且长度为4
+            ]
         except Exception as e:
             logger.error(f"解析DNS响应失败: {e}")
             return []
@@ -307,66 +415,13 @@ class DNSService:
     def _parse_dns_response_ns(self, response_data: bytes) -> List[str]:
         """解析DNS响应中的NS记录"""
         try:
-            if len(response_data) < 12:
-                return []
-            
-            # 解析头部
-            header = struct.unpack('!HHHHHH', response_data[:12])
-            answer_count = header[3]
-            
-            if answer_count == 0:
-                return []
-            
-            # 跳过查询部分
-            offset = 12
-            
-            # 跳过查询名称
-            while offset < len(response_data) and response_data[offset] != 0:
-                length = response_data[offset]
-                if length > 63:  # 压缩指针
-                    offset += 2
-                    break
-                offset += length + 1
-            
-            if offset < len(response_data) and response_data[offset] == 0:
-                offset += 1
-            
-            offset += 4  # 跳过Type和Class
-            
-            # 解析答案
             ns_servers = []
-            for _ in range(answer_count):
-                if offset >= len(response_data):
-                    break
-                
-                # 跳过名称
-                if offset < len(response_data) and response_data[offset] & 0xC0:  # 压缩指针
-                    offset += 2
-                else:
-                    while offset < len(response_data) and response_data[offset] != 0:
-                        offset += response_data[offset] + 1
-                    if offset < len(response_data):
-                        offset += 1
-                
-                if offset + 10 > len(response_data):
-                    break
-                
-                # 读取Type, Class, TTL, RDLength
-                rr_data = struct.unpack('!HHIH', response_data[offset:offset+10])
-                rr_type = rr_data[0]
-                rd_length = rr_data[3]
-                offset += 10
-                
-                # 如果是NS记录 (Type 2)
-                if rr_type == 2 and offset + rd_length <= len(response_data):
+            for rr_type, offset, _ in _iter_answers(response_data):
+                if rr_type == 2:  # NS记录 (Type 2)
                     ns_name = self._parse_domain_name(response_data, offset)
                     if ns_name:
                         ns_servers.append(ns_name)
-                
-                offset += rd_length
-            
             return ns_servers
-            
         except Exception as e:
             logger.error(f"解析NS记录失败: {e}")
             return []
@@ -375,8 +430,9 @@ class DNSService:
         """解析DNS响应中的域名（处理压缩指针）"""
         try:
             labels = []
-            original_offset = offset
-            jumped = False
+            # 每次跳转的目标必须严格小于上一次的跳转目标（首次须小于域名起始位置），
+            # 跳转目标只减不增，循环指针（包括指向自身）无法无限跳转
+            jump_limit = offset
             
             while offset < len(data):
                 length = data[offset]
@@ -384,12 +440,13 @@ class DNSService:
                 if length == 0:
                     break
                 elif length & 0xC0 == 0xC0:  # 压缩指针
-                    if not jumped:
-                        original_offset = offset + 2
-                        jumped = True
+                    if offset + 1 >= len(data):
+                        break
                     # 计算指针位置
                     pointer = ((length & 0x3F) << 8) | data[offset + 1]
-                    offset = pointer
+                    if pointer >= jump_limit:
+                        break
+                    offset = jump_limit = pointer
                     continue
                 else:
                     offset += 1
@@ -3,7 +3,12 @@
 综合检查域名的各种信息
 """
 
-from typing import Dict, List, Any, Optional
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from itertools import chain
+from typing import Dict, List, Any, Optional, Tuple
 from loguru import logger
 
 from .dns_service import DNSService
@@ -11,15 +16,78 @@ from .geoip_service import GeoIPService
 from ..utils.domain_utils import extract_second_level_domain, normalize_domain
 
 
+# 综合检查结果的缓存时间（秒），查询后紧接着点击添加时可直接复用，不再重复DNS查询
+CHECK_RESULT_TTL = 60
+CHECK_RESULT_CACHE_SIZE = 1024
+
+
+@dataclass(slots=True)
+class DomainCheckResult:
+    """综合检查过程中累积的结果，检查完成后转换为字典返回"""
+    original_domain: str
+    normalized_domain: str
+    second_level_domain: Optional[str]
+    domain_ips: List[str] = field(default_factory=list)
+    second_level_ips: List[str] = field(default_factory=list)
+    ns_servers: List[str] = field(default_factory=list)
+    ns_ips: List[str] = field(default_factory=list)
+    domain_china_status: bool = False
+    second_level_china_status: bool = False
+    ns_china_status: bool = False
+    domain_china_count: int = 0
+    domain_foreign_count: int = 0
+    second_level_china_count: int = 0
+    second_level_foreign_count: int = 0
+    ns_china_count: int = 0
+    ns_foreign_count: int = 0
+    china_total_count: int = 0
+    foreign_total_count: int = 0
+    recommendation: str = ""
+    details: List[str] = field(default_factory=list)
+    details_text: str = ""
+
+
 class DomainChecker:
     """域名检查器"""
     
     def __init__(self, dns_service: DNSService, geoip_service: GeoIPService):
         self.dns_service = dns_service
         self.geoip_service = geoip_service
+        # 检查结果缓存 {domain: (检查时间, 结果)}，以及正在进行的检查 {domain: Task}
+        self._result_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
     
     async def check_domain_comprehensive(self, domain: str) -> Dict[str, Any]:
-        """综合检查域名信息"""
+        """综合检查域名信息（同一域名的并发检查合并为一次，成功结果短期缓存）
+        
+        返回的结果可能被多个调用方共享，调用方不应修改
+        """
+        cached = self._result_cache.get(domain)
+        if cached and time.monotonic() - cached[0] < CHECK_RESULT_TTL:
+            return cached[1]
+        
+        task = self._inflight.get(domain)
+        if task is None:
+            task = self._inflight[domain] = asyncio.create_task(self._check_domain(domain))
+            task.add_done_callback(lambda t: self._on_check_done(domain, t))
+        # 某个等待方被取消时不影响其他等待方
+        return await asyncio.shield(task)
+    
+    def _on_check_done(self, domain: str, task: asyncio.Task):
+        """检查完成：移出进行中列表，缓存成功的结果"""
+        self._inflight.pop(domain, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if "error" in result:
+            return
+        self._result_cache[domain] = (time.monotonic(), result)
+        self._result_cache.move_to_end(domain)
+        if len(self._result_cache) > CHECK_RESULT_CACHE_SIZE:
+            self._result_cache.popitem(last=False)
+    
+    async def _check_domain(self, domain: str) -> Dict[str, Any]:
+        """执行综合检查"""
         try:
             # 标准化域名
             normalized_domain = normalize_domain(domain)
@@ -29,78 +97,81 @@ class DomainChecker:
             # 获取二级域名
             second_level = extract_second_level_domain(normalized_domain)
             
-            result = {
-                "original_domain": domain,
-                "normalized_domain": normalized_domain,
-                "second_level_domain": second_level,
-                "domain_ips": [],
-                "second_level_ips": [],
-                "ns_servers": [],
-                "ns_ips": [],
-                "domain_china_status": False,
-                "second_level_china_status": False,
-                "ns_china_status": False,
-                "domain_china_count": 0,
-                "domain_foreign_count": 0,
-                "second_level_china_count": 0,
-                "second_level_foreign_count": 0,
-                "ns_china_count": 0,
-                "ns_foreign_count": 0,
-                "china_total_count": 0,
-                "foreign_total_count": 0,
-                "recommendation": "",
-                "details": []
-            }
+            result = DomainCheckResult(
+                original_domain=domain,
+                normalized_domain=normalized_domain,
+                second_level_domain=second_level,
+            )
+            
+            # 域名IP、二级域名IP、NS记录三个查询互不依赖，并发进行
+            query_second_level = bool(second_level and second_level != normalized_domain)
+            ns_domain = second_level if second_level else normalized_domain
+            logger.info(f"查询域名 {normalized_domain} 的IP地址及 {ns_domain} 的NS记录...")
+            domain_ips, second_level_ips, ns_servers = await asyncio.gather(
+                self.dns_service.query_a_record(normalized_domain),
+                self.dns_service.query_a_record(second_level) if query_second_level else asyncio.sleep(0, result=[]),
+                self.dns_service.query_ns_records(ns_domain),
+            )
+            
+            # 各NS服务器的IP并发查询
+            ns_ip_lists = await asyncio.gather(
+                *(self.dns_service.query_a_record(ns) for ns in ns_servers),
+                return_exceptions=True,
+            )
+            ns_ip_map: Dict[str, List[str]] = {}
+            for ns, ns_ips in zip(ns_servers, ns_ip_lists):
+                if isinstance(ns_ips, BaseException):
+                    logger.debug("查询NS服务器 {} 的IP失败: {}", ns, ns_ips)
+                    ns_ips = []
+                ns_ip_map[ns] = ns_ips
             
-            # 1. 查询域名IP
-            logger.info(f"查询域名 {normalized_domain} 的IP地址...")
-            domain_ips = await self.dns_service.query_a_record(normalized_domain)
-            result["domain_ips"] = domain_ips
+            # 所有IP一次性查询归属地，重复的IP（如多个NS共用）只查一次
+            locations = self.geoip_service.get_locations_bulk(
+                chain(domain_ips, second_level_ips, *ns_ip_map.values())
+            )
+            
+            # 1. 域名IP
+            result.domain_ips = domain_ips
             
             # 检查域名IP归属地
             if domain_ips:
                 china_ips = []
                 for ip in domain_ips:
-                    location = self.geoip_service.get_location_info(ip)
+                    location = locations[ip]
                     if location["is_china"]:
                         china_ips.append(ip)
-                    result["details"].append(f"域名 IP {ip}: {location['country_name']}")
+                    result.details.append(f"域名 IP {ip}: {location['country_name']}")
                 
-                result["domain_china_status"] = len(china_ips) > 0
-                result["domain_china_count"] = len(china_ips)
-                result["domain_foreign_count"] = max(len(domain_ips) - len(china_ips), 0)
+                result.domain_china_status = len(china_ips) > 0
+                result.domain_china_count = len(china_ips)
+                result.domain_foreign_count = max(len(domain_ips) - len(china_ips), 0)
                 if china_ips:
-                    result["details"].append(f"域名有 {len(china_ips)} 个中国 IP")
+                    result.details.append(f"域名有 {len(china_ips)} 个中国 IP")
             else:
-                result["details"].append("无法解析域名 IP")
+                result.details.append("无法解析域名 IP")
             
-            # 2. 如果不是二级域名，查询二级域名IP
-            if second_level and second_level != normalized_domain:
-                logger.info(f"查询二级域名 {second_level} 的IP地址...")
-                second_level_ips = await self.dns_service.query_a_record(second_level)
-                result["second_level_ips"] = second_level_ips
+            # 2. 如果不是二级域名，检查二级域名IP
+            if query_second_level:
+                result.second_level_ips = second_level_ips
                 
                 if second_level_ips:
                     china_ips = []
                     for ip in second_level_ips:
-                        location = self.geoip_service.get_location_info(ip)
+                        location = locations[ip]
                         if location["is_china"]:
                             china_ips.append(ip)
-                        result["details"].append(f"二级域名 IP {ip}: {location['country_name']}")
+                        result.details.append(f"二级域名 IP {ip}: {location['country_name']}")
                     
-                    result["second_level_china_status"] = len(china_ips) > 0
-                    result["second_level_china_count"] = len(china_ips)
-                    result["second_level_foreign_count"] = max(len(second_level_ips) - len(china_ips), 0)
+                    result.second_level_china_status = len(china_ips) > 0
+                    result.second_level_china_count = len(china_ips)
+                    result.second_level_foreign_count = max(len(second_level_ips) - len(china_ips), 0)
                     if china_ips:
-                        result["details"].append(f"二级域名有 {len(china_ips)} 个中国 IP")
+                        result.details.append(f"二级域名有 {len(china_ips)} 个中国 IP")
                 else:
-                    result["details"].append("无法解析二级域名 IP")
+                    result.details.append("无法解析二级域名 IP")
             
-            # 3. 查询NS服务器
-            ns_domain = second_level if second_level else normalized_domain
-            logger.info(f"查询域名 {ns_domain} 的NS记录...")
-            ns_servers = await self.dns_service.query_ns_records(ns_domain)
-            result["ns_servers"] = ns_servers
+            # 3. NS服务器
+            result.ns_servers = ns_servers
             
             # 检查NS服务器IP归属地
             if ns_servers:
@@ -108,14 +179,13 @@ class DomainChecker:
                 total_ns_count = 0
                 ns_summary = {}  # {ns_server: {"china": count, "foreign": count}}
                 
-                for ns in ns_servers:
-                    ns_ips = await self.dns_service.query_a_record(ns)
-                    result["ns_ips"].extend(ns_ips)
+                for ns, ns_ips in ns_ip_map.items():
+                    result.ns_ips.extend(ns_ips)
                     
                     ns_summary[ns] = {"china": 0, "foreign": 0, "ips": []}
                     
                     for ip in ns_ips:
-                        location = self.geoip_service.get_location_info(ip)
+                        location = locations[ip]
                         ns_summary[ns]["ips"].append({"ip": ip, "country": location['country_name']})
                         total_ns_count += 1
                         
@@ -127,13 +197,13 @@ class DomainChecker:
                 
                 # 生成简洁的NS摘要信息
                 if china_ns_count > 0:
-                    result["ns_china_status"] = True
-                    result["details"].append(f"NS 服务器: {china_ns_count}/{total_ns_count} 个 IP 在中国大陆")
+                    result.ns_china_status = True
+                    result.details.append(f"NS 服务器: {china_ns_count}/{total_ns_count} 个 IP 在中国大陆")
                 else:
-                    result["details"].append(f"NS 服务器: 0/{total_ns_count} 个 IP 在中国大陆")
+                    result.details.append(f"NS 服务器: 0/{total_ns_count} 个 IP 在中国大陆")
                 
-                result["ns_china_count"] = china_ns_count
-                result["ns_foreign_count"] = max(total_ns_count - china_ns_count, 0)
+                result.ns_china_count = china_ns_count
+                result.ns_foreign_count = max(total_ns_count - china_ns_count, 0)
                 
                 # 添加详细的NS服务器信息（handler会统一添加•符号）
                 for ns, summary in ns_summary.items():
@@ -141,37 +211,39 @@ class DomainChecker:
                     foreign_count = summary["foreign"]
                     # 优化显示：有中国IP显示完整信息，无海外IP时不显示0
                     if china_count > 0 and foreign_count > 0:
-                        result["details"].append(f"{ns}: {china_count} 个中国 IP + {foreign_count} 个海外 IP")
+                        result.details.append(f"{ns}: {china_count} 个中国 IP + {foreign_count} 个海外 IP")
                     elif china_count > 0:
-                        result["details"].append(f"{ns}: {china_count} 个中国 IP")
+                        result.details.append(f"{ns}: {china_count} 个中国 IP")
                     else:
-                        result["details"].append(f"{ns}: {foreign_count} 个海外 IP")
+                        result.details.append(f"{ns}: {foreign_count} 个海外 IP")
             else:
-                result["details"].append("无法查询到 NS 记录")
+                result.details.append("无法查询到 NS 记录")
             
-            result["china_total_count"] = result["domain_china_count"] + result["second_level_china_count"] + result["ns_china_count"]
-            result["foreign_total_count"] = result["domain_foreign_count"] + result["second_level_foreign_count"] + result["ns_foreign_count"]
+            result.china_total_count = result.domain_china_count + result.second_level_china_count + result.ns_china_count
+            result.foreign_total_count = result.domain_foreign_count + result.second_level_foreign_count + result.ns_foreign_count
             
             # 生成建议
-            result["recommendation"] = self._generate_recommendation(result)
+            result.recommendation = self._generate_recommendation(result)
+            # 详情列表预先格式化为文本，结果被缓存复用时无需每次重新拼接
+            result.details_text = "".join(f"   • {detail}\n" for detail in result.details)
             
-            return result
+            return asdict(result)
             
         except Exception as e:
             logger.error(f"域名检查失败: {e}")
             return {"error": f"域名检查失败: {str(e)}"}
     
-    def _generate_recommendation(self, check_result: Dict[str, Any]) -> str:
+    def _generate_recommendation(self, check_result: "DomainCheckResult") -> str:
         """根据检查结果生成建议"""
         try:
-            domain_china = check_result["domain_china_status"]
-            second_level_china = check_result["second_level_china_status"]
-            ns_china = check_result["ns_china_status"]
+            domain_china = check_result.domain_china_status
+            second_level_china = check_result.second_level_china_status
+            ns_china = check_result.ns_china_status
             
-            has_second_level = check_result["second_level_domain"] != check_result["normalized_domain"]
+            has_second_level = check_result.second_level_domain != check_result.normalized_domain
             
             # 决定添加哪个域名（始终使用二级域名）
-            target_domain = check_result["second_level_domain"] if check_result["second_level_domain"] else check_result["normalized_domain"]
+            target_domain = check_result.second_level_domain if check_result.second_level_domain else check_result.normalized_domain
             domain_type = "二级域名"
             
             # 判断是否有中国IP（优先二级域名IP）
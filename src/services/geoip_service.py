@@ -4,8 +4,9 @@ GeoIP服务模块
 """
 
 import socket
+from functools import cached_property
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable
 from loguru import logger
 
 try:
@@ -15,33 +16,48 @@ except ImportError:
     GEOIP2_AVAILABLE = False
     logger.warning("geoip2 库未安装，GeoIP 功能将受限")
 
+# 未使用数据库或数据库中查不到时，国家代码对应的中文名称
+_COUNTRY_NAMES = {
+    "CN": "中国",
+    "US": "美国",
+    "JP": "日本",
+    "KR": "韩国",
+    "SG": "新加坡",
+    "HK": "香港",
+    "TW": "台湾",
+    "GB": "英国",
+    "DE": "德国",
+    "FR": "法国",
+}
+
 
 class GeoIPService:
     """GeoIP服务"""
     
     def __init__(self, geoip_file_path: str):
         self.geoip_file = Path(geoip_file_path)
-        self.reader = None
-        self._load_data()
     
-    def _load_data(self):
-        """加载GeoIP数据"""
+    @cached_property
+    def reader(self):
+        """GeoIP数据库读取器，首次查询时才打开（加载失败时为None）"""
         try:
             if not GEOIP2_AVAILABLE:
                 logger.warning("geoip2 库未安装，将使用简化的 IP 范围检查")
-                return
+                return None
                 
             if not self.geoip_file.exists():
                 logger.warning(f"GeoIP 数据库文件不存在: {self.geoip_file}")
                 logger.info("提示：请从 https://dev.maxmind.com/geoip/geolite2-free-geolocation-data 下载 GeoLite2-Country.mmdb")
-                return
+                return None
             
             # 打开 MaxMind DB
-            self.reader = geoip2.database.Reader(str(self.geoip_file))
+            reader = geoip2.database.Reader(str(self.geoip_file))
             logger.info(f"GeoIP 数据库加载成功: {self.geoip_file}")
+            return reader
             
         except Exception as e:
             logger.error(f"加载 GeoIP 数据失败: {e}")
+            return None
     
     def get_country_code(self, ip: str) -> Optional[str]:
         """获取IP的国家代码"""
@@ -55,7 +71,7 @@ class GeoIPService:
                     response = self.reader.country(ip)
                     return response.country.iso_code
                 except geoip2.errors.AddressNotFoundError:
-                    logger.debug(f"IP {ip} 未在 GeoIP 数据库中找到")
+                    logger.debug("IP {} 未在 GeoIP 数据库中找到", ip)
                     return None
                 except Exception as e:
                     logger.warning(f"GeoIP 查询失败: {e}")
@@ -101,42 +117,36 @@ class GeoIPService:
     def get_location_info(self, ip: str) -> Dict[str, Any]:
         """获取IP的详细位置信息"""
         try:
-            country_code = self.get_country_code(ip)
+            # 验证IP格式
+            socket.inet_aton(ip)
             
-            # 如果使用真实数据库且找到结果
-            if self.reader and country_code:
+            if self.reader:
+                # 使用真实数据库：国家代码和名称来自同一次查询
+                country_code = None
                 try:
-                    response = self.reader.country(ip)
-                    country_name = response.country.names.get('zh-CN') or response.country.name or "未知"
-                    
-                    return {
-                        "ip": ip,
-                        "country_code": country_code,
-                        "country_name": country_name,
-                        "is_china": country_code == "CN"
-                    }
-                except Exception:
-                    pass
+                    country = self.reader.country(ip).country
+                    country_code = country.iso_code
+                    if country_code:
+                        return {
+                            "ip": ip,
+                            "country_code": country_code,
+                            "country_name": country.names.get('zh-CN') or country.name or "未知",
+                            "is_china": country_code == "CN"
+                        }
+                except geoip2.errors.AddressNotFoundError:
+                    logger.debug("IP {} 未在 GeoIP 数据库中找到", ip)
+                except Exception as e:
+                    logger.warning(f"GeoIP 查询失败: {e}")
+            else:
+                # 回退到简化的中国 IP 段检查（仅作为备用）
+                country_code = self._fallback_china_check(ip)
             
             # 回退到简单映射
-            country_names = {
-                "CN": "中国",
-                "US": "美国",
-                "JP": "日本",
-                "KR": "韩国",
-                "SG": "新加坡",
-                "HK": "香港",
-                "TW": "台湾",
-                "GB": "英国",
-                "DE": "德国",
-                "FR": "法国",
-            }
-            
             return {
                 "ip": ip,
                 "country_code": country_code,
-                "country_name": country_names.get(country_code, "未知" if country_code else "未知"),
-                "is_china": country_code == "CN" if country_code else False
+                "country_name": _COUNTRY_NAMES.get(country_code, "未知"),
+                "is_china": country_code == "CN"
             }
             
         except Exception as e:
@@ -148,11 +158,18 @@ class GeoIPService:
                 "is_china": False
             }
     
+    def get_locations_bulk(self, ips: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取IP位置信息，返回 {ip: 位置信息}，重复的IP只查询一次"""
+        get_location_info = self.get_location_info
+        return {ip: get_location_info(ip) for ip in dict.fromkeys(ips)}
+    
     def __del__(self):
         """关闭数据库连接"""
-        if self.reader:
+        # 未使用过的读取器不需要为了关闭而打开
+        reader = self.__dict__.get("reader")
+        if reader:
             try:
-                self.reader.close()
+                reader.close()
             except Exception:
                 pass
  
\ No newline at end of file
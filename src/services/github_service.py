@@ -5,14 +5,50 @@ GitHub服务模块
 
 import asyncio
 import base64
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+from typing import Optional, List, Dict, Any, Tuple
 from loguru import logger
 from github import Github, GithubException, InputGitAuthor
 
 from ..config import Config
 
 
+# 规则文件缓存在该时间内直接使用，超过后向GitHub发送条件请求确认是否有变化（秒）
+RULE_FILE_REVALIDATE_INTERVAL = 30
+
+# 规则注释中的时间使用北京时间（UTC+8）
+_BEIJING_TZ = timezone(timedelta(hours=8))
+
+# 新增规则插入在该标记行之后
+_PENDING_PR_MARKER = "# 以下域名待提交 PR"
+
+
+@dataclass(slots=True)
+class _RuleFile:
+    """规则文件的缓存版本及其索引"""
+    content_file: Any  # PyGithub ContentFile，保留其ETag用于条件请求
+    content: str
+    sha: str
+    # 规则域名 -> [(行号, 规则行)]，查询时按域名及其各级父域名查表
+    index: Dict[str, List[Tuple[int, str]]]
+    total_lines: int
+    rule_count: int
+    comment_count: int
+    checked_at: float
+
+
+@dataclass(slots=True)
+class _PendingAdd:
+    """等待合并提交的添加请求"""
+    domain: str
+    user_name: str
+    description: str
+    comment: str
+    future: asyncio.Future
+
+
 class GitHubService:
     """GitHub服务"""
     
@@ -20,6 +56,13 @@ class GitHubService:
         self.config = config
         self.github = Github(config.GITHUB_TOKEN)
         self.repo = None
+        # 规则文件缓存 {file_path: _RuleFile}，同一文件的并发刷新合并为一次请求
+        self._rule_files: Dict[str, _RuleFile] = {}
+        self._rule_file_locks: Dict[str, asyncio.Lock] = {}
+        # 等待合并提交的添加请求 {file_path: [_PendingAdd]}，以及各文件的提交锁（同一文件的提交串行执行）
+        self._pending_adds: Dict[str, List[_PendingAdd]] = {}
+        self._commit_locks: Dict[str, asyncio.Lock] = {}
+        self._flush_tasks: set = set()
         self._initialize_repo()
     
     def _initialize_repo(self):
@@ -80,162 +123,330 @@ class GitHubService:
                 "error": str(e)
             }
     
+    @staticmethod
+    def _build_rule_file(content_file) -> _RuleFile:
+        """解码规则文件并建立域名索引（在线程池中执行）"""
+        content = base64.b64decode(content_file.content).decode('utf-8')
+        lines = content.split('\n')
+        index: Dict[str, List[Tuple[int, str]]] = {}
+        rule_count = 0
+        comment_count = 0
+        
+        for line_num, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('#'):
+                comment_count += 1
+            elif line.startswith('DOMAIN-SUFFIX,'):
+                rule_count += 1
+                rule_domain = line[14:].strip().lower()
+                index.setdefault(rule_domain, []).append((line_num, line))
+        
+        return _RuleFile(
+            content_file=content_file,
+            content=content,
+            sha=content_file.sha,
+            index=index,
+            total_lines=len(lines),
+            rule_count=rule_count,
+            comment_count=comment_count,
+            checked_at=time.monotonic()
+        )
+    
+    async def _get_rule_file(self, file_path: str, revalidate: bool = False) -> Optional[_RuleFile]:
+        """获取规则文件（带缓存）
+        
+        缓存未过期时不发请求；过期后发送条件请求，文件未变化（304）时沿用已有索引。
+        revalidate=True 时忽略缓存有效期，用于修改文件前确认拿到的是最新版本。
+        """
+        cached = self._rule_files.get(file_path)
+        if cached and not revalidate and time.monotonic() - cached.checked_at < RULE_FILE_REVALIDATE_INTERVAL:
+            return cached
+        
+        lock = self._rule_file_locks.get(file_path)
+        if lock is None:
+            lock = self._rule_file_locks[file_path] = asyncio.Lock()
+        
+        async with lock:
+            # 等锁期间其他请求可能已经刷新过
+            cached = self._rule_files.get(file_path)
+            if cached and time.monotonic() - cached.checked_at < (0 if revalidate else RULE_FILE_REVALIDATE_INTERVAL):
+                return cached
+            
+            try:
+                if cached:
+                    logger.debug("正在确认文件是否有更新: {}", file_path)
+                    # ContentFile.update() 携带ETag发送条件请求，返回文件是否有变化
+                    changed = await asyncio.to_thread(cached.content_file.update)
+                    if not changed:
+                        cached.checked_at = time.monotonic()
+                        return cached
+                    content_file = cached.content_file
+                else:
+                    logger.debug("正在获取文件内容: {}", file_path)
+                    # 使用 asyncio.to_thread 在线程池中执行阻塞IO
+                    content_file = await asyncio.to_thread(self.repo.get_contents, file_path)
+                
+                # 解码和建索引也在线程池中执行，避免阻塞事件循环
+                rule_file = await asyncio.to_thread(self._build_rule_file, content_file)
+                self._rule_files[file_path] = rule_file
+                logger.debug("成功获取文件内容: {}, 长度: {} 字符", file_path, len(rule_file.content))
+                return rule_file
+            except GithubException as e:
+                logger.error(f"GitHub API获取文件失败: {file_path}, status={getattr(e, 'status', 'unknown')}, message={getattr(e, 'data', {}).get('message', str(e))}")
+                return None
+            except Exception as e:
+                logger.error(f"获取文件内容失败: {file_path}, {type(e).__name__}: {e}", exc_info=True)
+                return None
+    
+    def _invalidate_rule_file(self, file_path: str):
+        """文件被本服务修改后丢弃缓存，下次读取时重新获取"""
+        self._rule_files.pop(file_path, None)
+    
     async def get_rule_file_content(self, file_path: str) -> Optional[str]:
         """获取规则文件内容"""
-        try:
-            logger.debug(f"正在获取文件内容: {file_path}")
-            # 使用 asyncio.to_thread 在线程池中执行阻塞IO
-            file_content = await asyncio.to_thread(self.repo.get_contents, file_path)
-            content = base64.b64decode(file_content.content).decode('utf-8')
-            logger.debug(f"成功获取文件内容: {file_path}, 长度: {len(content)} 字符")
-            return content
-        except GithubException as e:
-            logger.error(f"GitHub API获取文件失败: {file_path}, status={getattr(e, 'status', 'unknown')}, message={getattr(e, 'data', {}).get('message', str(e))}")
-            return None
-        except Exception as e:
-            logger.error(f"获取文件内容失败: {file_path}, {type(e).__name__}: {e}", exc_info=True)
-            return None
+        rule_file = await self._get_rule_file(file_path)
+        return rule_file.content if rule_file else None
+    
+    @staticmethod
+    def _match_rules(rule_file: _RuleFile, lookup_keys: List[str], file_path: str) -> Dict[str, Any]:
+        """在规则索引中查找域名本身（lookup_keys[0]）及其各级父域名，每级一次字典查询"""
+        if not rule_file.content:
+            return {"exists": False, "details": []}
+        
+        index = rule_file.index
+        found_rules = [
+            {"line": line_num, "rule": line, "type": "exact_match"}
+            for line_num, line in index.get(lookup_keys[0], ())
+        ]
+        for key in lookup_keys[1:]:
+            for line_num, line in index.get(key, ()):
+                found_rules.append({"line": line_num, "rule": line, "type": "suffix_match"})
+        # 与逐行扫描的结果保持一致，按行号排序
+        found_rules.sort(key=lambda match: match["line"])
+        
+        return {
+            "exists": len(found_rules) > 0,
+            "matches": found_rules,
+            "file_path": file_path
+        }
+    
+    @staticmethod
+    def _lookup_keys(domain: str) -> List[str]:
+        """域名本身及其各级父域名"""
+        labels = domain.lower().split('.')
+        return ['.'.join(labels[i:]) for i in range(len(labels))]
     
     async def check_domain_in_rules(self, domain: str, file_path: str = None) -> Dict[str, Any]:
         """检查域名是否已在规则文件中"""
+        results = await self.check_domain_in_rule_files(domain, [file_path])
+        return results[0]
+    
+    async def check_domain_in_rule_files(self, domain: str, file_paths: List[Optional[str]]) -> List[Dict[str, Any]]:
+        """一次检查域名在多个规则文件中的情况，结果与 file_paths 顺序一致
+        
+        各文件并发获取（通常直接命中缓存），域名的各级父域名只拆分一次
+        """
+        file_paths = [file_path or self.config.DIRECT_RULE_FILE for file_path in file_paths]
         try:
-            if not file_path:
-                file_path = self.config.DIRECT_RULE_FILE
-            
-            content = await self.get_rule_file_content(file_path)
-            if not content:
-                return {"exists": False, "details": []}
-            
-            # CPU密集型操作也在线程池中执行，避免阻塞事件循环
-            def _process_content():
-                lines = content.split('\n')
-                domain_lower = domain.lower()
-                found_rules = []
-                
-                for line_num, line in enumerate(lines, 1):
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        # 检查 DOMAIN-SUFFIX 格式
-                        if line.startswith('DOMAIN-SUFFIX,'):
-                            rule_domain = line[14:].strip().lower()
-                            if rule_domain == domain_lower:
-                                found_rules.append({
-                                    "line": line_num,
-                                    "rule": line,
-                                    "type": "exact_match"
-                                })
-                            elif domain_lower.endswith('.' + rule_domain):
-                                found_rules.append({
-                                    "line": line_num,
-                                    "rule": line,
-                                    "type": "suffix_match"
-                                })
-                return found_rules
-
-            found_rules = await asyncio.to_thread(_process_content)
-            
-            return {
-                "exists": len(found_rules) > 0,
-                "matches": found_rules,
-                "file_path": file_path
-            }
+            rule_files = await asyncio.gather(*(self._get_rule_file(file_path) for file_path in file_paths))
+            lookup_keys = self._lookup_keys(domain)
+            return [
+                self._match_rules(rule_file, lookup_keys, file_path) if rule_file
+                else {"exists": False, "details": []}
+                for file_path, rule_file in zip(file_paths, rule_files)
+            ]
             
         except Exception as e:
             logger.error(f"检查域名规则失败: {e}")
-            return {"exists": False, "error": str(e)}
+            return [{"exists": False, "error": str(e)} for _ in file_paths]
     
     async def add_domain_to_rules(self, domain: str, user_name: str, description: str = "", 
                                  file_path: str = None) -> Dict[str, Any]:
-        """添加域名到规则文件"""
+        """添加域名到规则文件
+        
+        没有进行中的提交时立即提交；同一规则文件的提交进行期间到达的添加请求，
+        在上一次提交完成后合并为一次提交。每个请求各自得到只含自身域名的结果
+        """
+        if not file_path:
+            file_path = self.config.DIRECT_RULE_FILE
+        
+        # 检查仓库连接
+        if not self.repo:
+            error_msg = "GitHub仓库连接未初始化"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+        
+        # 验证参数
+        if not domain or not isinstance(domain, str) or len(domain.strip()) == 0:
+            error_msg = f"无效的域名格式: {domain}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+        
+        if not user_name or not isinstance(user_name, str) or len(user_name.strip()) == 0:
+            error_msg = f"无效的用户名格式: {user_name}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+        
+        logger.debug("开始添加域名 {} 到文件 {}", domain, file_path)
+        current_date = datetime.now(_BEIJING_TZ).strftime("%Y-%m-%d %H:%M:%S")
+        if description:
+            comment = f"# {description} / add by Telegram user: {user_name} / Date: {current_date}"
+        else:
+            comment = f"# add by Telegram user: {user_name} / Date: {current_date}"
+        
+        pending = self._pending_adds.get(file_path)
+        if pending is None:
+            # 队列中的第一个请求负责提交（等待进行中的提交完成期间，后续请求加入同一队列）
+            pending = self._pending_adds[file_path] = []
+            task = asyncio.create_task(self._flush_adds_later(file_path))
+            # 保留任务引用，避免任务在完成前被回收
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        
+        future = asyncio.get_running_loop().create_future()
+        pending.append(_PendingAdd(domain, user_name, description, comment, future))
+        return await future
+    
+    async def _flush_adds_later(self, file_path: str):
+        """取得文件的提交锁后，把队列中的添加请求作为一次提交"""
+        lock = self._commit_locks.get(file_path)
+        if lock is None:
+            lock = self._commit_locks[file_path] = asyncio.Lock()
+        
+        entries: List[_PendingAdd] = []
+        taken = False
         try:
-            if not file_path:
-                file_path = self.config.DIRECT_RULE_FILE
-            
-            # 检查仓库连接
-            if not self.repo:
-                error_msg = "GitHub仓库连接未初始化"
-                logger.error(error_msg)
-                return {"success": False, "error": error_msg}
-            
-            # 获取当前文件内容
-            logger.debug(f"开始添加域名 {domain} 到文件 {file_path}")
-            content = await self.get_rule_file_content(file_path)
+            async with lock:
+                # 在锁内取出队列：等待上一次提交期间到达的请求一并提交，之后的请求进入新队列
+                entries = self._pending_adds.pop(file_path, [])
+                taken = True
+                # 等待方已取消的请求不再提交
+                entries = [entry for entry in entries if not entry.future.done()]
+                if not entries:
+                    return
+                results = await self._commit_adds(file_path, entries)
+            for entry, result in zip(entries, results):
+                if not entry.future.done():
+                    entry.future.set_result(result)
+        except Exception as e:
+            # 提交过程中的意外错误如实告知每个等待方，而不是当作取消
+            logger.error(f"提交添加请求失败: {type(e).__name__}: {e}", exc_info=True)
+            error_msg = f"{type(e).__name__}: {str(e)}"
+            for entry in entries:
+                if not entry.future.done():
+                    entry.future.set_result({"success": False, "error": error_msg})
+        finally:
+            if not taken:
+                # 取出队列前就被取消，队列中的请求同样需要结束
+                entries = self._pending_adds.pop(file_path, [])
+            # 提交任务被取消（如服务关闭）时，不让等待方一直挂起
+            for entry in entries:
+                if not entry.future.done():
+                    entry.future.set_result({"success": False, "error": "添加请求已取消"})
+    
+    def _commit_kind(self, file_path: str) -> str:
+        """提交信息中的规则类型"""
+        return "proxy" if file_path == self.config.PROXY_RULE_FILE else "direct"
+    
+    @staticmethod
+    def _entry_commit_title(commit_kind: str, entry: _PendingAdd) -> str:
+        """单个添加请求的提交标题，也作为该请求结果中的提交信息（不含其他用户的域名和说明）"""
+        return f"feat(rules): add {commit_kind} domain {entry.domain} by Telegram Bot (Telegram user: {entry.user_name})"
+    
+    def _build_add_commit(self, file_path: str, content: str, entries: List[_PendingAdd]) -> Tuple[str, str]:
+        """把一批添加请求写入文件内容，返回 (新内容, 提交信息)（在线程池中执行）"""
+        lines = content.split('\n')
+        insert_index = -1
+        
+        for i, line in enumerate(lines):
+            if _PENDING_PR_MARKER in line:
+                insert_index = i + 1
+                break
+        
+        if insert_index == -1:
+            # 如果没找到标记，添加到文件末尾
+            lines.append(_PENDING_PR_MARKER)
+            insert_index = len(lines)
+        
+        # 插入新规则，保持请求顺序
+        new_lines = []
+        for entry in entries:
+            new_lines.append(entry.comment)
+            new_lines.append(f"DOMAIN-SUFFIX,{entry.domain}")
+        lines[insert_index:insert_index] = new_lines
+        
+        # 遵循 Conventional Commits 规范
+        commit_kind = self._commit_kind(file_path)
+        if len(entries) == 1:
+            entry = entries[0]
+            full_commit_message = self._entry_commit_title(commit_kind, entry)
+            if entry.description and entry.description.strip():
+                full_commit_message += f"\n\n{entry.description}"
+        else:
+            domains = ", ".join(entry.domain for entry in entries)
+            full_commit_message = f"feat(rules): add {commit_kind} domains {domains} by Telegram Bot\n"
+            for entry in entries:
+                full_commit_message += f"\n- {entry.domain} (Telegram user: {entry.user_name})"
+                if entry.description and entry.description.strip():
+                    full_commit_message += f": {entry.description}"
+        
+        return '\n'.join(lines), full_commit_message
+    
+    async def _commit_adds(self, file_path: str, entries: List[_PendingAdd]) -> List[Dict[str, Any]]:
+        """把一批添加请求提交为一次commit，返回每个请求的结果
+        
+        合并提交失败时逐个重新提交，一个请求的问题不会让同批的其他请求一起失败
+        """
+        # 同一域名在一批中只添加一次（保留最先的请求），重复的请求共享结果
+        unique_entries: Dict[str, _PendingAdd] = {}
+        for entry in entries:
+            unique_entries.setdefault(entry.domain.lower(), entry)
+        
+        results = await self._commit_batch(file_path, list(unique_entries.values()))
+        if len(unique_entries) > 1 and not results[0]["success"]:
+            logger.warning("合并提交失败，逐个提交 {} 个添加请求", len(unique_entries))
+            results = [(await self._commit_batch(file_path, [entry]))[0] for entry in unique_entries.values()]
+        
+        # 每个请求得到自己的结果副本，提交信息只含该请求自己的域名和用户名
+        results_by_domain = dict(zip(unique_entries, results))
+        commit_kind = self._commit_kind(file_path)
+        entry_results = []
+        for entry in entries:
+            result = dict(results_by_domain[entry.domain.lower()])
+            if result["success"]:
+                result["domain"] = entry.domain
+                result["commit_message"] = self._entry_commit_title(commit_kind, entry)
+            entry_results.append(result)
+        return entry_results
+    
+    async def _commit_batch(self, file_path: str, unique_entries: List[_PendingAdd]) -> List[Dict[str, Any]]:
+        """把一批（域名不重复的）添加请求提交为一次commit，返回每个请求的结果"""
+        try:
+            # 获取当前文件内容（修改前确认是最新版本）
+            rule_file = await self._get_rule_file(file_path, revalidate=True)
+            content = rule_file.content if rule_file else None
             if content is None:
                 error_msg = f"无法获取规则文件内容: {file_path}。请检查文件是否存在，仓库访问权限是否正确。"
                 logger.error(error_msg)
-                return {"success": False, "error": error_msg}
+                return [{"success": False, "error": error_msg} for _ in unique_entries]
             
             # 在线程中处理文件内容修改逻辑
-            def _prepare_update():
-                # 查找插入位置
-                lines = content.split('\n')
-                insert_index = -1
-                
-                for i, line in enumerate(lines):
-                    if "# 以下域名待提交 PR" in line:
-                        insert_index = i + 1
-                        break
-                
-                if insert_index == -1:
-                    # 如果没找到标记，添加到文件末尾
-                    insert_index = len(lines)
-                    lines.append("# 以下域名待提交 PR")
-                    insert_index += 1
-                
-                # 构建新规则
-                # 使用北京时间（UTC+8）
-                from datetime import timezone, timedelta
-                beijing_tz = timezone(timedelta(hours=8))
-                current_date = datetime.now(beijing_tz).strftime("%Y-%m-%d %H:%M:%S")
-                
-                # 验证参数
-                if not domain or not isinstance(domain, str) or len(domain.strip()) == 0:
-                    return None, f"无效的域名格式: {domain}"
-                
-                if not user_name or not isinstance(user_name, str) or len(user_name.strip()) == 0:
-                    return None, f"无效的用户名格式: {user_name}"
-                
-                if description:
-                    comment = f"# {description} / add by Telegram user: {user_name} / Date: {current_date}"
-                else:
-                    comment = f"# add by Telegram user: {user_name} / Date: {current_date}"
-                
-                rule = f"DOMAIN-SUFFIX,{domain}"
-                
-                # 插入新规则
-                lines.insert(insert_index, comment)
-                lines.insert(insert_index + 1, rule)
-                
-                # 重新组合内容
-                new_content = '\n'.join(lines)
-                
-                # 遵循 Conventional Commits 规范
-                commit_kind = "proxy" if file_path == self.config.PROXY_RULE_FILE else "direct"
-                commit_title = f"feat(rules): add {commit_kind} domain {domain} by Telegram Bot (Telegram user: {user_name})"
-                commit_body = description if description else ""
-                full_commit_message = commit_title
-                if commit_body and commit_body.strip():
-                    full_commit_message += f"\n\n{commit_body}"
-                    
-                return (new_content, full_commit_message), None
-
-            result, error = await asyncio.to_thread(_prepare_update)
-            if error:
-                logger.error(error)
-                return {"success": False, "error": error}
-            
-            new_content, full_commit_message = result
+            new_content, full_commit_message = await asyncio.to_thread(
+                self._build_add_commit, file_path, content, unique_entries
+            )
             
-            logger.debug(f"准备提交更改: {full_commit_message.splitlines()[0]}")
+            logger.debug("准备提交更改: {}", full_commit_message.splitlines()[0])
             
             # 在线程中执行GitHub API调用
+            # 基于读取内容时的sha提交，期间文件被其他人修改时GitHub会拒绝，避免覆盖他人的改动
             def _perform_commit():
-                file_content = self.repo.get_contents(file_path)
                 return self.repo.update_file(
                     file_path,
                     full_commit_message,
                     new_content,
-                    file_content.sha,
+                    rule_file.sha,
                     committer=InputGitAuthor(
                         name=self.config.GITHUB_COMMIT_NAME,
                         email=self.config.GITHUB_COMMIT_EMAIL
@@ -243,36 +454,35 @@ class GitHubService:
                 )
 
             commit_result = await asyncio.to_thread(_perform_commit)
+            self._invalidate_rule_file(file_path)
             
             # 构建 commit 链接
             commit_sha = commit_result['commit'].sha
             commit_url = f"https://github.com/{self.config.GITHUB_REPO}/commit/{commit_sha}"
             
-            logger.info(f"成功添加域名 {domain} 到规则文件，commit: {commit_sha}")
+            logger.info(f"成功添加域名 {', '.join(entry.domain for entry in unique_entries)} 到规则文件，commit: {commit_sha}")
             
-            return {
-                "success": True,
-                "domain": domain,
-                "file_path": file_path,
-                "commit_message": full_commit_message,
-                "commit_sha": commit_sha,
-                "commit_url": commit_url
-            }
+            return [
+                {
+                    "success": True,
+                    "domain": entry.domain,
+                    "file_path": file_path,
+                    "commit_sha": commit_sha,
+                    "commit_url": commit_url
+                }
+                for entry in unique_entries
+            ]
             
         except GithubException as e:
             error_details = getattr(e, 'data', {})
             error_message = error_details.get('message', str(e)) if error_details else str(e)
             logger.error(f"GitHub API错误: status={getattr(e, 'status', 'unknown')}, message={error_message}, data={error_details}")
-            return {"success": False, "error": f"GitHub API错误: {error_message} (状态码: {getattr(e, 'status', 'unknown')})"}
+            error_msg = f"GitHub API错误: {error_message} (状态码: {getattr(e, 'status', 'unknown')})"
+            return [{"success": False, "error": error_msg} for _ in unique_entries]
         except Exception as e:
             logger.error(f"添加域名规则失败: {type(e).__name__}: {e}", exc_info=True)
-            # 添加更详细的错误信息
             error_msg = f"{type(e).__name__}: {str(e)}"
-            if hasattr(e, '__traceback__'):
-                import traceback
-                tb_str = ''.join(traceback.format_tb(e.__traceback__))
-                logger.error(f"详细错误堆栈: {tb_str}")
-            return {"success": False, "error": error_msg}
+            return [{"success": False, "error": error_msg} for _ in unique_entries]
     
     async def remove_domain_from_rules(self, domain: str, user_name: str, file_path: str = None) -> Dict[str, Any]:
         """从规则文件中删除域名"""
@@ -280,8 +490,9 @@ class GitHubService:
             if not file_path:
                 file_path = self.config.DIRECT_RULE_FILE
             
-            # 获取当前文件内容
-            content = await self.get_rule_file_content(file_path)
+            # 获取当前文件内容（修改前确认是最新版本）
+            rule_file = await self._get_rule_file(file_path, revalidate=True)
+            content = rule_file.content if rule_file else None
             if content is None:
                 return {"success": False, "error": "无法获取文件内容"}
             
@@ -333,12 +544,11 @@ class GitHubService:
             commit_message = f"feat(rules): remove direct domain {domain} by Telegram Bot (Telegram user: {user_name})"
             
             def _perform_commit():
-                file_content = self.repo.get_contents(file_path)
                 return self.repo.update_file(
                     file_path,
                     commit_message,
                     new_content,
-                    file_content.sha,
+                    rule_file.sha,
                     committer=InputGitAuthor(
                         name=self.config.GITHUB_COMMIT_NAME,
                         email=self.config.GITHUB_COMMIT_EMAIL
@@ -346,6 +556,7 @@ class GitHubService:
                 )
 
             commit_result = await asyncio.to_thread(_perform_commit)
+            self._invalidate_rule_file(file_path)
             
             # 构建 commit 链接
             commit_sha = commit_result['commit'].sha
@@ -375,27 +586,16 @@ class GitHubService:
             if not file_path:
                 file_path = self.config.DIRECT_RULE_FILE
             
-            content = await self.get_rule_file_content(file_path)
-            if not content:
+            # 统计数据在建立索引时已经算好
+            rule_file = await self._get_rule_file(file_path)
+            if not rule_file or not rule_file.content:
                 return {"error": "无法获取文件内容"}
             
-            lines = content.split('\n')
-            rule_count = 0
-            comment_count = 0
-            
-            for line in lines:
-                line = line.strip()
-                if line:
-                    if line.startswith('#'):
-                        comment_count += 1
-                    elif line.startswith('DOMAIN-SUFFIX,'):
-                        rule_count += 1
-            
             return {
                 "file_path": file_path,
-                "total_lines": len(lines),
-                "rule_count": rule_count,
-                "comment_count": comment_count
+                "total_lines": rule_file.total_lines,
+                "rule_count": rule_file.rule_count,
+                "comment_count": rule_file.comment_count
             }
             
         except Exception as e:
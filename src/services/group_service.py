@@ -3,13 +3,18 @@
 检查用户是否加入指定群组
 """
 
-from typing import Optional
+import time
+from typing import Optional, Dict
 from loguru import logger
 from telegram import Bot
 from telegram.error import TelegramError
 
 from ..config import Config
 
+# 成员身份缓存有效期（秒）和条目上限
+MEMBERSHIP_CACHE_TTL = 300
+MEMBERSHIP_CACHE_SIZE = 10000
+
 
 class GroupService:
     """群组验证服务"""
@@ -18,6 +23,9 @@ class GroupService:
         self.config = config
         self.bot = bot
         self._group_check_enabled = bool(config.REQUIRED_GROUP_ID)
+        # 已确认成员身份的缓存 {user_id: 过期时间}，避免每次交互都请求Telegram API
+        # 只缓存"是成员"的结果，用户按提示加群后重试可立即生效
+        self._membership_cache: Dict[int, float] = {}
     
     def is_group_check_enabled(self) -> bool:
         """检查是否启用群组验证"""
@@ -28,6 +36,11 @@ class GroupService:
         if not self._group_check_enabled:
             return True  # 功能关闭时默认通过
         
+        now = time.monotonic()
+        expires = self._membership_cache.get(user_id)
+        if expires and expires > now:
+            return True
+        
         try:
             chat_member = await self.bot.get_chat_member(
                 chat_id=self.config.REQUIRED_GROUP_ID,
@@ -38,7 +51,9 @@ class GroupService:
             valid_statuses = ['member', 'administrator', 'creator']
             is_member = chat_member.status in valid_statuses
             
-            logger.debug(f"用户 {user_id} 群组状态: {chat_member.status}, 是否为成员: {is_member}")
+            logger.debug("用户 {} 群组状态: {}, 是否为成员: {}", user_id, chat_member.status, is_member)
+            if is_member:
+                self._cache_membership(user_id, now)
             return is_member
             
         except TelegramError as e:
@@ -46,6 +61,15 @@ class GroupService:
             # 如果检查失败，默认允许使用（避免因网络问题影响正常功能）
             return True
     
+    def _cache_membership(self, user_id: int, now: float):
+        """缓存已确认的成员身份"""
+        cache = self._membership_cache
+        cache.pop(user_id, None)
+        cache[user_id] = now + MEMBERSHIP_CACHE_TTL
+        # 超出上限时淘汰最早写入的条目
+        if len(cache) > MEMBERSHIP_CACHE_SIZE:
+            del cache[next(iter(cache))]
+    
     def get_join_group_message(self) -> str:
         """获取加入群组的提示消息"""
         if not self._group_check_enabled:
@@ -3,9 +3,16 @@
 """
 
 import re
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, Tuple
 from urllib.parse import urlparse
 
+# 纯字符串处理函数的结果缓存大小，热门域名会被不同用户反复查询
+DOMAIN_CACHE_SIZE = 4096
+
+# 域名格式正则，模块加载时编译一次（各标签长度有上限，不存在灾难性回溯）
+_DOMAIN_PATTERN = re.compile(r'^(?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}$')
+
 
 def extract_domain(url_or_domain: str) -> Optional[str]:
     """从URL或域名中提取域名"""
@@ -175,10 +182,7 @@ def is_valid_domain(domain: str) -> bool:
     if len(domain) > 253:
         return False
     
-    # 域名正则表达式
-    pattern = r'^(?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}$'
-    
-    return bool(re.match(pattern, domain))
+    return _DOMAIN_PATTERN.match(domain) is not None
 
 
 def get_domain_levels(domain: str) -> list:
@@ -197,6 +201,7 @@ def get_domain_levels(domain: str) -> list:
     return levels
 
 
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
 def extract_second_level_domain_for_rules(url_or_domain: str) -> Optional[str]:
     """专门用于规则添加的二级域名提取"""
     try:
@@ -224,6 +229,7 @@ def extract_second_level_domain_for_rules(url_or_domain: str) -> Optional[str]:
         return None
 
 
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
 def is_cn_domain(domain: str) -> bool:
     """检查是否为.cn域名"""
     try:
@@ -234,6 +240,7 @@ def is_cn_domain(domain: str) -> bool:
         return False
 
 
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
 def normalize_domain(domain: str) -> Optional[str]:
     """标准化域名"""
     extracted = extract_domain(domain)
@@ -243,6 +250,28 @@ def normalize_domain(domain: str) -> Optional[str]:
     return extracted.lower().strip()
 
 
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def parse_domain_input(url_or_domain: str) -> Tuple[Optional[str], bool, Optional[str]]:
+    """一次解析用户输入的域名
+    
+    Returns:
+        tuple: (标准化域名, 是否为.cn域名, 用于添加规则的二级域名)
+        结果与分别调用 normalize_domain、is_cn_domain、extract_second_level_domain_for_rules 一致
+    """
+    normalized = extract_domain(url_or_domain)
+    if not normalized:
+        return None, False, None
+    
+    if normalized.endswith('.cn'):
+        return normalized, True, None  # .cn域名不允许添加
+    
+    second_level = extract_second_level_domain(normalized)
+    if not second_level or second_level.endswith('.cn'):
+        return normalized, False, None
+    
+    return normalized, False, second_level
+
+
 def is_subdomain_of(subdomain: str, parent_domain: str) -> bool:
     """检查是否为子域名"""
     if not subdomain or not parent_domain:
@@ -0,0 +1,22 @@
+"""
+事件循环工具
+已安装 uvloop 时使用基于 libuv 的事件循环，否则回退到标准 asyncio
+"""
+
+import asyncio
+from typing import Any, Coroutine, TypeVar
+
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
+T = TypeVar("T")
+
+
+def run(main: Coroutine[Any, Any, T]) -> T:
+    """在新的事件循环中运行协程直到完成（替代 asyncio.run）"""
+    if UVLOOP_AVAILABLE:
+        return uvloop.run(main)
+    return asyncio.run(main)
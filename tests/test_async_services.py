@@ -5,12 +5,12 @@ import os
 import asyncio
 import base64
 
-# Add src to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+# Add project root to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from services.dns_service import DNSService
-from services.github_service import GitHubService
-from config import Config
+from src.services.dns_service import DNSService
+from src.services.github_service import GitHubService
+from src.config import Config
 
 class TestServices(unittest.IsolatedAsyncioTestCase):
     async def test_dns_service_lifecycle(self):
@@ -31,6 +31,7 @@ class TestServices(unittest.IsolatedAsyncioTestCase):
     async def test_github_service_async_wrapper(self):
         print("\nTesting GitHubService async wrapper...")
         config = MagicMock(spec=Config)
+        config.GITHUB_TOKEN = "token"
         service = GitHubService(config)
         service.repo = MagicMock()
         
@@ -50,7 +51,9 @@ class TestServices(unittest.IsolatedAsyncioTestCase):
     async def test_github_service_add_domain_wrapper(self):
         print("\nTesting GitHubService add_domain wrapper...")
         config = MagicMock(spec=Config)
+        config.GITHUB_TOKEN = "token"
         config.DIRECT_RULE_FILE = "rule.list"
+        config.PROXY_RULE_FILE = "proxy.list"
         config.GITHUB_REPO = "test/repo"
         config.GITHUB_COMMIT_NAME = "bot"
         config.GITHUB_COMMIT_EMAIL = "bot@test.com"
@@ -78,5 +81,95 @@ class TestServices(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result["commit_sha"], "new_sha")
         print("Async add_domain_to_rules executed successfully.")
 
+    def _make_add_service(self, update_file):
+        config = MagicMock(spec=Config)
+        config.GITHUB_TOKEN = "token"
+        config.DIRECT_RULE_FILE = "rule.list"
+        config.PROXY_RULE_FILE = "proxy.list"
+        config.GITHUB_REPO = "test/repo"
+        config.GITHUB_COMMIT_NAME = "bot"
+        config.GITHUB_COMMIT_EMAIL = "bot@test.com"
+
+        service = GitHubService(config)
+        service.repo = MagicMock()
+        mock_file = MagicMock()
+        mock_file.content = base64.b64encode("# initial\n".encode('utf-8')).decode('utf-8')
+        mock_file.sha = "old_sha"
+        service.repo.get_contents.return_value = mock_file
+        service.repo.update_file.side_effect = update_file
+        return service
+
+    @staticmethod
+    def _commit(sha):
+        mock_commit = MagicMock()
+        mock_commit.sha = sha
+        return {'commit': mock_commit}
+
+    async def test_github_service_concurrent_adds_share_commit(self):
+        service = self._make_add_service(lambda *args, **kwargs: self._commit("batch_sha"))
+
+        results = await asyncio.gather(
+            service.add_domain_to_rules("a.com", "u1", "note1"),
+            service.add_domain_to_rules("b.com", "u2", "secret"),
+        )
+
+        self.assertEqual(service.repo.update_file.call_count, 1)
+        _, message, content, _ = service.repo.update_file.call_args.args
+        self.assertIn("DOMAIN-SUFFIX,a.com", content)
+        self.assertIn("DOMAIN-SUFFIX,b.com", content)
+        self.assertIn("secret", message)
+        for result, domain, user in zip(results, ("a.com", "b.com"), ("u1", "u2")):
+            self.assertTrue(result["success"])
+            self.assertEqual(result["commit_sha"], "batch_sha")
+            # 每个请求只看到自己的域名和用户名
+            self.assertIn(domain, result["commit_message"])
+            self.assertIn(user, result["commit_message"])
+            self.assertNotIn("secret", result["commit_message"])
+        self.assertNotIn("u2", results[0]["commit_message"])
+
+    async def test_github_service_failed_batch_falls_back(self):
+        def update_file(file_path, message, content, sha, committer=None):
+            if "bad.com" in content:
+                raise RuntimeError("conflict")
+            return self._commit("single_sha")
+
+        service = self._make_add_service(update_file)
+
+        results = await asyncio.gather(
+            service.add_domain_to_rules("a.com", "u1"),
+            service.add_domain_to_rules("bad.com", "u2"),
+            service.add_domain_to_rules("c.com", "u3"),
+        )
+
+        # 一次合并提交失败后逐个提交
+        self.assertEqual(service.repo.update_file.call_count, 4)
+        self.assertEqual([result["success"] for result in results], [True, False, True])
+        self.assertIn("conflict", results[1]["error"])
+
+    async def test_github_service_duplicate_domains_share_result(self):
+        service = self._make_add_service(lambda *args, **kwargs: self._commit("dup_sha"))
+
+        results = await asyncio.gather(
+            service.add_domain_to_rules("example.com", "u1"),
+            service.add_domain_to_rules("Example.com", "u2"),
+        )
+
+        self.assertEqual(service.repo.update_file.call_count, 1)
+        content = service.repo.update_file.call_args.args[2]
+        self.assertEqual(content.lower().count("domain-suffix,example.com"), 1)
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual({result["commit_sha"] for result in results}, {"dup_sha"})
+        self.assertIn("u2", results[1]["commit_message"])
+        self.assertNotIn("u1", results[1]["commit_message"])
+
+    async def test_github_service_unexpected_error_is_reported(self):
+        service = self._make_add_service(lambda *args, **kwargs: self._commit("sha"))
+        service._commit_adds = AsyncMock(side_effect=AttributeError("PROXY_RULE_FILE"))
+
+        result = await service.add_domain_to_rules("a.com", "u1")
+
+        self.assertFalse(result["success"])
+        self.assertIn("PROXY_RULE_FILE", result["error"])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import sys
+import os
+from collections import OrderedDict
+
+# Add project root to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.data_manager import DataManager
+
+
+class TestGeoSiteLookup(unittest.TestCase):
+    def _make_manager(self, domains):
+        manager = DataManager.__new__(DataManager)
+        manager._suffix_trie = DataManager._build_suffix_trie(domains)
+        manager.geosite_count = len(domains)
+        manager._lookup_cache = OrderedDict()
+        return manager
+
+    def test_exact_and_parent_match(self):
+        manager = self._make_manager({"example.com", "x.y.org"})
+        self.assertTrue(manager.is_domain_in_geosite("example.com"))
+        self.assertTrue(manager.is_domain_in_geosite("sub.example.com"))
+        self.assertTrue(manager.is_domain_in_geosite(" WWW.Example.COM "))
+        self.assertTrue(manager.is_domain_in_geosite("a.x.y.org"))
+
+    def test_no_reverse_match(self):
+        manager = self._make_manager({"x.y.org"})
+        # 只匹配自身及子域名，不匹配父域名
+        self.assertFalse(manager.is_domain_in_geosite("y.org"))
+        self.assertFalse(manager.is_domain_in_geosite("org"))
+        self.assertFalse(manager.is_domain_in_geosite("example.com"))
+
+    def test_parent_entry_covers_children(self):
+        trie = DataManager._build_suffix_trie(["a.example.com", "example.com"])
+        self.assertEqual(trie, {"com": {"example": True}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import struct
+import sys
+import os
+
+# Add project root to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.services.dns_service import DNSService
+
+
+def _name(domain):
+    return b''.join(bytes((len(label),)) + label.encode() for label in domain.split('.')) + b'\x00'
+
+
+def _rr(name, rr_type, rdata):
+    return name + struct.pack('!HHIH', rr_type, 1, 60, len(rdata)) + rdata
+
+
+def _response(question, *answers):
+    return struct.pack('!HHHHHH', 0, 0x8180, 1, len(answers), 0, 0) + question + b''.join(answers)
+
+
+class TestDNSResponseParser(unittest.TestCase):
+    def setUp(self):
+        self.service = DNSService({})
+
+    def test_a_records_after_cname(self):
+        question = _name("www.example.com") + struct.pack('!HH', 1, 1)
+        # CNAME 目标及其 A 记录名称为 "cdn" + 指向 example.com 的压缩指针
+        data = _response(
+            question,
+            _rr(b'\xc0\x0c', 5, b'\x03cdn\xc0\x10'),
+            _rr(b'\x03cdn\xc0\x10', 1, bytes([9, 9, 9, 9])),
+        )
+        self.assertEqual(self.service._parse_dns_response_a(data), ["9.9.9.9"])
+
+    def test_ns_records(self):
+        question = _name("example.com") + struct.pack('!HH', 2, 1)
+        data = _response(
+            question,
+            _rr(b'\xc0\x0c', 2, b'\x03ns1\xc0\x0c'),
+            _rr(b'\xc0\x0c', 2, _name("ns2.other.net")),
+        )
+        self.assertEqual(self.service._parse_dns_response_ns(data), ["ns1.example.com", "ns2.other.net"])
+
+    def test_pointer_cycle_terminates(self):
+        # "abc" 之后的指针跳回该标签本身，构成循环
+        data = bytes(20) + b'\x03abc\xc0\x14'
+        self.assertEqual(self.service._parse_domain_name(data, 20), "abc")
+
+    def test_self_pointer_terminates(self):
+        data = bytes(20) + b'\xc0\x14'
+        self.assertEqual(self.service._parse_domain_name(data, 20), "")
+
+    def test_truncated_response(self):
+        self.assertEqual(self.service._parse_dns_response_a(b'\x00' * 5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
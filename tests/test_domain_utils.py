@@ -0,0 +1,33 @@
+import unittest
+import sys
+import os
+
+# Add project root to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.domain_utils import (
+    parse_domain_input, normalize_domain, is_cn_domain, extract_second_level_domain_for_rules
+)
+
+
+class TestParseDomainInput(unittest.TestCase):
+    def test_matches_separate_helpers(self):
+        inputs = [
+            "https://www.Example.com/path", "sub.example.com:8080", "a.b.co.uk",
+            "x.com.cn", "foo.cn", "invalid", "",
+        ]
+        for raw in inputs:
+            normalized = normalize_domain(raw)
+            expected = (
+                normalized,
+                bool(normalized) and is_cn_domain(normalized),
+                extract_second_level_domain_for_rules(raw),
+            )
+            self.assertEqual(parse_domain_input(raw), expected, raw)
+
+    def test_cn_domain_has_no_rule_domain(self):
+        self.assertEqual(parse_domain_input("www.example.com.cn"), ("example.com.cn", True, None))
+
+
+if __name__ == '__main__':
+    unittest.main()